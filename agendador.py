@@ -0,0 +1,324 @@
+# agendador.py
+# Modo daemon (sem interface): atualiza os preços periodicamente, priorizando os jogos mais "quentes".
+#
+#   python agendador.py              # roda até Ctrl+C / SIGTERM
+#   python agendador.py --uma-vez    # atualiza o que estiver vencido e sai (bom para cron)
+#
+# Cada jogo monitorado tem a sua próxima atualização calculada a partir da última consulta:
+#   - o intervalo padrão cai pela metade se o preço variou nos últimos dias ou se o jogo tem alertas,
+#     e dobra se o preço ficou parado;
+#   - uma oferta com validade (validade_oferta) antecipa a atualização para logo depois de expirar;
+#   - nunca antes de INTERVALO_MINIMO nem depois de INTERVALO_MAXIMO.
+# Um orçamento global de requisições por hora limita quantos jogos vencidos entram em cada rodada;
+# os mais atrasados vão primeiro e o resto espera o orçamento liberar. O custo de cada jogo é estimado
+# pelos ids da última busca dele no catálogo, com folga para as novas tentativas; durante a rodada
+# cada requisição real (inclusive as novas tentativas) é cobrada do orçamento, e a rodada para se ele
+# acabar antes do previsto.
+#
+# Métricas (ver metricas.py): --metricas-porta serve /metrics para o Prometheus, --metricas-arquivo
+# grava o mesmo texto a cada rodada, --resumos acrescenta o resumo de cada atualização em JSONL e
+# --perfil (ou FINDER_PERFIL) grava um cProfile da última rodada.
+
+import argparse
+import json
+import math
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import api_itad
+import backend
+import banco
+import historico
+import alertas
+import metricas
+
+# --- CONFIGURAÇÃO ---
+INTERVALO_PADRAO = 6 * 3600          # Segundos entre atualizações de um jogo "normal"
+INTERVALO_MINIMO = 30 * 60
+INTERVALO_MAXIMO = 24 * 3600
+MARGEM_APOS_VALIDADE = 5 * 60        # Atualiza um pouco depois da oferta expirar
+DIAS_VARIACAO = 7                    # Janela usada para decidir se o preço do jogo está "mexendo"
+ORCAMENTO_REQUISICOES_POR_HORA = 500 # Teto de chamadas à API por hora (buscas + lotes de preços)
+FOLGA_RETENTATIVAS = 0.2             # Fração a mais reservada para novas tentativas (429/5xx) na estimativa
+IDS_SEM_CATALOGO = 50                # Ids estimados para um jogo nunca buscado (máximo da busca na API)
+ESPERA_MAXIMA_OCIOSA = 300           # Reavalia a agenda pelo menos a cada 5 minutos
+PAIS = "BR"                          # País principal; outros vêm de "PAISES" no config.json
+# --- FIM DA CONFIGURAÇÃO ---
+
+# Uma linha por jogo monitorado; os números vêm das tabelas de consultas, estado atual e estatísticas
+SQL_SITUACAO_JOGOS = """
+    SELECT j.id, j.nome, u.ultima,
+           (SELECT json_array_length(cb.resultado) FROM catalogo_busca cb WHERE cb.id_jogo_monitorado = j.id),
+           (SELECT MIN(e.validade_oferta) FROM estado_atual_precos e
+             WHERE e.id_jogo_monitorado = j.id AND e.visto_ate = u.ultima AND e.validade_oferta > u.ultima),
+           EXISTS (SELECT 1 FROM regras_alerta r WHERE r.id_jogo_monitorado = j.id AND r.ativa = 1),
+           (SELECT MAX(1.0 * soma_centavos / observacoes) - MIN(1.0 * soma_centavos / observacoes)
+              FROM precos_diarios_jogos d WHERE d.id_jogo_monitorado = j.id AND d.dia >= ?),
+           EXISTS (SELECT 1 FROM catalogo_busca cb WHERE cb.id_jogo_monitorado = j.id AND cb.expira_em > ?)
+    FROM jogos_monitorados j
+    LEFT JOIN (SELECT id_jogo_monitorado, MAX(data_consulta) AS ultima FROM consultas GROUP BY id_jogo_monitorado) u
+           ON u.id_jogo_monitorado = j.id
+    WHERE j.monitorado = 1
+"""
+
+
+class SituacaoJogo:
+    """O que o agendador sabe de um jogo monitorado para decidir quando atualizá-lo."""
+
+    def __init__(self, id_jogo, nome, ultima_consulta, ids_catalogo, proxima_validade, tem_alertas, variacao, no_catalogo=False):
+        self.id_jogo = id_jogo
+        self.nome = nome
+        self.ultima_consulta = ultima_consulta
+        # Ids a que a última busca do jogo se expandiu (mesmo vencida, é a melhor estimativa); None se nunca buscado
+        self.ids_catalogo = ids_catalogo
+        self.proxima_validade = proxima_validade
+        self.tem_alertas = bool(tem_alertas)
+        self.variacao = variacao  # Centavos entre o maior e o menor preço médio diário; None sem dados
+        self.no_catalogo = bool(no_catalogo)  # Busca ainda válida no catálogo local: não gasta requisição de busca
+        self.proxima_atualizacao = self._calcular_proxima()
+
+    def intervalo(self):
+        intervalo = INTERVALO_PADRAO
+        if self.variacao:
+            intervalo /= 2
+        elif self.variacao == 0:
+            intervalo *= 2
+        if self.tem_alertas:
+            intervalo /= 2
+        return min(INTERVALO_MAXIMO, max(INTERVALO_MINIMO, intervalo))
+
+    def _calcular_proxima(self):
+        if self.ultima_consulta is None:
+            return 0  # Nunca consultado: entra na próxima rodada
+        proxima = self.ultima_consulta + self.intervalo()
+        if self.proxima_validade is not None:
+            proxima = min(proxima, self.proxima_validade + MARGEM_APOS_VALIDADE)
+        return max(proxima, self.ultima_consulta + INTERVALO_MINIMO)
+
+
+class OrcamentoPorHora:
+    """Janela deslizante de uma hora com as requisições já gastas."""
+
+    def __init__(self, limite=ORCAMENTO_REQUISICOES_POR_HORA):
+        self.limite = limite
+        self._gastos = deque()  # (instante, quantidade)
+        self._lock = threading.RLock()  # consumir() é chamada pelas threads de trabalho da atualização
+
+    def _descartar_antigos(self, agora):
+        while self._gastos and self._gastos[0][0] <= agora - 3600:
+            self._gastos.popleft()
+
+    def disponivel(self, agora=None):
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            self._descartar_antigos(agora)
+            return self.limite - sum(quantidade for _, quantidade in self._gastos)
+
+    def registrar(self, quantidade, agora=None):
+        if quantidade > 0:
+            with self._lock:
+                self._gastos.append((time.time() if agora is None else agora, quantidade))
+
+    def consumir(self, agora=None):
+        """Cobra uma requisição se ainda houver saldo; retorna False quando o orçamento acabou."""
+        with self._lock:
+            if self.disponivel(agora) < 1:
+                return False
+            self.registrar(1, agora)
+            return True
+
+    def liberado_em(self, necessario, agora=None):
+        """Instante em que pelo menos `necessario` requisições estarão disponíveis."""
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            falta = necessario - self.disponivel(agora)
+            if falta <= 0:
+                return agora
+            for instante, quantidade in self._gastos:
+                falta -= quantidade
+                if falta <= 0:
+                    return instante + 3600
+        return agora + 3600
+
+
+def custo_estimado(situacoes, paises=1):
+    """Requisições previstas para uma rodada, com FOLGA_RETENTATIVAS para as novas tentativas.
+
+    Uma busca por jogo fora do catálogo mais, em cada país, os lotes de preços de todos os ids a que
+    os jogos se expandem (os da última busca de cada um; IDS_SEM_CATALOGO se nunca foi buscado).
+    """
+    ids = sum(IDS_SEM_CATALOGO if situacao.ids_catalogo is None else situacao.ids_catalogo for situacao in situacoes)
+    buscas = sum(1 for situacao in situacoes if not situacao.no_catalogo)
+    requisicoes = buscas + paises * math.ceil(ids / api_itad.TAMANHO_MAXIMO_LOTE_PRECOS)
+    return math.ceil(requisicoes * (1 + FOLGA_RETENTATIVAS))
+
+
+def carregar_situacao(agora=None, tentativas=None):
+    """Situação de cada jogo monitorado.
+
+    `tentativas` (id do jogo -> epoch) guarda as rodadas sem consulta gravada (busca vazia ou com
+    erro), para esses jogos não voltarem para o começo da fila a cada rodada.
+    """
+    agora = int(time.time() if agora is None else agora)
+    desde = agora // historico.SEGUNDOS_POR_DIA - DIAS_VARIACAO + 1
+    tentativas = tentativas or {}
+    conn = banco.conectar(backend.DB_FILE)
+    situacoes = []
+    for id_jogo, nome, ultima, *resto in conn.execute(SQL_SITUACAO_JOGOS, (desde, agora)):
+        if id_jogo in tentativas:
+            ultima = max(ultima or 0, tentativas[id_jogo])
+        situacoes.append(SituacaoJogo(id_jogo, nome, ultima, *resto))
+    return situacoes
+
+
+def planejar(situacoes, orcamento, agora=None, paises=1):
+    """Escolhe os jogos vencidos que cabem no orçamento (mais atrasados primeiro).
+
+    Retorna (jogos escolhidos, instante da próxima decisão).
+    """
+    agora = time.time() if agora is None else agora
+    vencidos = sorted((s for s in situacoes if s.proxima_atualizacao <= agora), key=lambda s: s.proxima_atualizacao)
+    escolhidos = []
+    for situacao in vencidos:
+        if custo_estimado(escolhidos + [situacao], paises) > orcamento.disponivel(agora):
+            break
+        escolhidos.append(situacao)
+
+    if vencidos and not escolhidos:
+        # Nem o mais atrasado cabe: espera o orçamento liberar
+        proxima = orcamento.liberado_em(custo_estimado(vencidos[:1], paises), agora)
+    elif len(escolhidos) < len(vencidos):
+        proxima = agora  # Sobrou gente vencida: nova rodada logo depois desta
+    else:
+        futuras = [s.proxima_atualizacao for s in situacoes if s.proxima_atualizacao > agora]
+        proxima = min(futuras) if futuras else agora + ESPERA_MAXIMA_OCIOSA
+    return escolhidos, proxima
+
+
+def registrar_log(mensagem):
+    for linha in mensagem.strip("\n").splitlines():
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {linha}", flush=True)
+
+
+def executar(API_KEY, pais=PAIS, orcamento=None, parar=None, uma_vez=False, max_simultaneos=backend.MAX_REQUISICOES_SIMULTANEAS,
+             modo_armazenamento=None, saidas_alerta=None, dias_catalogo=backend.DIAS_CATALOGO,
+             arquivo_metricas=None, arquivo_resumos=None, perfil=None, outros_paises=()):
+    """Laço do daemon. Termina quando `parar` (threading.Event) é acionado, ou após uma rodada com `uma_vez`.
+
+    Uma atualização em andamento sempre termina (e grava) antes de o laço conferir `parar`. Cada
+    requisição feita durante a rodada é cobrada do `orcamento` (api_itad.configurar_cota); se ele
+    acabar, as requisições seguintes não são enviadas e a atualização é cancelada no próximo passo.
+    """
+    def guardar_resumo(resumo):
+        if arquivo_resumos:
+            with open(arquivo_resumos, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'data': datetime.now().isoformat(timespec='seconds'), **resumo}, ensure_ascii=False) + "\n")
+
+    orcamento = orcamento or OrcamentoPorHora()
+    parar = parar or threading.Event()
+    tentativas = {}
+    esgotado = threading.Event()
+    def consumir():
+        if orcamento.consumir():
+            return True
+        esgotado.set()
+        return False
+    # A cota fica ligada o tempo todo: novas tentativas ainda em andamento depois de uma rodada cancelada também pagam
+    api_itad.configurar_cota(consumir)
+    try:
+        while not parar.is_set():
+            agora = time.time()
+            escolhidos, proxima = planejar(carregar_situacao(agora, tentativas), orcamento, agora,
+                                           len(set([pais, *outros_paises])))
+            if escolhidos:
+                registrar_log(f"Atualizando {len(escolhidos)} jogo(s) vencido(s) "
+                              f"(orçamento disponível: {orcamento.disponivel(agora)} requisições/hora).")
+                esgotado.clear()
+                try:
+                    with metricas.perfilar(perfil):
+                        for status in backend.buscar_e_salvar_precos(API_KEY, pais, max_simultaneos, modo_armazenamento,
+                                                                     saidas_alerta, ids_jogos=[s.id_jogo for s in escolhidos],
+                                                                     cancelar=esgotado, dias_catalogo=dias_catalogo,
+                                                                     resumo=guardar_resumo, outros_paises=outros_paises):
+                            registrar_log(status)
+                except Exception as e:
+                    registrar_log(f"ERRO na atualização: {e}")
+                if arquivo_metricas:
+                    try:
+                        metricas.gravar_prometheus(arquivo_metricas)
+                    except OSError as e:
+                        registrar_log(f"ERRO ao gravar as métricas: {e}")
+                if esgotado.is_set():
+                    # Quem ficou sem consulta não foi tentado de verdade: continua no começo da fila
+                    registrar_log("Orçamento de requisições por hora esgotado; o restante fica para a próxima rodada.")
+                else:
+                    tentativas.update((s.id_jogo, int(agora)) for s in escolhidos)
+            if uma_vez:
+                break
+            if escolhidos and proxima <= time.time():
+                continue
+            espera = min(max(proxima - time.time(), 1), ESPERA_MAXIMA_OCIOSA)
+            if not escolhidos:
+                registrar_log(f"Nada vencido. Próxima verificação em {int(espera)}s.")
+            parar.wait(espera)
+    finally:
+        # Só uma rodada cortada pelo orçamento deixa requisições em andamento; as novas tentativas delas não saem
+        api_itad.configurar_cota((lambda: False) if esgotado.is_set() else None)
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Atualiza os preços periodicamente, sem interface gráfica.",
+                                     epilog="Alertas com \"NOTIFICACAO_DESKTOP\" no config.json requerem o pacote "
+                                            "plyer (requirements-opcionais.txt).")
+    parser.add_argument('--uma-vez', action='store_true', help="atualiza os jogos vencidos e sai")
+    parser.add_argument('--orcamento', type=int, help="requisições à API por hora (padrão: config.json ou 500)")
+    parser.add_argument('--metricas-porta', type=int, help="serve as métricas (Prometheus) em http://127.0.0.1:PORTA/metrics")
+    parser.add_argument('--metricas-arquivo', help="grava as métricas (Prometheus) neste arquivo a cada rodada")
+    parser.add_argument('--resumos', help="acrescenta o resumo de cada atualização (JSONL) neste arquivo")
+    parser.add_argument('--perfil', help="grava um cProfile de cada rodada neste arquivo (.prof)")
+    return parser.parse_args()
+
+# --- BLOCO PRINCIPAL ---
+if __name__ == "__main__":
+    args = _argumentos()
+    backend.setup_database()
+    try:
+        with open('config.json', 'r') as f: config = json.load(f)
+    except Exception as e:
+        print(f"ERRO ao carregar 'config.json': {e}")
+        config = {}
+    API_KEY = config.get('API_KEY')
+
+    if not API_KEY or "sua_chave" in API_KEY:
+        print("!!! ATENÇÃO: Configure sua chave da API no arquivo config.json.")
+    else:
+        max_simultaneos = config.get('MAX_REQUISICOES_SIMULTANEAS', backend.MAX_REQUISICOES_SIMULTANEAS)
+        api_itad.configurar_limite(config.get('REQUISICOES_POR_SEGUNDO', api_itad.REQUISICOES_POR_SEGUNDO))
+        api_itad.configurar_sessao(tamanho_pool=max(max_simultaneos, api_itad.TAMANHO_POOL_CONEXOES),
+                                   timeout_conexao=config.get('TIMEOUT_CONEXAO', api_itad.TIMEOUT_CONEXAO),
+                                   timeout_leitura=config.get('TIMEOUT_LEITURA', api_itad.TIMEOUT_LEITURA))
+        orcamento = OrcamentoPorHora(args.orcamento or config.get('ORCAMENTO_REQUISICOES_POR_HORA', ORCAMENTO_REQUISICOES_POR_HORA))
+
+        parar = threading.Event()
+        def _encerrar(sinal, quadro):
+            registrar_log("Encerrando depois da rodada atual...")
+            parar.set()
+        signal.signal(signal.SIGINT, _encerrar)
+        signal.signal(signal.SIGTERM, _encerrar)
+
+        porta_metricas = args.metricas_porta or config.get('METRICAS_PORTA')
+        if porta_metricas:
+            metricas.servir_prometheus(porta_metricas)
+            registrar_log(f"Métricas em http://127.0.0.1:{porta_metricas}/metrics")
+
+        registrar_log(f"Agendador iniciado (orçamento: {orcamento.limite} requisições/hora).")
+        paises = config.get('PAISES') or [PAIS]
+        executar(API_KEY, paises[0], orcamento, parar, args.uma_vez, max_simultaneos,
+                 config.get('MODO_ARMAZENAMENTO', historico.MODO_ARMAZENAMENTO),
+                 alertas.criar_saidas(config.get('ALERTAS')), config.get('DIAS_CATALOGO', backend.DIAS_CATALOGO),
+                 args.metricas_arquivo or config.get('METRICAS_ARQUIVO'),
+                 args.resumos or config.get('RESUMOS_ATUALIZACAO'),
+                 args.perfil or metricas.caminho_do_perfil(config), paises[1:])
+        banco.fechar_todas()
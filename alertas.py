@@ -0,0 +1,247 @@
+# alertas.py
+# Regras de alerta de preço (por jogo monitorado) avaliadas durante a atualização dos preços.
+#
+# Tipos de regra (tabela regras_alerta, migracoes v5):
+#   'preco_alvo'      - preço <= valor (em centavos)
+#   'abaixo_da_media' - preço pelo menos `valor`% abaixo da média dos últimos DIAS_MEDIA dias
+#   'menor_historico' - preço menor que o menor preço histórico do item
+#
+# As referências (menor preço e média de cada item) são lidas das tabelas de estatísticas uma única
+# vez, antes de gravar a atualização; depois disso cada oferta é só uma consulta a um dict.
+
+import json
+import time
+from datetime import datetime
+
+import requests
+
+import historico
+
+# --- CONFIGURAÇÃO ---
+DIAS_MEDIA = 90           # Janela da média usada pelas regras 'abaixo_da_media'
+TIMEOUT_WEBHOOK = 5       # Segundos esperando o webhook responder
+# --- FIM DA CONFIGURAÇÃO ---
+
+PRECO_ALVO = 'preco_alvo'
+ABAIXO_DA_MEDIA = 'abaixo_da_media'
+MENOR_HISTORICO = 'menor_historico'
+TIPOS = (PRECO_ALVO, ABAIXO_DA_MEDIA, MENOR_HISTORICO)
+
+_TAMANHO_LOTE_IN = 500
+
+
+class Alerta:
+    """Uma oferta que satisfez uma regra."""
+
+    def __init__(self, id_regra, tipo, nome_jogo, oferta, referencia_centavos):
+        self.id_regra = id_regra
+        self.tipo = tipo
+        self.nome_jogo = nome_jogo
+        self.oferta = oferta
+        self.referencia_centavos = referencia_centavos  # Alvo, média ou menor preço anterior
+        self.data = int(time.time())
+
+    def mensagem(self):
+        oferta = self.oferta
+        preco = f"R${oferta['preco_centavos'] / 100:.2f}"
+        referencia = f"R${self.referencia_centavos / 100:.2f}"
+        if self.tipo == PRECO_ALVO:
+            motivo = f"abaixo do preço alvo de {referencia}"
+        elif self.tipo == ABAIXO_DA_MEDIA:
+            motivo = f"abaixo da média de {DIAS_MEDIA} dias ({referencia})"
+        else:
+            motivo = f"novo menor preço histórico (antes: {referencia})"
+        return f"🔔 ALERTA '{self.nome_jogo}': {oferta['nome_item']} por {preco} na {oferta['loja']} - {motivo}"
+
+    def como_dict(self):
+        return {
+            'data': datetime.fromtimestamp(self.data).isoformat(timespec='seconds'),
+            'regra': self.id_regra,
+            'tipo': self.tipo,
+            'jogo': self.nome_jogo,
+            'item': self.oferta['nome_item'],
+            'preco': self.oferta['preco_centavos'] / 100,
+            'referencia': self.referencia_centavos / 100,
+            'loja': self.oferta['loja'],
+            'link': self.oferta['link'],
+        }
+
+
+# --- SAÍDAS (para onde os alertas vão) ---
+# Qualquer objeto com um método enviar(alertas) serve; os alertas chegam juntos, no fim da atualização.
+
+class SaidaLog:
+    """Escreve a mensagem de cada alerta (por padrão com print, que na GUI vai para o log)."""
+
+    def __init__(self, escrever=print):
+        self.escrever = escrever
+
+    def enviar(self, alertas):
+        for alerta in alertas:
+            self.escrever(alerta.mensagem())
+
+
+class SaidaArquivo:
+    """Acrescenta cada alerta como uma linha JSON em um arquivo local."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def enviar(self, alertas):
+        with open(self.caminho, 'a', encoding='utf-8') as f:
+            for alerta in alertas:
+                f.write(json.dumps(alerta.como_dict(), ensure_ascii=False) + "\n")
+
+
+class SaidaWebhook:
+    """Envia os alertas em um único POST JSON para `url` (ex.: um webhook do Discord/Slack via proxy)."""
+
+    def __init__(self, url, timeout=TIMEOUT_WEBHOOK):
+        self.url = url
+        self.timeout = timeout
+
+    def enviar(self, alertas):
+        resposta = requests.post(self.url, json={'alertas': [alerta.como_dict() for alerta in alertas]},
+                                 timeout=self.timeout)
+        resposta.raise_for_status()
+
+
+class SaidaNotificacaoDesktop:
+    """Notificação do sistema operacional, via o pacote opcional 'plyer'."""
+
+    def __init__(self):
+        try:
+            from plyer import notification
+        except ImportError:
+            raise RuntimeError("Notificações na área de trabalho requerem o pacote 'plyer' (pip install plyer).")
+        self._notificacao = notification
+
+    def enviar(self, alertas):
+        for alerta in alertas:
+            self._notificacao.notify(title=f"Promoção: {alerta.nome_jogo}", message=alerta.mensagem(), timeout=10)
+
+
+def criar_saidas(config):
+    """Monta as saídas a partir do bloco "ALERTAS" do config.json (o log fica por conta de quem chama).
+
+    Exemplo: {"ARQUIVO": "alertas.jsonl", "WEBHOOK": "http://...", "NOTIFICACAO_DESKTOP": true}
+    """
+    config = config or {}
+    saidas = []
+    if config.get('ARQUIVO'):
+        saidas.append(SaidaArquivo(config['ARQUIVO']))
+    if config.get('WEBHOOK'):
+        saidas.append(SaidaWebhook(config['WEBHOOK']))
+    if config.get('NOTIFICACAO_DESKTOP'):
+        saidas.append(SaidaNotificacaoDesktop())
+    return saidas
+
+
+# --- MOTOR ---
+
+class MotorDeAlertas:
+    """Avalia as ofertas de uma atualização contra as regras dos jogos monitorados.
+
+    Uso: `carregar()` uma vez antes de gravar qualquer oferta da atualização (as referências
+    precisam ser as de antes dela), `avaliar()` para cada jogo e `registrar()` no final.
+    """
+
+    def __init__(self, conn, agora=None):
+        self.conn = conn
+        self.agora = int(agora if agora is not None else time.time())
+        self._regras = {}        # id_jogo -> [(id_regra, tipo, valor)]
+        self._referencias = {}   # (id_jogo, id_itad) -> (menor_preco_centavos, media_centavos)
+        self._disparados = {}    # (id_regra, id_itad) -> preço do último alerta
+        self._alteracoes = {}    # (id_regra, id_itad) -> preço novo, ou None para apagar
+
+    def carregar(self, ids_jogos=None):
+        """Lê as regras ativas e as referências dos itens dos jogos que têm regras."""
+        conn = self.conn
+        sql = "SELECT id, id_jogo_monitorado, tipo, valor FROM regras_alerta WHERE ativa = 1"
+        for id_regra, id_jogo, tipo, valor in conn.execute(sql):
+            if ids_jogos is None or id_jogo in ids_jogos:
+                self._regras.setdefault(id_jogo, []).append((id_regra, tipo, valor))
+        if not self._regras:
+            return self
+
+        desde = self.agora // historico.SEGUNDOS_POR_DIA - DIAS_MEDIA + 1
+        ids_com_regras = list(self._regras)
+        ids_regras = [regra[0] for regras in self._regras.values() for regra in regras]
+        for i in range(0, len(ids_com_regras), _TAMANHO_LOTE_IN):
+            lote = ids_com_regras[i:i + _TAMANHO_LOTE_IN]
+            marcadores = ", ".join("?" * len(lote))
+            for id_jogo, id_itad, menor, media in conn.execute(f'''
+                    SELECT e.id_jogo_monitorado, i.itad_id, e.menor_preco_centavos,
+                           (SELECT 1.0 * SUM(soma_centavos) / SUM(observacoes) FROM precos_diarios_itens d
+                             WHERE d.id_jogo_monitorado = e.id_jogo_monitorado AND d.id_item = e.id_item AND d.dia >= ?)
+                    FROM estatisticas_itens e JOIN itens i ON i.id = e.id_item
+                    WHERE e.id_jogo_monitorado IN ({marcadores})''', [desde] + lote):
+                self._referencias[id_jogo, id_itad] = (menor, media)
+        for i in range(0, len(ids_regras), _TAMANHO_LOTE_IN):
+            lote = ids_regras[i:i + _TAMANHO_LOTE_IN]
+            marcadores = ", ".join("?" * len(lote))
+            for id_regra, id_itad, preco in conn.execute(
+                    f"SELECT id_regra, id_itad, preco_centavos FROM alertas_disparados WHERE id_regra IN ({marcadores})", lote):
+                self._disparados[id_regra, id_itad] = preco
+        return self
+
+    def avaliar(self, id_jogo, nome_jogo, ofertas):
+        """Retorna os alertas disparados pelas ofertas (dicts do historico) de um jogo."""
+        regras = self._regras.get(id_jogo)
+        if not regras:
+            return []
+        alertas = []
+        for oferta in ofertas:
+            preco = oferta['preco_centavos']
+            menor, media = self._referencias.get((id_jogo, oferta['id_itad']), (None, None))
+            for id_regra, tipo, valor in regras:
+                if tipo == PRECO_ALVO:
+                    referencia = valor
+                    satisfeita = valor is not None and preco <= valor
+                elif tipo == ABAIXO_DA_MEDIA:
+                    referencia = media
+                    satisfeita = media is not None and preco <= media * (100 - (valor or 0)) / 100
+                else:
+                    # Item sem histórico ainda não tem "menor preço" para ser batido
+                    referencia = menor
+                    satisfeita = menor is not None and preco < menor
+
+                chave = (id_regra, oferta['id_itad'])
+                if not satisfeita:
+                    # Condição deixou de valer: o próximo preço que a satisfizer alerta de novo
+                    if chave in self._disparados:
+                        del self._disparados[chave]
+                        self._alteracoes[chave] = None
+                    continue
+                if self._disparados.get(chave) == preco:
+                    continue  # Já avisado por este mesmo preço
+                self._disparados[chave] = preco
+                self._alteracoes[chave] = preco
+                alertas.append(Alerta(id_regra, tipo, nome_jogo, oferta, round(referencia)))
+        return alertas
+
+    def registrar(self):
+        """Grava quais alertas já foram disparados (e quais podem disparar de novo)."""
+        if not self._alteracoes:
+            return
+        alteracoes, self._alteracoes = self._alteracoes, {}
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO alertas_disparados (id_regra, id_itad, preco_centavos, data_alerta) VALUES (?, ?, ?, ?)",
+                [(id_regra, id_itad, preco, self.agora) for (id_regra, id_itad), preco in alteracoes.items() if preco is not None])
+            self.conn.executemany(
+                "DELETE FROM alertas_disparados WHERE id_regra = ? AND id_itad = ?",
+                [chave for chave, preco in alteracoes.items() if preco is None])
+
+
+def enviar(alertas, saidas):
+    """Entrega os alertas a cada saída; retorna a lista de (saída, erro) das que falharam."""
+    falhas = []
+    if not alertas:
+        return falhas
+    for saida in saidas:
+        try:
+            saida.enviar(alertas)
+        except Exception as e:
+            falhas.append((saida, e))
+    return falhas
@@ -0,0 +1,229 @@
+# api_itad.py
+# Camada única de acesso à API do IsThereAnyDeal, compartilhada pelo backend e pelos scripts.
+
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metricas
+
+# --- CONFIGURAÇÃO ---
+URL_BASE = "https://api.isthereanydeal.com"
+REQUISICOES_POR_SEGUNDO = 4    # Ritmo sustentado permitido pelo limitador
+RAJADA_MAXIMA = 4              # Quantas requisições podem sair de uma vez com o balde cheio
+MAX_TENTATIVAS = 5             # Tentativas por requisição antes de desistir (429/5xx)
+ESPERA_INICIAL_RETRY = 1.0     # Segundos de espera na 1ª nova tentativa (dobra a cada falha)
+ESPERA_MAXIMA_RETRY = 60.0
+STATUS_PARA_RETENTAR = {429, 500, 502, 503, 504}
+TAMANHO_MAXIMO_LOTE_PRECOS = 200  # Máximo de ids aceitos pelo games/prices/v3 em um único POST
+TAMANHO_POOL_CONEXOES = 10     # Conexões keep-alive mantidas abertas com a API
+TIMEOUT_CONEXAO = 5            # Segundos para abrir a conexão (TCP + TLS)
+TIMEOUT_LEITURA = 30           # Segundos esperando a resposta antes de desistir
+# --- FIM DA CONFIGURAÇÃO ---
+
+
+class LimitadorDeTaxa:
+    """Balde de fichas (token bucket) seguro para várias threads.
+
+    Cada requisição consome uma ficha; as fichas são repostas a `taxa` por segundo
+    até o limite de `capacidade`. Um 429 pode `pausar` o balde inteiro, fazendo
+    todas as threads respeitarem o Retry-After informado pela API.
+    """
+
+    def __init__(self, taxa, capacidade=None):
+        self._lock = threading.Lock()
+        self.total_adquiridas = 0  # Fichas consumidas desde o início (inclui as novas tentativas)
+        self.configurar(taxa, capacidade)
+
+    def configurar(self, taxa, capacidade=None):
+        with self._lock:
+            self.taxa = float(taxa)
+            self.capacidade = float(capacidade or max(1, taxa))
+            self._fichas = self.capacidade
+            self._ultima_reposicao = time.monotonic()
+            self._pausado_ate = 0.0
+
+    def pausar(self, segundos):
+        """Impede novas requisições (em todas as threads) pelos próximos `segundos`."""
+        with self._lock:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+            self._fichas = 0.0
+
+    def adquirir(self):
+        """Bloqueia até haver uma ficha disponível e a consome."""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                if agora < self._pausado_ate:
+                    espera = self._pausado_ate - agora
+                else:
+                    decorrido = agora - max(self._ultima_reposicao, self._pausado_ate)
+                    self._fichas = min(self.capacidade, self._fichas + decorrido * self.taxa)
+                    self._ultima_reposicao = agora
+                    if self._fichas >= 1:
+                        self._fichas -= 1
+                        self.total_adquiridas += 1
+                        return
+                    espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+
+limitador = LimitadorDeTaxa(REQUISICOES_POR_SEGUNDO, RAJADA_MAXIMA)
+
+
+class CotaEsgotada(requests.exceptions.RequestException):
+    """A cota configurada em `configurar_cota` acabou; a requisição nem chegou a ser enviada."""
+
+
+_cota = None  # Função consultada antes de cada requisição (ver configurar_cota)
+
+_sessao = None
+_sessao_lock = threading.Lock()
+_timeout = (TIMEOUT_CONEXAO, TIMEOUT_LEITURA)
+
+
+def _criar_sessao(tamanho_pool):
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=tamanho_pool, pool_block=True)
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    sessao.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return sessao
+
+
+def obter_sessao():
+    """Retorna a sessão HTTP compartilhada (criada na primeira chamada)."""
+    global _sessao
+    if _sessao is None:
+        with _sessao_lock:
+            if _sessao is None:
+                _sessao = _criar_sessao(TAMANHO_POOL_CONEXOES)
+    return _sessao
+
+
+def configurar_sessao(tamanho_pool=TAMANHO_POOL_CONEXOES, timeout_conexao=TIMEOUT_CONEXAO, timeout_leitura=TIMEOUT_LEITURA):
+    """Recria a sessão compartilhada com outro tamanho de pool e/ou outros timeouts."""
+    global _sessao, _timeout
+    with _sessao_lock:
+        if _sessao is not None:
+            _sessao.close()
+        _sessao = _criar_sessao(tamanho_pool)
+        _timeout = (timeout_conexao, timeout_leitura)
+
+
+def configurar_limite(requisicoes_por_segundo, rajada=None):
+    """Ajusta o ritmo do limitador compartilhado (ex.: a partir do config.json)."""
+    limitador.configurar(requisicoes_por_segundo, rajada)
+
+
+def configurar_cota(consumir=None):
+    """Define (ou remove, com None) a cota de requisições do processo.
+
+    `consumir()` é chamada antes de cada requisição, inclusive das novas tentativas, e deve reservar
+    uma requisição e retornar True, ou retornar False quando não houver mais (a requisição falha com
+    CotaEsgotada). Usada pelo agendador para cobrar o orçamento por hora a cada requisição real.
+    """
+    global _cota
+    _cota = consumir
+
+
+def requisicoes_feitas():
+    """Total de requisições enviadas à API por este processo (cada nova tentativa conta)."""
+    return limitador.total_adquiridas
+
+
+def _segundos_retry_after(valor):
+    """Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos de espera."""
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        data = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (data - datetime.now(timezone.utc)).total_seconds())
+
+
+def _requisitar(metodo, caminho, **kwargs):
+    """Faz uma requisição pela sessão compartilhada, respeitando o limitador.
+
+    Respostas 429/5xx, timeouts e quedas de conexão são retentados com backoff.
+    """
+    url = f"{URL_BASE}{caminho}"
+    sessao = obter_sessao()
+    espera = ESPERA_INICIAL_RETRY
+    for tentativa in range(1, MAX_TENTATIVAS + 1):
+        if _cota is not None and not _cota():
+            metricas.contar('http_bloqueadas_cota', endpoint=caminho)
+            raise CotaEsgotada(f"Cota de requisições esgotada ({caminho}).")
+        inicio = time.perf_counter()
+        limitador.adquirir()
+        metricas.observar('limitador_espera_segundos', time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        try:
+            resposta = sessao.request(metodo, url, timeout=_timeout, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            metricas.observar('http_requisicao_segundos', time.perf_counter() - inicio, endpoint=caminho)
+            metricas.contar('http_falhas', endpoint=caminho, erro=type(e).__name__)
+            if tentativa == MAX_TENTATIVAS:
+                raise
+            metricas.contar('http_retentativas', endpoint=caminho, motivo='conexao')
+            metricas.observar('http_backoff_segundos', espera, endpoint=caminho)
+            time.sleep(espera)
+            espera = min(ESPERA_MAXIMA_RETRY, espera * 2)
+            continue
+        metricas.observar('http_requisicao_segundos', time.perf_counter() - inicio, endpoint=caminho)
+        metricas.contar('http_respostas', endpoint=caminho, status=resposta.status_code)
+        if resposta.status_code not in STATUS_PARA_RETENTAR or tentativa == MAX_TENTATIVAS:
+            break
+        metricas.contar('http_retentativas', endpoint=caminho, motivo=resposta.status_code)
+        retry_after = _segundos_retry_after(resposta.headers.get('Retry-After'))
+        pausa = min(ESPERA_MAXIMA_RETRY, retry_after if retry_after is not None else espera)
+        if resposta.status_code == 429:
+            # Estourou o limite: segura todas as threads, não só esta (a espera aparece no limitador)
+            limitador.pausar(pausa)
+        else:
+            metricas.observar('http_backoff_segundos', pausa, endpoint=caminho)
+            time.sleep(pausa)
+        espera = min(ESPERA_MAXIMA_RETRY, espera * 2)
+    resposta.raise_for_status()
+    return resposta
+
+
+def buscar_jogos(API_KEY, titulo, resultados=50):
+    """Busca jogos e DLCs pelo título (games/search/v1)."""
+    resposta = _requisitar('GET', "/games/search/v1",
+                           params={'key': API_KEY, 'title': titulo, 'results': resultados})
+    with metricas.cronometrar('json_segundos', endpoint="/games/search/v1"):
+        return resposta.json()
+
+
+def obter_precos(API_KEY, PAIS, lista_de_ids):
+    """Obtém as ofertas atuais para uma lista de ids da ITAD (games/prices/v3)."""
+    if not lista_de_ids:
+        return []
+    resposta = _requisitar('POST', "/games/prices/v3",
+                           params={'key': API_KEY, 'country': PAIS}, json=list(lista_de_ids))
+    with metricas.cronometrar('json_segundos', endpoint="/games/prices/v3"):
+        return resposta.json()
+
+
+def dividir_em_lotes(lista_de_ids, tamanho_lote=TAMANHO_MAXIMO_LOTE_PRECOS):
+    """Remove ids repetidos (mantendo a ordem) e divide o resto em lotes de até `tamanho_lote`."""
+    ids_unicos = list(dict.fromkeys(lista_de_ids))
+    return [ids_unicos[i:i + tamanho_lote] for i in range(0, len(ids_unicos), tamanho_lote)]
+
+
+def obter_precos_em_lotes(API_KEY, PAIS, lista_de_ids, tamanho_lote=TAMANHO_MAXIMO_LOTE_PRECOS):
+    """Como `obter_precos`, mas sem ids repetidos e com o menor número possível de POSTs."""
+    lista_de_precos = []
+    for lote in dividir_em_lotes(lista_de_ids, tamanho_lote):
+        lista_de_precos.extend(obter_precos(API_KEY, PAIS, lote))
+    return lista_de_precos
@@ -1,141 +1,730 @@
 # backend.py
 
-import requests
-import time
 import json
+import threading
+import time
 from datetime import datetime
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import api_itad
+import banco
+import migracoes
+import historico
+import alertas
+import metricas
+import normalizacao
 
 DB_FILE = "historico_de_precos.db"
+MAX_REQUISICOES_SIMULTANEAS = 8 # Quantas chamadas à API podem estar em andamento ao mesmo tempo
+DIAS_CATALOGO = 7 # Por quanto tempo a busca de um jogo (ids do jogo base + DLCs) é reaproveitada
+HORAS_CATALOGO_VAZIO = 24 # Buscas sem resultado expiram antes (o jogo pode ainda não estar na ITAD)
+PAISES = ["BR"] # Países consultados a cada atualização; o primeiro é o principal (histórico, estatísticas e alertas)
+MOEDA_REFERENCIA = "BRL" # Moeda em que os países são comparados
+COTACOES = {} # Quanto vale 1 unidade de outra moeda em MOEDA_REFERENCIA (ex.: {"USD": 5.4}); vem do config.json
+
+FORMATO_DATA_CONSULTA = '%Y-%m-%d %H:%M:%S'
+FORMATO_VALIDADE = '%d/%m/%Y'
+
+# Índice de títulos para as sugestões da GUI (ver sugerir_jogos)
+_indice_titulos = None
+_ultimos_ids_indexados = {}
+_lock_indice_titulos = threading.Lock()
+
+SQL_CONSULTAR_HISTORICO = """
+    SELECT h.data_consulta, i.nome, h.preco_centavos, l.nome, h.validade_oferta, k.url
+    FROM historico_precos h
+    JOIN itens i ON i.id = h.id_item
+    JOIN lojas l ON l.id = h.id_loja
+    LEFT JOIN links k ON k.id = h.id_link
+    WHERE h.id_jogo_monitorado = ?
+    ORDER BY h.data_consulta DESC, h.preco_centavos ASC
+"""
+# Com armazenamento só de mudanças, uma linha vale por várias consultas (data_consulta..visto_ate):
+# a linha do tempo é expandida juntando com a tabela de consultas.
+SQL_CONSULTAR_HISTORICO_EXPANDIDO = """
+    SELECT c.data_consulta, i.nome, h.preco_centavos, l.nome, h.validade_oferta, k.url
+    FROM historico_precos h
+    CROSS JOIN consultas c
+        ON c.id_jogo_monitorado = h.id_jogo_monitorado
+       AND c.data_consulta BETWEEN h.data_consulta AND h.visto_ate
+    JOIN itens i ON i.id = h.id_item
+    JOIN lojas l ON l.id = h.id_loja
+    LEFT JOIN links k ON k.id = h.id_link
+    WHERE h.id_jogo_monitorado = ?
+    ORDER BY c.data_consulta DESC, h.preco_centavos ASC
+"""
+# Estatísticas pré-calculadas (migracoes v4): leitura direta pela chave, sem passar pelo histórico.
+# As médias somam só os baldes diários da janela (busca por faixa na chave primária).
+SQL_ESTATISTICAS_JOGO = """
+    SELECT e.menor_preco_centavos, e.data_menor_preco, im.nome, lm.nome,
+           e.preco_atual_centavos, e.data_atual, ia.nome, la.nome, e.observacoes,
+           (SELECT 1.0 * SUM(soma_centavos) / SUM(observacoes) FROM precos_diarios_jogos d
+             WHERE d.id_jogo_monitorado = e.id_jogo_monitorado AND d.dia >= ?),
+           (SELECT 1.0 * SUM(soma_centavos) / SUM(observacoes) FROM precos_diarios_jogos d
+             WHERE d.id_jogo_monitorado = e.id_jogo_monitorado AND d.dia >= ?)
+    FROM estatisticas_jogos e
+    JOIN itens im ON im.id = e.id_item_menor_preco
+    JOIN lojas lm ON lm.id = e.id_loja_menor_preco
+    JOIN itens ia ON ia.id = e.id_item_atual
+    JOIN lojas la ON la.id = e.id_loja_atual
+    WHERE e.id_jogo_monitorado = ?
+"""
+SQL_ESTATISTICAS_ITENS = """
+    SELECT i.nome, e.menor_preco_centavos, e.data_menor_preco, lm.nome,
+           e.preco_atual_centavos, e.data_atual, la.nome, e.observacoes,
+           (SELECT 1.0 * SUM(soma_centavos) / SUM(observacoes) FROM precos_diarios_itens d
+             WHERE d.id_jogo_monitorado = e.id_jogo_monitorado AND d.id_item = e.id_item AND d.dia >= ?),
+           (SELECT 1.0 * SUM(soma_centavos) / SUM(observacoes) FROM precos_diarios_itens d
+             WHERE d.id_jogo_monitorado = e.id_jogo_monitorado AND d.id_item = e.id_item AND d.dia >= ?)
+    FROM estatisticas_itens e
+    JOIN itens i ON i.id = e.id_item
+    JOIN lojas lm ON lm.id = e.id_loja_menor_preco
+    JOIN lojas la ON la.id = e.id_loja_atual
+    WHERE e.id_jogo_monitorado = ?
+"""
+DIAS_MEDIA_CURTA = 30
+DIAS_MEDIA_LONGA = 90
+
+# Páginas do histórico: mesmas linhas das consultas acima, com o id da linha para o cursor.
+# Ordem, filtros e cursor são completados por _sql_pagina_historico.
+SQL_PAGINA_HISTORICO = """
+    SELECT h.data_consulta, i.nome, h.preco_centavos, l.nome, h.validade_oferta, k.url, h.id
+    FROM historico_precos h
+    JOIN itens i ON i.id = h.id_item
+    JOIN lojas l ON l.id = h.id_loja
+    LEFT JOIN links k ON k.id = h.id_link
+    WHERE h.id_jogo_monitorado = :id_jogo
+"""
+SQL_PAGINA_HISTORICO_EXPANDIDO = """
+    SELECT c.data_consulta, i.nome, h.preco_centavos, l.nome, h.validade_oferta, k.url, h.id
+    FROM consultas c
+    JOIN historico_precos h
+        ON h.id_jogo_monitorado = c.id_jogo_monitorado
+       AND h.data_consulta <= c.data_consulta AND h.visto_ate >= c.data_consulta
+    JOIN itens i ON i.id = h.id_item
+    JOIN lojas l ON l.id = h.id_loja
+    LEFT JOIN links k ON k.id = h.id_link
+    WHERE c.id_jogo_monitorado = :id_jogo
+"""
+TAMANHO_PAGINA_HISTORICO = 100
+
+SQL_JOGO_POR_NOME_NORMALIZADO = """
+    SELECT id, nome, monitorado FROM jogos_monitorados WHERE nome_normalizado = ? ORDER BY id LIMIT 1
+"""
+# Termos buscados no finder_V01 também têm linha em jogos_monitorados, com monitorado = 0
+SQL_JOGOS_MONITORADOS = "SELECT id, nome FROM jogos_monitorados WHERE monitorado = 1"
+
+# Preço atual de cada item em cada país (migracoes v9): busca pelo começo da chave primária
+SQL_PRECOS_POR_PAIS = """
+    SELECT p.id_item, i.nome, p.pais, p.preco_centavos, p.moeda, l.nome, k.url, p.data_consulta
+    FROM precos_por_pais p
+    JOIN itens i ON i.id = p.id_item
+    JOIN lojas l ON l.id = p.id_loja
+    LEFT JOIN links k ON k.id = p.id_link
+    WHERE p.id_jogo_monitorado = ?
+"""
+# Linha do tempo do melhor preço de cada item do jogo em um país (migracoes v9)
+SQL_HISTORICO_POR_PAIS = """
+    SELECT i.nome, h.preco_centavos, h.moeda, l.nome, h.data_consulta, h.visto_ate
+    FROM historico_por_pais h
+    JOIN itens i ON i.id = h.id_item
+    JOIN lojas l ON l.id = h.id_loja
+    WHERE h.id_jogo_monitorado = ? AND h.pais = ?
+    ORDER BY h.id_item, h.data_consulta
+"""
+SQL_TEM_LINHAS_ESTENDIDAS = """
+    SELECT EXISTS (SELECT 1 FROM historico_precos WHERE id_jogo_monitorado = ? AND visto_ate > data_consulta)
+"""
 
 def setup_database():
-    """Cria o banco de dados e as tabelas necessárias se não existirem."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    # Tabela para os jogos que estamos monitorando
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS jogos_monitorados (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL UNIQUE
-        )
-    ''')
-    # Tabela para guardar todo o histórico de preços encontrados
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS historico_precos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            id_jogo_monitorado INTEGER,
-            nome_item TEXT NOT NULL,
-            preco REAL NOT NULL,
-            loja TEXT NOT NULL,
-            link TEXT,
-            validade_oferta TEXT,
-            data_consulta TEXT NOT NULL,
-            FOREIGN KEY (id_jogo_monitorado) REFERENCES jogos_monitorados (id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Cria o banco de dados (ou atualiza um banco antigo) para a versão atual do esquema."""
+    conn = banco.conectar(DB_FILE)
+    migracoes.migrar(conn)
+
+def verificar_indices():
+    """Confere (via EXPLAIN QUERY PLAN) se as consultas mais usadas estão usando os índices."""
+    conn = banco.conectar(DB_FILE)
+    return {
+        'consultar_historico': banco.consulta_usa_indice(conn, SQL_CONSULTAR_HISTORICO, (0,), 'idx_historico_jogo_data'),
+        'linhas_estendidas': banco.consulta_usa_indice(conn, SQL_TEM_LINHAS_ESTENDIDAS, (0,), 'idx_historico_estendido'),
+        'estatisticas_itens': banco.consulta_usa_indice(conn, SQL_ESTATISTICAS_ITENS, (0, 0, 0), 'PRIMARY KEY'),
+        'jogo_por_nome': banco.consulta_usa_indice(conn, SQL_JOGO_POR_NOME_NORMALIZADO, ('',), 'idx_jogos_nome_normalizado'),
+        'precos_por_pais': banco.consulta_usa_indice(conn, SQL_PRECOS_POR_PAIS, (0,), 'PRIMARY KEY'),
+        'historico_por_pais': banco.consulta_usa_indice(conn, SQL_HISTORICO_POR_PAIS, (0, ''), 'idx_historico_por_pais'),
+    }
 
 def adicionar_novo_jogo(nome_jogo):
-    """Adiciona um novo jogo à tabela de monitoramento."""
-    if not nome_jogo:
+    """Adiciona um novo jogo à tabela de monitoramento.
+
+    Nomes que só diferem na forma ("Diablo IV" e "diablo 4") contam como o mesmo jogo. Um termo já
+    buscado no finder_V01 passa a ser monitorado, mantendo o histórico que tiver.
+    """
+    nome_jogo = (nome_jogo or "").strip()
+    nome_normalizado = normalizacao.normalizar_nome_jogo(nome_jogo)
+    if not nome_normalizado:
         return "Nome do jogo não pode ser vazio."
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = banco.conectar(DB_FILE)
+    existente = conn.execute(SQL_JOGO_POR_NOME_NORMALIZADO, (nome_normalizado,)).fetchone()
+    if existente and existente[2]:
+        if existente[1] == nome_jogo:
+            return f"'{nome_jogo}' já está na lista de monitoramento."
+        return f"'{nome_jogo}' já está na lista de monitoramento (como '{existente[1]}')."
     try:
-        cursor.execute("INSERT INTO jogos_monitorados (nome) VALUES (?)", (nome_jogo,))
-        conn.commit()
+        with conn:
+            if existente:
+                # Termo do finder_V01: passa a ser monitorado, com o nome como foi digitado
+                conn.execute("UPDATE jogos_monitorados SET nome = ?, monitorado = 1 WHERE id = ?", (nome_jogo, existente[0]))
+                id_jogo = existente[0]
+            else:
+                id_jogo = conn.execute("INSERT INTO jogos_monitorados (nome, nome_normalizado) VALUES (?, ?)",
+                                       (nome_jogo, nome_normalizado)).lastrowid
+        if _indice_titulos is not None:
+            _indice_titulos.adicionar(('jogo', id_jogo), nome_jogo)
         return f"'{nome_jogo}' adicionado com sucesso!"
     except sqlite3.IntegrityError:
         return f"'{nome_jogo}' já está na lista de monitoramento."
-    finally:
-        conn.close()
+
+def _obter_indice_titulos(conn):
+    """Índice de trigramas com os jogos monitorados e os títulos da ITAD já vistos (tabela itens).
+
+    Montado na primeira sugestão; depois só recebe as linhas novas (ids maiores que os já indexados).
+    """
+    global _indice_titulos
+    with _lock_indice_titulos:
+        if _indice_titulos is None:
+            _indice_titulos = normalizacao.IndiceTrigramas()
+            _ultimos_ids_indexados.update(jogo=0, item=0)
+        for tipo, sql in (('jogo', SQL_JOGOS_MONITORADOS + " AND id > ?"),
+                          ('item', "SELECT id, nome FROM itens WHERE id > ?")):
+            for id_, nome in conn.execute(sql, (_ultimos_ids_indexados[tipo],)):
+                _indice_titulos.adicionar((tipo, id_), nome)
+                _ultimos_ids_indexados[tipo] = max(_ultimos_ids_indexados[tipo], id_)
+        return _indice_titulos
+
+def sugerir_jogos(texto, limite=8):
+    """Nomes parecidos com `texto` (busca local por trigramas, sem chamadas à API).
+
+    Retorna (nome, já monitorado?) sem repetir nomes de mesma forma normalizada.
+    """
+    if not normalizacao.normalizar_nome_jogo(texto or ""):
+        return []
+    indice = _obter_indice_titulos(banco.conectar(DB_FILE))
+    sugestoes, vistos = [], set()
+    for (tipo, _), nome, _ in indice.buscar(texto, limite * 2):
+        chave = normalizacao.normalizar_nome_jogo(nome)
+        if chave not in vistos:
+            vistos.add(chave)
+            sugestoes.append((nome, tipo == 'jogo'))
+    return sugestoes[:limite]
 
 def obter_jogos_monitorados():
     """Retorna uma lista de todos os jogos sendo monitorados."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nome FROM jogos_monitorados ORDER BY nome")
-    jogos = cursor.fetchall()
-    conn.close()
-    return jogos
-
-def buscar_e_salvar_precos(API_KEY, PAIS):
-    """Busca os preços atuais para todos os jogos monitorados e salva no histórico."""
-    conn_main = sqlite3.connect(DB_FILE)
-    cursor_main = conn_main.cursor()
-    cursor_main.execute("SELECT id, nome FROM jogos_monitorados")
-    jogos_para_verificar = cursor_main.fetchall()
-    conn_main.close()
+    conn = banco.conectar(DB_FILE)
+    return conn.execute(SQL_JOGOS_MONITORADOS + " ORDER BY nome").fetchall()
+
+def adicionar_regra_alerta(id_jogo, tipo, valor=None):
+    """Cria uma regra de alerta para um jogo monitorado.
+
+    `valor` é o preço alvo em reais para 'preco_alvo', a porcentagem abaixo da média para
+    'abaixo_da_media' e não é usado em 'menor_historico'.
+    """
+    if tipo not in alertas.TIPOS:
+        return f"Tipo de alerta desconhecido: {tipo}."
+    if tipo == alertas.PRECO_ALVO:
+        if valor is None:
+            return "Informe o preço alvo."
+        valor = round(float(valor) * 100)
+    elif tipo == alertas.ABAIXO_DA_MEDIA:
+        if valor is None:
+            return "Informe a porcentagem abaixo da média."
+        valor = int(valor)
+    else:
+        valor = None
+    conn = banco.conectar(DB_FILE)
+    with conn:
+        conn.execute("INSERT INTO regras_alerta (id_jogo_monitorado, tipo, valor) VALUES (?, ?, ?)", (id_jogo, tipo, valor))
+    return "Alerta criado com sucesso!"
+
+def obter_regras_alerta(id_jogo):
+    """Retorna as regras de alerta de um jogo como (id, tipo, valor formatado)."""
+    conn = banco.conectar(DB_FILE)
+    regras = []
+    for id_regra, tipo, valor in conn.execute(
+            "SELECT id, tipo, valor FROM regras_alerta WHERE id_jogo_monitorado = ? AND ativa = 1 ORDER BY id", (id_jogo,)):
+        if tipo == alertas.PRECO_ALVO:
+            valor = f"R${valor / 100:.2f}"
+        elif tipo == alertas.ABAIXO_DA_MEDIA:
+            valor = f"{valor}%"
+        regras.append((id_regra, tipo, valor or ''))
+    return regras
+
+def remover_regra_alerta(id_regra):
+    conn = banco.conectar(DB_FILE)
+    with conn:
+        conn.execute("DELETE FROM alertas_disparados WHERE id_regra = ?", (id_regra,))
+        conn.execute("DELETE FROM regras_alerta WHERE id = ?", (id_regra,))
+
+def _carregar_catalogo(conn, ids_jogos, agora):
+    """Resultados de busca ainda válidos no catálogo local: {id do jogo: lista da games/search/v1}."""
+    catalogo = {}
+    ids_jogos = list(ids_jogos)
+    for i in range(0, len(ids_jogos), 500):
+        lote = ids_jogos[i:i + 500]
+        marcadores = ", ".join("?" * len(lote))
+        for id_jogo, resultado in conn.execute(
+                f"SELECT id_jogo_monitorado, resultado FROM catalogo_busca "
+                f"WHERE id_jogo_monitorado IN ({marcadores}) AND expira_em > ?", lote + [agora]):
+            catalogo[id_jogo] = json.loads(resultado)
+    return catalogo
+
+def _salvar_no_catalogo(conn, buscas, agora, dias_catalogo=DIAS_CATALOGO):
+    """Grava de uma vez as buscas feitas na API: [(id do jogo, resposta da games/search/v1)]."""
+    linhas = []
+    for id_jogo, resposta in buscas:
+        # Só o que a atualização usa (id e título), na ordem da API
+        resultado = [{'id': jogo['id'], 'title': jogo['title']} for jogo in resposta]
+        validade = dias_catalogo * 86400 if resultado else HORAS_CATALOGO_VAZIO * 3600
+        linhas.append((id_jogo, json.dumps(resultado, ensure_ascii=False), agora, agora + validade))
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO catalogo_busca (id_jogo_monitorado, resultado, buscado_em, expira_em) "
+                         "VALUES (?, ?, ?, ?)", linhas)
+
+def invalidar_catalogo(id_jogo=None):
+    """Descarta a busca guardada de um jogo (ou de todos) para a próxima atualização consultar a API."""
+    conn = banco.conectar(DB_FILE)
+    with conn:
+        if id_jogo is None:
+            conn.execute("DELETE FROM catalogo_busca")
+        else:
+            conn.execute("DELETE FROM catalogo_busca WHERE id_jogo_monitorado = ?", (id_jogo,))
+
+def _ofertas_do_jogo(resposta_busca, precos_por_id):
+    """A oferta mais barata de cada item da busca que tem preço em `precos_por_id` (resposta da games/prices/v3)."""
+    ofertas = []
+    for jogo_encontrado in resposta_busca:
+        if jogo_encontrado['id'] in precos_por_id and precos_por_id[jogo_encontrado['id']]['deals']:
+            oferta = min(precos_por_id[jogo_encontrado['id']]['deals'], key=lambda x: x['price']['amount'])
+            validade = None
+            if oferta['expiry']:
+                validade = int(datetime.fromisoformat(oferta['expiry']).timestamp())
+
+            ofertas.append({
+                'id_itad': jogo_encontrado['id'],
+                'nome_item': jogo_encontrado['title'],
+                'id_loja_itad': oferta['shop'].get('id'),
+                'loja': oferta['shop']['name'],
+                'link': oferta['url'],
+                'preco_centavos': round(oferta['price']['amount'] * 100),
+                'moeda': oferta['price'].get('currency'),
+                'validade_oferta': validade,
+            })
+    return ofertas
+
+class _Andamento:
+    """Passos feitos e total da atualização (para o callback `progresso`) e o pedido de cancelamento."""
+
+    def __init__(self, progresso, cancelar, total):
+        self.progresso, self.cancelar = progresso, cancelar
+        self.feitos, self.total = 0, total
+
+    def cancelado(self):
+        return self.cancelar is not None and self.cancelar.is_set()
+
+    def avancar(self, passos=1):
+        self.feitos += passos
+        if self.progresso:
+            self.progresso(self.feitos, self.total)
+
+
+def _buscar_jogos(conn, API_KEY, jogos, executor, andamento, dias_catalogo):
+    """Etapa 1: expande cada jogo nos seus ids (catálogo local ou games/search/v1, em paralelo).
+
+    As mensagens de cada jogo saem na ordem da lista, assim que a busca dele termina. Retorna
+    {id do jogo: resultado da busca}, sem os jogos cuja busca falhou, ou None se foi cancelada.
+    """
+    agora = int(time.time())
+    catalogo = _carregar_catalogo(conn, [id_jogo for id_jogo, _ in jogos], agora) if dias_catalogo > 0 else {}
+    metricas.contar('catalogo', len(catalogo), resultado='acerto')
+    metricas.contar('catalogo', len(jogos) - len(catalogo), resultado='falta')
+    if catalogo:
+        yield f"{len(catalogo)} jogo(s) resolvidos pelo catálogo local; {len(jogos) - len(catalogo)} buscado(s) na API."
+        andamento.avancar(len(catalogo))
+
+    futuros = {id_jogo: executor.submit(api_itad.buscar_jogos, API_KEY, nome_jogo)
+               for id_jogo, nome_jogo in jogos if id_jogo not in catalogo}
+    respostas = {}
+    for id_jogo, nome_jogo in jogos:
+        if andamento.cancelado():
+            break
+        yield f"\nBuscando por '{nome_jogo}'..."
+        if id_jogo in catalogo:
+            respostas[id_jogo] = catalogo[id_jogo]
+        else:
+            erro = futuros[id_jogo].exception()  # Espera a busca deste jogo terminar
+            andamento.avancar()
+            if erro is not None:
+                yield f"ERRO ao buscar '{nome_jogo}': {erro}"
+                continue
+            respostas[id_jogo] = futuros[id_jogo].result()
+        if not respostas[id_jogo]:
+            yield f"-> Nenhum item encontrado para '{nome_jogo}'."
+
+    # Mesmo com a atualização cancelada, as buscas já pagas (inclusive as que ninguém esperou) ficam no catálogo
+    buscas_feitas = [(id_jogo, futuro.result()) for id_jogo, futuro in futuros.items()
+                     if futuro.done() and not futuro.cancelled() and futuro.exception() is None]
+    if buscas_feitas:
+        try:
+            _salvar_no_catalogo(conn, buscas_feitas, agora, dias_catalogo or DIAS_CATALOGO)
+        except Exception as e:
+            yield f"ERRO ao salvar o catálogo local: {e}"
+    if andamento.cancelado():
+        yield "\nAtualização cancelada."
+        return None
+    return respostas
+
+
+def _obter_precos(API_KEY, paises, lotes, executor, andamento):
+    """Etapa 2: os mesmos lotes de ids em cada país, em paralelo.
+
+    Retorna ({país: {id: preço}}, países com algum lote com erro, lotes com erro), ou None se foi cancelada.
+    """
+    precos_por_pais = {pais: {} for pais in paises}
+    paises_com_erro, lotes_com_erro = set(), 0
+    if not lotes:
+        return precos_por_pais, paises_com_erro, lotes_com_erro
+    yield (f"\nObtendo preços para {sum(len(lote) for lote in lotes)} itens únicos em {len(lotes)} lote(s)"
+           + (f" em {len(paises)} países ({', '.join(paises)})..." if len(paises) > 1 else "..."))
+    futuros = {executor.submit(api_itad.obter_precos, API_KEY, pais, lote): pais for pais in paises for lote in lotes}
+    for futuro in as_completed(futuros):
+        if andamento.cancelado():
+            yield "\nAtualização cancelada."
+            return None
+        andamento.avancar()
+        pais = futuros[futuro]
+        try:
+            precos_por_pais[pais].update((item['id'], item) for item in futuro.result())
+        except Exception as e:
+            lotes_com_erro += 1
+            paises_com_erro.add(pais)
+            yield f"ERRO ao obter preços de um lote ({pais}): {e}"
+    return precos_por_pais, paises_com_erro, lotes_com_erro
+
+
+def _gravar_resultados(conn, paises, resultados_busca, precos_por_pais, paises_com_erro, modo_armazenamento,
+                       saidas_alerta, andamento):
+    """Etapa 3: separa as ofertas de cada jogo, grava o histórico (e os preços por país) e avalia os alertas."""
+    buffer = historico.BufferDeEscrita(conn, modo_armazenamento)
+    # As referências dos alertas são lidas antes de gravar qualquer oferta desta atualização
+    motor_alertas = alertas.MotorDeAlertas(conn).carregar({id_jogo for id_jogo, _, _ in resultados_busca})
+    alertas_disparados = []
+    consultas_por_pais = []  # Só com mais de um país: [(id do jogo, país, data da consulta, ofertas)]
+    for id_jogo, nome_jogo, resposta_busca in resultados_busca:
+        if andamento.cancelado():
+            break
+        andamento.avancar()
+        data_consulta = int(time.time())
+        ofertas = _ofertas_do_jogo(resposta_busca, precos_por_pais[paises[0]])
+        if len(paises) > 1:
+            consultas_por_pais.append((id_jogo, paises[0], data_consulta, ofertas))
+            consultas_por_pais.extend((id_jogo, pais, data_consulta, _ofertas_do_jogo(resposta_busca, precos_por_pais[pais]))
+                                      for pais in paises[1:])
+        disparados_jogo = motor_alertas.avaliar(id_jogo, nome_jogo, ofertas)
+        alertas_disparados.extend(disparados_jogo)
+        try:
+            # Grava em blocos (executemany + um commit) quando o buffer enche ou fica velho
+            buffer.adicionar(id_jogo, data_consulta, ofertas)
+            yield f"-> {len(ofertas)} ofertas encontradas e salvas no histórico."
+        except Exception as e:
+            yield f"ERRO ao salvar ofertas no histórico: {e}"
+        for alerta in disparados_jogo:
+            yield alerta.mensagem()
+
+    try:
+        buffer.descarregar()
+    except Exception as e:
+        yield f"ERRO ao salvar ofertas no histórico: {e}"
+    if consultas_por_pais:
+        try:
+            linhas = historico.salvar_precos_por_pais(conn, consultas_por_pais, set(paises) - paises_com_erro, buffer.caches)
+            yield f"{linhas} preços salvos para a comparação entre {len(paises)} países."
+        except Exception as e:
+            yield f"ERRO ao salvar os preços por país: {e}"
+
+    if alertas_disparados:
+        yield f"\n{len(alertas_disparados)} alerta(s) de preço disparado(s)."
+        try:
+            motor_alertas.registrar()
+        except Exception as e:
+            yield f"ERRO ao registrar alertas: {e}"
+        for saida, erro in alertas.enviar(alertas_disparados, saidas_alerta or []):
+            yield f"ERRO ao enviar alertas ({type(saida).__name__}): {erro}"
+
+
+def buscar_e_salvar_precos(API_KEY, PAIS, max_simultaneos=MAX_REQUISICOES_SIMULTANEAS, modo_armazenamento=None,
+                           saidas_alerta=None, ids_jogos=None, cancelar=None, progresso=None,
+                           dias_catalogo=DIAS_CATALOGO, resumo=None, outros_paises=()):
+    """Busca os preços atuais dos jogos monitorados (ou só de `ids_jogos`) e salva no histórico.
+
+    `PAIS` vai para o histórico, as estatísticas e os alertas; `outros_paises` custam só os lotes de preços.
+    """
+    conn = banco.conectar(DB_FILE)
+    jogos_para_verificar = conn.execute(SQL_JOGOS_MONITORADOS).fetchall()
+    if ids_jogos is not None:
+        ids_jogos = set(ids_jogos)
+        jogos_para_verificar = [(id_jogo, nome) for id_jogo, nome in jogos_para_verificar if id_jogo in ids_jogos]
     
     if not jogos_para_verificar:
         yield "Nenhum jogo para verificar. Adicione um jogo primeiro."
         return
 
     yield f"Verificando {len(jogos_para_verificar)} jogo(s)..."
-    
-    for id_monitorado, nome_jogo in jogos_para_verificar:
-        yield f"\nBuscando por '{nome_jogo}'..."
-        
-        try:
-            # Busca jogos e DLCs
-            url_busca = f"https://api.isthereanydeal.com/games/search/v1?key={API_KEY}&title={nome_jogo}&results=50"
-            resposta_busca = requests.get(url_busca).json()
-            
-            if not resposta_busca:
-                yield f"-> Nenhum item encontrado para '{nome_jogo}'."
-                continue
-            
-            # Obtém preços
-            ids_api = [jogo['id'] for jogo in resposta_busca]
-            url_precos = f"https://api.isthereanydeal.com/games/prices/v3?key={API_KEY}&country={PAIS}"
-            lista_de_precos = requests.post(url_precos, json=ids_api).json()
-            precos_por_id = {item['id']: item for item in lista_de_precos}
-
-            conn_write = sqlite3.connect(DB_FILE)
-            cursor_write = conn_write.cursor()
-            
-            ofertas_encontradas = 0
-            for jogo_encontrado in resposta_busca:
-                if jogo_encontrado['id'] in precos_por_id and precos_por_id[jogo_encontrado['id']]['deals']:
-                    oferta = min(precos_por_id[jogo_encontrado['id']]['deals'], key=lambda x: x['price']['amount'])
-                    validade = "N/A"
-                    if oferta['expiry']:
-                        validade = datetime.fromisoformat(oferta['expiry']).strftime('%d/%m/%Y')
-                    
-                    cursor_write.execute('INSERT INTO historico_precos (id_jogo_monitorado, nome_item, preco, loja, link, validade_oferta, data_consulta) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                                   (id_monitorado, jogo_encontrado['title'], oferta['price']['amount'], oferta['shop']['name'], oferta['url'], validade, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-                    ofertas_encontradas += 1
-            
-            conn_write.commit()
-            conn_write.close()
-            yield f"-> {ofertas_encontradas} ofertas encontradas e salvas no histórico."
-            time.sleep(1.5)
+    paises = list(dict.fromkeys([PAIS, *outros_paises]))
+    antes = metricas.registro.instantaneo()
+    inicio = time.perf_counter()
+    # Até as buscas terminarem, o total supõe um lote de preços e todos os jogos com resultado
+    andamento = _Andamento(progresso, cancelar, 2 * len(jogos_para_verificar) + 1)
 
-        except Exception as e:
-            yield f"ERRO ao buscar '{nome_jogo}': {e}"
-    
-    yield "\nAtualização concluída!"
+    executor = ThreadPoolExecutor(max_workers=max(1, max_simultaneos))
+    try:
+        with metricas.cronometrar('atualizacao_etapa_segundos', etapa='buscas'):
+            respostas = yield from _buscar_jogos(conn, API_KEY, jogos_para_verificar, executor, andamento, dias_catalogo)
+        if respostas is None:
+            return
+        resultados_busca = [(id_jogo, nome, respostas[id_jogo]) for id_jogo, nome in jogos_para_verificar
+                            if respostas.get(id_jogo)]
+
+        lotes = api_itad.dividir_em_lotes(jogo['id'] for _, _, resposta in resultados_busca for jogo in resposta)
+        andamento.total = andamento.feitos + len(lotes) * len(paises) + len(resultados_busca)
+        with metricas.cronometrar('atualizacao_etapa_segundos', etapa='precos'):
+            precos = yield from _obter_precos(API_KEY, paises, lotes, executor, andamento)
+        if precos is None:
+            return
+        precos_por_pais, paises_com_erro, lotes_com_erro = precos
+    finally:
+        # Se o gerador for interrompido, descarta as consultas que ainda não começaram
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    with metricas.cronometrar('atualizacao_etapa_segundos', etapa='gravacao'):
+        yield from _gravar_resultados(conn, paises, resultados_busca, precos_por_pais, paises_com_erro,
+                                      modo_armazenamento, saidas_alerta, andamento)
+
+    metricas.observar('atualizacao_segundos', time.perf_counter() - inicio)
+    if resumo:
+        resumo(metricas.registro.resumo_desde(antes))
+
+    if andamento.cancelado():
+        yield "\nAtualização cancelada (as ofertas já processadas foram salvas)."
+    elif lotes_com_erro:
+        yield f"\nAtualização concluída com {lotes_com_erro} lote(s) de preços com erro."
+    else:
+        yield "\nAtualização concluída!"
 
 
 def consultar_historico(id_jogo):
-    """Consulta o histórico de preços para um jogo específico."""
-    conn = sqlite3.connect(DB_FILE)
+    """Consulta o histórico de preços para um jogo específico (uma linha por item em cada consulta)."""
+    conn = banco.conectar(DB_FILE)
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT data_consulta, nome_item, preco, loja, validade_oferta, link
-        FROM historico_precos
-        WHERE id_jogo_monitorado = ?
-        ORDER BY data_consulta DESC, preco ASC
-    """, (id_jogo,))
-    historico = cursor.fetchall()
-    # Formatando o preço para exibição
-    historico_formatado = []
-    for row in historico:
-        # row é uma tupla, convertemos para lista para poder modificar
-        row_list = list(row)
-        # Formata a coluna de preço (índice 2)
-        row_list[2] = f"R${row_list[2]:.2f}"
-        historico_formatado.append(row_list)
-    conn.close()
-    return historico_formatado
\ No newline at end of file
+    # Sem linhas estendidas (modo completo) a consulta simples já é a linha do tempo inteira e vem
+    # ordenada direto do índice; a versão expandida só é necessária com o armazenamento de mudanças.
+    with metricas.cronometrar('consulta_segundos', consulta='historico'):
+        if conn.execute(SQL_TEM_LINHAS_ESTENDIDAS, (id_jogo,)).fetchone()[0]:
+            cursor.execute(SQL_CONSULTAR_HISTORICO_EXPANDIDO, (id_jogo,))
+        else:
+            cursor.execute(SQL_CONSULTAR_HISTORICO, (id_jogo,))
+        historico = cursor.fetchall()
+    metricas.contar('consulta_linhas', len(historico), consulta='historico')
+    # Formatando datas e preço para exibição
+    return [_formatar_linha_historico(*linha) for linha in historico]
+
+
+def _formatar_linha_historico(data_consulta, nome_item, preco_centavos, loja, validade, link):
+    return [
+        datetime.fromtimestamp(data_consulta).strftime(FORMATO_DATA_CONSULTA),
+        nome_item,
+        f"R${preco_centavos / 100:.2f}",
+        loja,
+        datetime.fromtimestamp(validade).strftime(FORMATO_VALIDADE) if validade is not None else "N/A",
+        link,
+    ]
+
+
+def _sql_pagina_historico(expandido, mais_recentes_primeiro, com_cursor, loja, texto_item):
+    """Monta o SELECT de uma página do histórico (paginação por chave, sem OFFSET)."""
+    # A chave de ordenação é (data da consulta, preço, id da linha): única e estável entre páginas
+    coluna_data = "c.data_consulta" if expandido else "h.data_consulta"
+    sql = SQL_PAGINA_HISTORICO_EXPANDIDO if expandido else SQL_PAGINA_HISTORICO
+    condicoes = []
+    if com_cursor:
+        # (data <= ? e (data < ? ou (preço, id) > (?, ?))) deixa o índice fazer a busca por faixa na data
+        comparacao = "<" if mais_recentes_primeiro else ">"
+        condicoes.append(f"{coluna_data} {comparacao}= :data AND ({coluna_data} {comparacao} :data "
+                         f"OR (h.preco_centavos, h.id) > (:preco, :id))")
+    if loja:
+        condicoes.append("l.nome = :loja")
+    if texto_item:
+        condicoes.append("i.nome LIKE :texto ESCAPE '\\'")
+    if condicoes:
+        sql += " AND " + " AND ".join(condicoes)
+    direcao = "DESC" if mais_recentes_primeiro else "ASC"
+    sql += f" ORDER BY {coluna_data} {direcao}, h.preco_centavos ASC, h.id ASC LIMIT :limite"
+    return sql
+
+
+def consultar_historico_pagina(id_jogo, tamanho=TAMANHO_PAGINA_HISTORICO, depois_de=None, mais_recentes_primeiro=True,
+                               loja=None, texto_item=None):
+    """Uma página do histórico de um jogo, já formatada para exibição.
+
+    A paginação é por chave: `depois_de` é o cursor devolvido pela página anterior (None na primeira).
+    Ordenação (por data, depois preço) e filtros (loja exata, trecho do nome do item) rodam no SQL,
+    e só as linhas da página são formatadas. Retorna (linhas, cursor da próxima página ou None).
+    """
+    conn = banco.conectar(DB_FILE)
+    inicio = time.perf_counter()
+    expandido = bool(conn.execute(SQL_TEM_LINHAS_ESTENDIDAS, (id_jogo,)).fetchone()[0])
+    sql = _sql_pagina_historico(expandido, mais_recentes_primeiro, depois_de is not None, loja, texto_item)
+    parametros = {'id_jogo': id_jogo, 'limite': tamanho + 1, 'loja': loja}
+    if texto_item:
+        texto = texto_item.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        parametros['texto'] = f"%{texto}%"
+    if depois_de is not None:
+        parametros['data'], parametros['preco'], parametros['id'] = depois_de
+    linhas = conn.execute(sql, parametros).fetchall()
+    metricas.observar('consulta_segundos', time.perf_counter() - inicio, consulta='historico_pagina')
+
+    # Uma linha a mais só para saber se existe próxima página
+    proximo_cursor = None
+    if len(linhas) > tamanho:
+        linhas = linhas[:tamanho]
+        ultima = linhas[-1]
+        proximo_cursor = (ultima[0], ultima[2], ultima[6])
+    return [_formatar_linha_historico(*linha[:6]) for linha in linhas], proximo_cursor
+
+
+def _reais(centavos):
+    return f"R${centavos / 100:.2f}" if centavos is not None else "N/A"
+
+
+def _em_moeda_referencia(centavos, moeda, cotacoes):
+    """Converte um preço para MOEDA_REFERENCIA; None se a moeda não tem cotação."""
+    if moeda == MOEDA_REFERENCIA:
+        return centavos
+    cotacao = cotacoes.get(moeda)
+    return round(centavos * cotacao) if cotacao else None
+
+
+def obter_comparacao_paises(id_jogo, pais_principal=None, cotacoes=None):
+    """Para cada item do jogo, o país onde ele está mais barato agora, comparado ao país principal.
+
+    Lê precos_por_pais pelo começo da chave primária (só itens x países deste jogo) e converte os
+    preços para MOEDA_REFERENCIA com `cotacoes` (padrão: COTACOES); moedas sem cotação ficam de fora.
+    Retorna uma lista de dicts, dos itens com maior economia para os de menor.
+    """
+    pais_principal = pais_principal or PAISES[0]
+    cotacoes = COTACOES if cotacoes is None else cotacoes
+    conn = banco.conectar(DB_FILE)
+    inicio = time.perf_counter()
+    linhas = conn.execute(SQL_PRECOS_POR_PAIS, (id_jogo,)).fetchall()
+    metricas.observar('consulta_segundos', time.perf_counter() - inicio, consulta='comparacao_paises')
+
+    por_item = {}  # id_item -> [nome, (preço convertido, país, preço, moeda, loja, link) do principal, do mais barato]
+    for id_item, nome_item, pais, preco_centavos, moeda, loja, link, _ in linhas:
+        preco = (_em_moeda_referencia(preco_centavos, moeda, cotacoes), pais, preco_centavos, moeda, loja, link)
+        item = por_item.setdefault(id_item, [nome_item, None, None])
+        if pais == pais_principal:
+            item[1] = preco
+        if preco[0] is not None and (item[2] is None or preco[0] < item[2][0]):
+            item[2] = preco
+
+    comparacao = []
+    for nome_item, principal, melhor in por_item.values():
+        if melhor is None:
+            continue
+        economia = None
+        if principal is not None and principal[0]:
+            economia = round(100 * (1 - melhor[0] / principal[0]))
+        comparacao.append({
+            'nome_item': nome_item,
+            'pais': melhor[1],
+            'preco': f"{melhor[3] or '?'} {melhor[2] / 100:.2f}",
+            'preco_convertido': _reais(melhor[0]),
+            'loja': melhor[4],
+            'link': melhor[5],
+            'preco_no_pais_principal': _reais(principal[0]) if principal is not None else "N/A",
+            'economia_percentual': economia,
+        })
+    comparacao.sort(key=lambda c: (c['economia_percentual'] is None, -(c['economia_percentual'] or 0), c['nome_item']))
+    return comparacao
+
+
+def obter_historico_por_pais(id_jogo, pais):
+    """Linha do tempo do melhor preço de cada item do jogo em `pais`, na moeda de lá.
+
+    Só existe para atualizações com mais de um país (o país principal também tem o histórico
+    completo em historico_precos). Retorna uma lista de dicts ordenada por item e data.
+    """
+    conn = banco.conectar(DB_FILE)
+    inicio = time.perf_counter()
+    linhas = conn.execute(SQL_HISTORICO_POR_PAIS, (id_jogo, pais)).fetchall()
+    metricas.observar('consulta_segundos', time.perf_counter() - inicio, consulta='historico_por_pais')
+    return [{
+        'nome_item': nome_item,
+        'preco': f"{moeda or '?'} {preco_centavos / 100:.2f}",
+        'loja': loja,
+        'desde': datetime.fromtimestamp(data_consulta).strftime(FORMATO_DATA_CONSULTA),
+        'ate': datetime.fromtimestamp(visto_ate).strftime(FORMATO_DATA_CONSULTA),
+    } for nome_item, preco_centavos, moeda, loja, data_consulta, visto_ate in linhas]
+
+
+def obter_estatisticas(id_jogo, agora=None):
+    """Menor preço histórico, preço atual, médias de 30/90 dias e número de observações de um jogo.
+
+    Lê as tabelas de estatísticas mantidas a cada gravação do histórico, então o custo não depende
+    do tamanho do histórico. Retorna None se o jogo ainda não tem ofertas; senão um dict com o
+    resumo do jogo (em 'jogo') e uma linha por item (em 'itens'), com preços já formatados.
+    """
+    conn = banco.conectar(DB_FILE)
+    hoje = int(agora if agora is not None else time.time()) // historico.SEGUNDOS_POR_DIA
+    # A janela inclui o dia de hoje: 30 dias = hoje e os 29 anteriores
+    desde_curta, desde_longa = hoje - DIAS_MEDIA_CURTA + 1, hoje - DIAS_MEDIA_LONGA + 1
+
+    inicio = time.perf_counter()
+    linha = conn.execute(SQL_ESTATISTICAS_JOGO, (desde_curta, desde_longa, id_jogo)).fetchone()
+    if linha is None:
+        return None
+    (menor, data_menor, item_menor, loja_menor, atual, data_atual, item_atual, loja_atual,
+     observacoes, media_curta, media_longa) = linha
+    estatisticas = {
+        'jogo': {
+            'menor_preco': _reais(menor),
+            'data_menor_preco': datetime.fromtimestamp(data_menor).strftime(FORMATO_DATA_CONSULTA),
+            'item_menor_preco': item_menor,
+            'loja_menor_preco': loja_menor,
+            'preco_atual': _reais(atual),
+            'data_preco_atual': datetime.fromtimestamp(data_atual).strftime(FORMATO_DATA_CONSULTA),
+            'item_atual': item_atual,
+            'loja_atual': loja_atual,
+            'media_30_dias': _reais(media_curta),
+            'media_90_dias': _reais(media_longa),
+            'observacoes': observacoes,
+        },
+        'itens': [],
+    }
+    linhas_itens = conn.execute(SQL_ESTATISTICAS_ITENS, (desde_curta, desde_longa, id_jogo)).fetchall()
+    metricas.observar('consulta_segundos', time.perf_counter() - inicio, consulta='estatisticas')
+    # Poucos itens por jogo: ordenar aqui evita a ordenação temporária no SQLite
+    linhas_itens.sort(key=lambda linha: linha[4])
+    for (nome_item, menor, data_menor, loja_menor, atual, data_atual, loja_atual, observacoes,
+         media_curta, media_longa) in linhas_itens:
+        estatisticas['itens'].append({
+            'nome_item': nome_item,
+            'menor_preco': _reais(menor),
+            'data_menor_preco': datetime.fromtimestamp(data_menor).strftime(FORMATO_DATA_CONSULTA),
+            'loja_menor_preco': loja_menor,
+            'preco_atual': _reais(atual),
+            'data_preco_atual': datetime.fromtimestamp(data_atual).strftime(FORMATO_DATA_CONSULTA),
+            'loja_atual': loja_atual,
+            'media_30_dias': _reais(media_curta),
+            'media_90_dias': _reais(media_longa),
+            'observacoes': observacoes,
+        })
+    return estatisticas
@@ -0,0 +1,170 @@
+# banco.py
+# Gerenciador de conexões SQLite compartilhado pelo backend, pelos scripts e pelo exportador.
+
+import sqlite3
+import threading
+
+import normalizacao
+
+# --- CONFIGURAÇÃO ---
+DB_FILE = "historico_de_precos.db"
+PRAGMAS = {
+    'journal_mode': 'WAL',      # Leitores (ex.: a tabela da GUI) não bloqueiam o escritor e vice-versa
+    'synchronous': 'NORMAL',    # Seguro com WAL e muito menos fsyncs que FULL
+    'cache_size': -65536,       # Negativo = KiB -> 64 MiB de cache de páginas por conexão
+    'mmap_size': 268435456,     # 256 MiB lidos via mmap
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,       # ms esperando um lock antes de dar "database is locked"
+}
+# --- FIM DA CONFIGURAÇÃO ---
+
+_local = threading.local()
+_todas_as_conexoes = []
+_lock = threading.Lock()
+_geracao = 0  # Incrementada por fechar_todas(); conexões de gerações antigas são reabertas
+
+
+def _abrir(db_file):
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    for pragma, valor in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {valor}")
+    return conn
+
+
+def conectar(db_file=DB_FILE):
+    """Retorna a conexão desta thread com `db_file`, abrindo-a (com os PRAGMAs) na primeira vez.
+
+    A conexão continua aberta entre chamadas; use `with conn:` para delimitar transações.
+    """
+    conexoes = getattr(_local, 'conexoes', None)
+    if conexoes is None or _local.geracao != _geracao:
+        conexoes = _local.conexoes = {}
+        _local.geracao = _geracao
+    conn = conexoes.get(db_file)
+    if conn is None:
+        conn = conexoes[db_file] = _abrir(db_file)
+        with _lock:
+            _todas_as_conexoes.append((threading.get_ident(), db_file, conn))
+    return conn
+
+
+def fechar_conexao(db_file=DB_FILE):
+    """Fecha a conexão desta thread com `db_file`, se houver (ex.: ao fim de uma thread de trabalho)."""
+    conexoes = getattr(_local, 'conexoes', {})
+    conn = conexoes.pop(db_file, None)
+    if conn is not None:
+        with _lock:
+            _todas_as_conexoes[:] = [c for c in _todas_as_conexoes if c[2] is not conn]
+        conn.close()
+
+
+def fechar_todas():
+    """Fecha as conexões abertas por todas as threads (chamar ao encerrar o programa)."""
+    global _geracao
+    with _lock:
+        conexoes = list(_todas_as_conexoes)
+        _todas_as_conexoes.clear()
+        _geracao += 1
+    for _, _, conn in conexoes:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def colunas_da_tabela(conn, tabela):
+    """Retorna o conjunto de colunas de `tabela` (vazio se a tabela não existir)."""
+    return {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")}
+
+
+def obter_ou_criar_id(conn, tabela, nome, cache=None, coluna='nome'):
+    """Retorna o id de `nome` em uma tabela de dimensão (id, `coluna` UNIQUE), inserindo se ainda não existir.
+
+    `cache` (um dict opcional) evita ir ao banco para nomes já vistos na mesma atualização.
+    """
+    if cache is not None and nome in cache:
+        return cache[nome]
+    conn.execute(f"INSERT OR IGNORE INTO {tabela} ({coluna}) VALUES (?)", (nome,))
+    id_ = conn.execute(f"SELECT id FROM {tabela} WHERE {coluna} = ?", (nome,)).fetchone()[0]
+    if cache is not None:
+        cache[nome] = id_
+    return id_
+
+
+def _obter_id_por_chave_itad(conn, tabela, itad_id, nome, cache):
+    """Procura pelo id da ITAD; se não achar, adota uma linha antiga (sem id da ITAD) com o mesmo nome
+    ou cria uma nova. Se o nome mudou na ITAD, atualiza o nome guardado (o id continua o mesmo)."""
+    chave = ('itad', itad_id) if itad_id is not None else ('nome', nome)
+    if cache is not None and cache.get(chave, (None, None))[1] == nome:
+        return cache[chave][0]
+
+    if itad_id is not None:
+        linha = conn.execute(f"SELECT id, nome FROM {tabela} WHERE itad_id = ?", (itad_id,)).fetchone()
+    else:
+        # Sem id da ITAD (dados antigos): o nome é a única referência
+        linha = conn.execute(f"SELECT id, nome FROM {tabela} WHERE nome = ? LIMIT 1", (nome,)).fetchone()
+    if linha is None and itad_id is not None:
+        linha = conn.execute(f"SELECT id, nome FROM {tabela} WHERE itad_id IS NULL AND nome = ? LIMIT 1", (nome,)).fetchone()
+        if linha is not None:
+            conn.execute(f"UPDATE {tabela} SET itad_id = ? WHERE id = ?", (itad_id, linha[0]))
+    if linha is None:
+        id_ = conn.execute(f"INSERT INTO {tabela} (itad_id, nome) VALUES (?, ?)", (itad_id, nome)).lastrowid
+    else:
+        id_ = linha[0]
+        if linha[1] != nome:
+            conn.execute(f"UPDATE {tabela} SET nome = ? WHERE id = ?", (nome, id_))
+    if cache is not None:
+        cache[chave] = (id_, nome)
+    return id_
+
+
+def obter_id_item(conn, itad_id, nome, cache=None):
+    """Id do item (jogo/DLC) na tabela `itens`, identificado pelo id da ITAD."""
+    return _obter_id_por_chave_itad(conn, 'itens', itad_id, nome, cache)
+
+
+def obter_id_loja(conn, itad_id, nome, cache=None):
+    """Id da loja na tabela `lojas`, identificada pelo id da loja na ITAD."""
+    return _obter_id_por_chave_itad(conn, 'lojas', itad_id, nome, cache)
+
+
+def obter_id_link(conn, url, cache=None):
+    """Id do link da oferta na tabela `links` (None se a oferta não tiver link)."""
+    if not url:
+        return None
+    return obter_ou_criar_id(conn, 'links', url, cache, coluna='url')
+
+
+def obter_id_jogo_monitorado(conn, nome, monitorado=True):
+    """Id da linha de jogos_monitorados com o mesmo nome normalizado de `nome`, criando-a se ainda não existir.
+
+    Com `monitorado=False` (termos de busca do finder_V01) a linha criada fica fora da lista de
+    monitoramento e das atualizações; uma linha que já existe é reaproveitada como está.
+    """
+    nome_normalizado = normalizacao.normalizar_nome_jogo(nome)
+    linha = conn.execute("SELECT id FROM jogos_monitorados WHERE nome_normalizado = ? ORDER BY id LIMIT 1",
+                         (nome_normalizado,)).fetchone()
+    if linha:
+        return linha[0]
+    conn.execute("INSERT OR IGNORE INTO jogos_monitorados (nome, nome_normalizado, monitorado) VALUES (?, ?, ?)",
+                 (nome, nome_normalizado, int(monitorado)))
+    return conn.execute("SELECT id FROM jogos_monitorados WHERE nome = ?", (nome,)).fetchone()[0]
+
+
+def plano_de_consulta(conn, sql, parametros=()):
+    """Retorna as linhas de EXPLAIN QUERY PLAN para `sql` (só o texto de cada etapa)."""
+    return [linha[-1] for linha in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros)]
+
+
+def consulta_usa_indice(conn, sql, parametros, indice):
+    """Confere se `sql` é resolvida pelo `indice` informado, sem varredura completa nem ordenação temporária.
+
+    Em bancos quase vazios (após ANALYZE) o planejador pode preferir varrer a tabela; o teste
+    só é significativo com um histórico de tamanho real.
+    """
+    plano = plano_de_consulta(conn, sql, parametros)
+    usa_indice = any(indice in etapa for etapa in plano)
+    varredura_ou_ordenacao = any((etapa.startswith('SCAN') and 'INDEX' not in etapa and 'CONSTANT ROW' not in etapa)
+                                 or 'TEMP B-TREE' in etapa
+                                 for etapa in plano)
+    return usa_indice and not varredura_ou_ordenacao
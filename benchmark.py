@@ -0,0 +1,345 @@
+# benchmark.py
+# Medições reproduzíveis, sem rede e sem chave de API: a atualização completa contra o ITAD simulado
+# (itad_simulado.py), a gravação no histórico, a consulta do histórico e a exportação para CSV.
+#
+# O histórico usado pelas leituras é gerado uma vez (milhões de linhas, semente fixa) e reaproveitado
+# enquanto os parâmetros não mudarem. Cada cenário roda em um processo próprio, para o pico de memória
+# (RSS) ser só dele. Com --salvar/--comparar os números viram uma referência para achar regressões.
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import api_itad
+import backend
+import banco
+import exportador
+import historico
+import itad_simulado
+import migracoes
+
+# --- CONFIGURAÇÃO ---
+BANCO_SINTETICO = "benchmark_historico.db"
+JOGOS = 200                    # Jogos monitorados no histórico sintético
+ITENS_POR_JOGO = 25            # Jogo base + DLCs de cada um
+CONSULTAS_POR_JOGO = 400       # Atualizações já feitas (200 x 25 x 400 = 2 milhões de linhas)
+INTERVALO_CONSULTAS = 6 * 3600 # Segundos entre uma atualização sintética e a próxima
+FRACAO_MUDANCAS = 0.05         # Chance de o preço de um item mudar entre duas consultas
+JOGOS_ATUALIZACAO = 100        # Jogos monitorados na medição da atualização completa
+AMOSTRA_HISTORICO = 50         # Quantos jogos têm o histórico consultado
+REQUISICOES_POR_SEGUNDO = 1000 # Limitador do api_itad durante a medição (alto: mede o programa, não o limite)
+TOLERANCIA = 0.20              # Piora aceita no --comparar antes de apontar regressão (20%)
+SEMENTE = 0
+# --- FIM DA CONFIGURAÇÃO ---
+
+CENARIOS = ('atualizacao', 'gravacao', 'historico', 'exportar_csv')
+_PARAMETROS_DO_BANCO = ('jogos', 'itens_por_jogo', 'consultas', 'modo', 'semente')
+
+
+def pico_memoria_mb():
+    """Pico de memória residente (RSS) deste processo, em MiB; None se não houver como medir."""
+    # No Linux o ru_maxrss sobrevive ao exec e herdaria o pico do processo principal; o VmHWM não
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for linha in f:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows: só com o pacote opcional psutil
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 2**20
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 2**20 if sys.platform == 'darwin' else pico / 1024  # bytes no macOS, KiB no Linux
+
+
+# --- HISTÓRICO SINTÉTICO ---
+
+def gerar_historico_sintetico(db_file, jogos=JOGOS, itens_por_jogo=ITENS_POR_JOGO, consultas=CONSULTAS_POR_JOGO,
+                              modo=historico.MODO_COMPLETO, fracao_mudancas=FRACAO_MUDANCAS, semente=SEMENTE,
+                              progresso=None):
+    """Preenche `db_file` (que deve estar vazio) com um histórico inventado, pelo caminho normal de gravação.
+
+    As consultas são feitas rodada a rodada (todos os jogos em cada uma, como numa atualização de
+    verdade), espaçadas de INTERVALO_CONSULTAS e terminando agora. Passa pelo historico.BufferDeEscrita,
+    então as estatísticas e o estado atual ficam coerentes com o histórico. Retorna o número de ofertas.
+    """
+    aleatorio = random.Random(semente)
+    conn = banco.conectar(db_file)
+    migracoes.migrar(conn)
+    with conn:
+        conn.executemany("INSERT INTO jogos_monitorados (nome, nome_normalizado) VALUES (?, ?)",
+                         [(f"Jogo Sintético {j}", f"jogo sintetico {j}") for j in range(jogos)])
+    ids_jogos = [linha[0] for linha in conn.execute("SELECT id FROM jogos_monitorados ORDER BY id")]
+
+    # Estado de cada item: [preço em centavos, índice da loja, validade]
+    estados = {}
+    for j in range(jogos):
+        for k in range(itens_por_jogo):
+            estados[j, k] = [aleatorio.randint(500, 25000), aleatorio.randrange(len(itad_simulado.LOJAS)), None]
+
+    inicio = int(time.time()) - consultas * INTERVALO_CONSULTAS
+    total = 0
+    with historico.BufferDeEscrita(conn, modo, max_ofertas=50000, max_segundos=float('inf')) as buffer:
+        for rodada in range(consultas):
+            data_rodada = inicio + rodada * INTERVALO_CONSULTAS
+            for j, id_jogo in enumerate(ids_jogos):
+                ofertas = []
+                for k in range(itens_por_jogo):
+                    estado = estados[j, k]
+                    if aleatorio.random() < fracao_mudancas:
+                        estado[0] = max(99, estado[0] * aleatorio.randint(40, 130) // 100)
+                        estado[1] = aleatorio.randrange(len(itad_simulado.LOJAS))
+                        estado[2] = data_rodada + aleatorio.randint(1, 14) * 86400 if aleatorio.random() < 0.5 else None
+                    id_loja_itad, loja = itad_simulado.LOJAS[estado[1]]
+                    ofertas.append({
+                        'id_itad': f"sintetico-{j}-{k}",
+                        'nome_item': f"Jogo Sintético {j}" if k == 0 else f"Jogo Sintético {j} - DLC {k}",
+                        'id_loja_itad': id_loja_itad,
+                        'loja': loja,
+                        'link': f"https://itad.example/{id_loja_itad}/sintetico-{j}-{k}",
+                        'preco_centavos': estado[0],
+                        'validade_oferta': estado[2],
+                    })
+                buffer.adicionar(id_jogo, data_rodada + j % INTERVALO_CONSULTAS, ofertas)
+                total += len(ofertas)
+            if progresso:
+                progresso(rodada + 1, consultas)
+    conn.execute("ANALYZE")
+    return total
+
+
+def preparar_banco_sintetico(opcoes):
+    """Gera o banco sintético, ou reaproveita o existente se foi gerado com os mesmos parâmetros."""
+    caminho = opcoes['banco']
+    arquivo_parametros = caminho + ".json"
+    parametros = {chave: opcoes[chave] for chave in _PARAMETROS_DO_BANCO}
+    if not opcoes['recriar'] and os.path.exists(caminho) and os.path.exists(arquivo_parametros):
+        with open(arquivo_parametros, encoding='utf-8') as f:
+            if json.load(f) == parametros:
+                print(f"Usando o histórico sintético de '{caminho}'.")
+                return
+    for sufixo in ('', '-wal', '-shm', '.json'):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+
+    linhas = opcoes['jogos'] * opcoes['itens_por_jogo'] * opcoes['consultas']
+    print(f"Gerando histórico sintético em '{caminho}' ({linhas:,} ofertas)...")
+    inicio = time.perf_counter()
+    mostrar = lambda feitas, total: print(f"  ... rodada {feitas}/{total}", end='\r')
+    gerar_historico_sintetico(caminho, opcoes['jogos'], opcoes['itens_por_jogo'], opcoes['consultas'],
+                              opcoes['modo'], semente=opcoes['semente'], progresso=mostrar)
+    banco.fechar_todas()
+    print(f"\nHistórico gerado em {time.perf_counter() - inicio:.1f}s.")
+    with open(arquivo_parametros, 'w', encoding='utf-8') as f:
+        json.dump(parametros, f)
+
+
+# --- CENÁRIOS (cada um roda em um processo próprio) ---
+
+def _cenario_atualizacao(opcoes, pasta):
+    """buscar_e_salvar_precos de ponta a ponta, com o catálogo desligado (busca + preços + gravação)."""
+    backend.DB_FILE = os.path.join(pasta, "atualizacao.db")
+    api_itad.URL_BASE = opcoes['url_simulado']
+    api_itad.configurar_limite(opcoes['requisicoes_por_segundo'], opcoes['requisicoes_por_segundo'])
+    api_itad.configurar_sessao(tamanho_pool=max(opcoes['max_simultaneos'], api_itad.TAMANHO_POOL_CONEXOES))
+    backend.setup_database()
+    conn = banco.conectar(backend.DB_FILE)
+    with conn:
+        conn.executemany("INSERT INTO jogos_monitorados (nome, nome_normalizado) VALUES (?, ?)",
+                         [(f"Jogo Simulado {j}", f"jogo simulado {j}") for j in range(opcoes['jogos_atualizacao'])])
+
+    requisicoes_antes = api_itad.requisicoes_feitas()
+    erros = 0
+    inicio = time.perf_counter()
+    for mensagem in backend.buscar_e_salvar_precos("chave-do-benchmark", "BR", opcoes['max_simultaneos'],
+                                                   opcoes['modo'], dias_catalogo=0):
+        erros += mensagem.startswith("ERRO")
+    tempo = time.perf_counter() - inicio
+    linhas = conn.execute("SELECT COUNT(*) FROM historico_precos").fetchone()[0]
+    return {'tempo_s': tempo, 'linhas': linhas, 'requisicoes': api_itad.requisicoes_feitas() - requisicoes_antes,
+            'erros': erros}
+
+
+def _cenario_gravacao(opcoes, pasta):
+    """Só a gravação (BufferDeEscrita + estatísticas), com um décimo das consultas do histórico sintético."""
+    caminho = os.path.join(pasta, "gravacao.db")
+    inicio = time.perf_counter()
+    linhas = gerar_historico_sintetico(caminho, opcoes['jogos'], opcoes['itens_por_jogo'],
+                                       max(1, opcoes['consultas'] // 10), opcoes['modo'], semente=opcoes['semente'])
+    return {'tempo_s': time.perf_counter() - inicio, 'linhas': linhas}
+
+
+def _cenario_historico(opcoes, pasta):
+    """consultar_historico para os primeiros AMOSTRA_HISTORICO jogos do histórico sintético."""
+    backend.DB_FILE = opcoes['banco']
+    conn = banco.conectar(backend.DB_FILE)
+    ids_jogos = [linha[0] for linha in conn.execute(
+        "SELECT id FROM jogos_monitorados ORDER BY id LIMIT ?", (opcoes['amostra_historico'],))]
+    linhas, tempos = 0, []
+    inicio = time.perf_counter()
+    for id_jogo in ids_jogos:
+        inicio_consulta = time.perf_counter()
+        linhas += len(backend.consultar_historico(id_jogo))
+        tempos.append(time.perf_counter() - inicio_consulta)
+    resultado = {'tempo_s': time.perf_counter() - inicio, 'linhas': linhas}
+    if tempos:
+        resultado['p50_ms'] = statistics.median(tempos) * 1000
+        resultado['p95_ms'] = sorted(tempos)[max(0, round(len(tempos) * 0.95) - 1)] * 1000
+    return resultado
+
+
+def _cenario_exportar_csv(opcoes, pasta):
+    """exportar_para_csv do histórico sintético inteiro."""
+    exportador.DB_FILE = opcoes['banco']
+    caminho = os.path.join(pasta, "exportacao.csv")
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        linhas = exportador.exportar_para_csv(caminho)
+    return {'tempo_s': time.perf_counter() - inicio, 'linhas': linhas,
+            'arquivo_mb': os.path.getsize(caminho) / 2**20}
+
+
+_FUNCOES_CENARIOS = {
+    'atualizacao': _cenario_atualizacao,
+    'gravacao': _cenario_gravacao,
+    'historico': _cenario_historico,
+    'exportar_csv': _cenario_exportar_csv,
+}
+
+
+def _executar_no_processo(cenario, opcoes, fila):
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            resultado = _FUNCOES_CENARIOS[cenario](opcoes, pasta)
+            banco.fechar_todas()  # Senão o Windows não deixa apagar a pasta
+        resultado['pico_rss_mb'] = pico_memoria_mb()
+        fila.put(resultado)
+    except Exception as e:
+        fila.put({'erro': f"{type(e).__name__}: {e}"})
+
+
+def executar_cenario(cenario, opcoes):
+    """Roda um cenário em um processo novo e devolve as métricas (com as taxas por segundo)."""
+    contexto = multiprocessing.get_context('spawn')  # Igual em todos os sistemas, sem herdar memória
+    fila = contexto.Queue()
+    processo = contexto.Process(target=_executar_no_processo, args=(cenario, opcoes, fila))
+    processo.start()
+    resultado = fila.get()
+    processo.join()
+    if 'erro' in resultado:
+        return resultado
+    tempo = resultado['tempo_s']
+    resultado['linhas_por_s'] = resultado['linhas'] / tempo if tempo else 0.0
+    if 'requisicoes' in resultado:
+        resultado['requisicoes_por_s'] = resultado['requisicoes'] / tempo if tempo else 0.0
+    return resultado
+
+
+# --- RELATÓRIO ---
+
+def _formatar(resultado):
+    if 'erro' in resultado:
+        return f"ERRO: {resultado['erro']}"
+    partes = [f"{resultado['tempo_s']:.3f}s", f"{resultado['linhas']:,} linhas ({resultado['linhas_por_s']:,.0f}/s)"]
+    if 'requisicoes' in resultado:
+        partes.append(f"{resultado['requisicoes']} req ({resultado['requisicoes_por_s']:.1f}/s)")
+    if 'respostas_429' in resultado:
+        partes.append(f"{resultado['respostas_429']} respostas 429")
+    if 'p50_ms' in resultado:
+        partes.append(f"p50 {resultado['p50_ms']:.1f}ms, p95 {resultado['p95_ms']:.1f}ms")
+    if resultado.get('pico_rss_mb') is not None:
+        partes.append(f"pico RSS {resultado['pico_rss_mb']:.0f} MiB")
+    return " | ".join(partes)
+
+
+def comparar(resultados, referencia, tolerancia=TOLERANCIA):
+    """Compara tempo e pico de memória com uma execução anterior; retorna a lista de regressões."""
+    regressoes = []
+    for cenario, resultado in resultados.items():
+        anterior = referencia.get(cenario)
+        if not anterior or 'erro' in resultado or 'erro' in anterior:
+            continue
+        for metrica in ('tempo_s', 'pico_rss_mb'):
+            if not anterior.get(metrica) or resultado.get(metrica) is None:
+                continue
+            variacao = resultado[metrica] / anterior[metrica] - 1
+            marcador = "  <-- REGRESSÃO" if variacao > tolerancia else ""
+            print(f"  {cenario:<13} {metrica:<12} {anterior[metrica]:>10.3f} -> {resultado[metrica]:>10.3f} ({variacao:+.1%}){marcador}")
+            if marcador:
+                regressoes.append((cenario, metrica, variacao))
+    return regressoes
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Mede a atualização, a gravação, a consulta e a exportação sem usar a API real.")
+    parser.add_argument('-c', '--cenario', action='append', choices=CENARIOS, help="pode repetir (padrão: todos)")
+    parser.add_argument('--banco', default=BANCO_SINTETICO, help="arquivo do histórico sintético (reaproveitado)")
+    parser.add_argument('--recriar', action='store_true', help="gera o histórico sintético de novo")
+    parser.add_argument('--jogos', type=int, default=JOGOS)
+    parser.add_argument('--itens-por-jogo', type=int, default=ITENS_POR_JOGO)
+    parser.add_argument('--consultas', type=int, default=CONSULTAS_POR_JOGO, help="consultas por jogo no histórico")
+    parser.add_argument('--modo', choices=[historico.MODO_COMPLETO, historico.MODO_MUDANCAS], default=historico.MODO_COMPLETO)
+    parser.add_argument('--semente', type=int, default=SEMENTE)
+    parser.add_argument('--jogos-atualizacao', type=int, default=JOGOS_ATUALIZACAO)
+    parser.add_argument('--amostra-historico', type=int, default=AMOSTRA_HISTORICO)
+    parser.add_argument('--max-simultaneos', type=int, default=backend.MAX_REQUISICOES_SIMULTANEAS)
+    parser.add_argument('--requisicoes-por-segundo', type=float, default=REQUISICOES_POR_SEGUNDO)
+    parser.add_argument('--latencia', type=float, default=itad_simulado.LATENCIA, help="segundos por resposta do simulado")
+    parser.add_argument('--itens-por-busca', type=int, default=itad_simulado.ITENS_POR_BUSCA)
+    parser.add_argument('--fracao-429', type=float, default=itad_simulado.FRACAO_429)
+    parser.add_argument('--repeticoes', type=int, default=1, help="execuções de cada cenário (fica a de tempo mediano)")
+    parser.add_argument('--salvar', help="grava os resultados em JSON")
+    parser.add_argument('--comparar', help="compara com um JSON salvo antes e sai com erro se houver regressão")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    return parser.parse_args()
+
+# --- BLOCO PRINCIPAL ---
+if __name__ == "__main__":
+    args = _argumentos()
+    opcoes = vars(args)
+    cenarios = args.cenario or list(CENARIOS)
+    if {'historico', 'exportar_csv'} & set(cenarios):
+        preparar_banco_sintetico(opcoes)
+
+    resultados = {}
+    with itad_simulado.ServidorITADSimulado(latencia=args.latencia, itens_por_busca=args.itens_por_busca,
+                                            fracao_429=args.fracao_429, semente=args.semente) as simulado:
+        opcoes['url_simulado'] = simulado.url
+        for cenario in cenarios:
+            execucoes = []
+            for _ in range(max(1, args.repeticoes)):
+                contagem_antes = simulado.estatisticas()['respostas_429']
+                resultado = executar_cenario(cenario, opcoes)
+                if cenario == 'atualizacao':
+                    resultado['respostas_429'] = simulado.estatisticas()['respostas_429'] - contagem_antes
+                execucoes.append(resultado)
+                if 'erro' in resultado:
+                    break
+            validas = sorted((r for r in execucoes if 'erro' not in r), key=lambda r: r['tempo_s'])
+            resultados[cenario] = validas[(len(validas) - 1) // 2] if validas else execucoes[-1]
+            print(f"{cenario:<13} {_formatar(resultados[cenario])}")
+
+    if args.salvar:
+        with open(args.salvar, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            referencia = json.load(f)
+        print(f"\nComparando com '{args.comparar}' (tolerância {args.tolerancia:.0%}):")
+        if comparar(resultados, referencia, args.tolerancia):
+            sys.exit(1)
@@ -0,0 +1,122 @@
+# cache_resultados.py
+# Cache de resultados de busca por (termo normalizado, país), com validade, usado pelo finder_V01.
+#
+# Duas camadas: um LRU em memória (acertos em microssegundos, sem tocar no banco) na frente da
+# tabela cache_resultados do SQLite (sobrevive entre execuções). As duas têm tamanho máximo.
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import banco
+import metricas
+
+# --- CONFIGURAÇÃO ---
+HORAS_VALIDADE = 24          # Por quanto tempo um resultado é considerado "recente"
+MAX_ENTRADAS_MEMORIA = 256   # Itens no LRU em memória
+MAX_ENTRADAS_BANCO = 5000    # Linhas na tabela; as mais antigas saem primeiro
+# --- FIM DA CONFIGURAÇÃO ---
+
+SQL_OBTER = "SELECT resultado, criado_em, expira_em FROM cache_resultados WHERE termo = ? AND pais = ? AND expira_em > ?"
+
+
+class CacheDeResultados:
+    """Cache com validade (TTL) e despejo por tamanho; seguro para várias threads.
+
+    `obter()` devolve (resultados, criado_em) ou None; `guardar()` grava nas duas camadas.
+    Os contadores de acertos/faltas ficam em `estatisticas()`.
+    """
+
+    def __init__(self, db_file=banco.DB_FILE, horas_validade=HORAS_VALIDADE,
+                 max_entradas_memoria=MAX_ENTRADAS_MEMORIA, max_entradas_banco=MAX_ENTRADAS_BANCO):
+        self.db_file = db_file
+        self.validade = int(horas_validade * 3600)
+        self.max_entradas_memoria = max_entradas_memoria
+        self.max_entradas_banco = max_entradas_banco
+        self._memoria = OrderedDict()  # (termo, país) -> (resultados, criado_em, expira_em)
+        self._lock = threading.Lock()
+        self.acertos_memoria = 0
+        self.acertos_banco = 0
+        self.faltas = 0
+
+    def _guardar_na_memoria(self, chave, entrada):
+        # Chamado com o lock
+        self._memoria[chave] = entrada
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_entradas_memoria:
+            self._memoria.popitem(last=False)
+
+    def obter(self, termo, pais, agora=None):
+        agora = int(time.time() if agora is None else agora)
+        chave = (termo, pais)
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is not None:
+                if entrada[2] > agora:
+                    self._memoria.move_to_end(chave)
+                    self.acertos_memoria += 1
+                    metricas.contar('cache_resultados', resultado='memoria')
+                    return entrada[0], entrada[1]
+                del self._memoria[chave]
+
+        linha = banco.conectar(self.db_file).execute(SQL_OBTER, (termo, pais, agora)).fetchone()
+        with self._lock:
+            if linha is None:
+                self.faltas += 1
+                metricas.contar('cache_resultados', resultado='falta')
+                return None
+            entrada = (json.loads(linha[0]), linha[1], linha[2])
+            self._guardar_na_memoria(chave, entrada)
+            self.acertos_banco += 1
+            metricas.contar('cache_resultados', resultado='banco')
+            return entrada[0], entrada[1]
+
+    def guardar(self, termo, pais, resultados, agora=None):
+        agora = int(time.time() if agora is None else agora)
+        resultados = list(resultados)
+        entrada = (resultados, agora, agora + self.validade)
+        conn = banco.conectar(self.db_file)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO cache_resultados (termo, pais, resultado, criado_em, expira_em) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (termo, pais, json.dumps(resultados, ensure_ascii=False), agora, agora + self.validade))
+            self._podar_banco(conn, agora)
+        with self._lock:
+            self._guardar_na_memoria((termo, pais), entrada)
+
+    def _podar_banco(self, conn, agora):
+        """Remove as entradas vencidas e, se ainda passar do limite, as mais antigas."""
+        conn.execute("DELETE FROM cache_resultados WHERE expira_em <= ?", (agora,))
+        excedente = conn.execute("SELECT COUNT(*) FROM cache_resultados").fetchone()[0] - self.max_entradas_banco
+        if excedente > 0:
+            conn.execute("""
+                DELETE FROM cache_resultados WHERE (termo, pais) IN (
+                    SELECT termo, pais FROM cache_resultados ORDER BY expira_em LIMIT ?)
+            """, (excedente,))
+
+    def invalidar(self, termo=None, pais=None):
+        """Descarta um termo (em um país ou em todos) ou, sem argumentos, o cache inteiro."""
+        conn = banco.conectar(self.db_file)
+        with conn:
+            if termo is None:
+                conn.execute("DELETE FROM cache_resultados")
+            elif pais is None:
+                conn.execute("DELETE FROM cache_resultados WHERE termo = ?", (termo,))
+            else:
+                conn.execute("DELETE FROM cache_resultados WHERE termo = ? AND pais = ?", (termo, pais))
+        with self._lock:
+            for chave in list(self._memoria):
+                if termo is None or (chave[0] == termo and pais in (None, chave[1])):
+                    del self._memoria[chave]
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos_memoria + self.acertos_banco + self.faltas
+            return {
+                'acertos_memoria': self.acertos_memoria,
+                'acertos_banco': self.acertos_banco,
+                'faltas': self.faltas,
+                'taxa_de_acerto': (self.acertos_memoria + self.acertos_banco) / consultas if consultas else 0.0,
+                'entradas_memoria': len(self._memoria),
+            }
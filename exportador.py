@@ -1,56 +1,400 @@
 import sqlite3
 import csv
+import gzip
+import io
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+from decimal import Decimal
+import banco
+import migracoes
 
 # --- CONFIGURAÇÃO ---
 DB_FILE = "historico_de_precos.db"
 CSV_FILE = "historico_precos.csv"
+PASTA_EXPORTACAO = "exportacao_historico" # Destino padrão dos formatos parquet/arrow/ndjson
+TAMANHO_LOTE = 5000 # Linhas lidas do banco (fetchmany) e escritas no arquivo por vez
 # --- FIM DA CONFIGURAÇÃO ---
 
-def exportar_para_csv():
+# Colunas do CSV, na ordem e no formato do arquivo original (SELECT * FROM historico_precos):
+# preço em reais, validade dd/mm/aaaa (ou N/A) e data da consulta "aaaa-mm-dd hh:mm:ss"
+COLUNAS = ['id', 'id_jogo_monitorado', 'nome_item', 'preco', 'loja', 'link', 'validade_oferta', 'data_consulta']
+# Com colunas_estendidas: também o nome do jogo monitorado e o id do item na ITAD
+COLUNAS_ESTENDIDAS = ['id', 'id_jogo_monitorado', 'jogo_monitorado', 'id_itad', 'nome_item', 'preco', 'loja', 'link',
+                      'validade_oferta', 'data_consulta']
+
+# Mesmas colunas de vw_historico_precos, mas montadas aqui para os filtros usarem as colunas em epoch
+_EXPRESSOES_CSV = {
+    'id': "h.id",
+    'id_jogo_monitorado': "h.id_jogo_monitorado",
+    'jogo_monitorado': "j.nome",
+    'id_itad': "i.itad_id",
+    'nome_item': "i.nome",
+    'preco': "h.preco_centavos / 100.0",
+    'loja': "l.nome",
+    'link': "k.url",
+    'validade_oferta': "COALESCE(strftime('%d/%m/%Y', h.validade_oferta, 'unixepoch', 'localtime'), 'N/A')",
+    'data_consulta': "datetime(c.data_consulta, 'unixepoch', 'localtime')",
+}
+# Versão tipada para parquet/arrow/ndjson: preço em centavos e datas em epoch, sem formatação
+_SQL_COLUNAS_TIPADAS = """
+    SELECT h.id, h.id_jogo_monitorado, j.nome, i.itad_id, i.nome, h.preco_centavos, l.nome, k.url,
+           h.validade_oferta, c.data_consulta
+"""
+# Linha do tempo completa: cada linha do histórico repetida para cada consulta que ela cobre
+_SQL_DE_TODAS = """
+    FROM historico_precos h
+    CROSS JOIN consultas c
+        ON c.id_jogo_monitorado = h.id_jogo_monitorado
+       AND c.data_consulta BETWEEN h.data_consulta AND h.visto_ate
+"""
+# Só o preço mais recente: estado_atual_precos aponta para a última linha de cada item de cada jogo
+_SQL_DO_ULTIMO_PRECO = """
+    FROM estado_atual_precos e
+    JOIN historico_precos h ON h.id = e.id_historico
+    JOIN consultas c ON c.id_jogo_monitorado = e.id_jogo_monitorado AND c.data_consulta = e.visto_ate
+"""
+_SQL_DIMENSOES = """
+    JOIN itens i ON i.id = h.id_item
+    JOIN lojas l ON l.id = h.id_loja
+    LEFT JOIN links k ON k.id = h.id_link
+    LEFT JOIN jogos_monitorados j ON j.id = h.id_jogo_monitorado
+"""
+
+
+def _montar_consulta(data_inicio=None, data_fim=None, jogo=None, loja=None, somente_ultimo_preco=False,
+                     tipada=False, depois_da_gravacao=None, ate_a_gravacao=None, colunas=COLUNAS):
+    """Monta o SELECT do histórico com os filtros pedidos. Datas são `datetime` (ou `date`).
+
+    Sem `tipada`, as colunas são as de `colunas` (nomes de _EXPRESSOES_CSV), já formatadas para o CSV.
+
+    `depois_da_gravacao`/`ate_a_gravacao` (consultas.id_gravacao, ver migracoes v3) delimitam a
+    exportação incremental: (depois_da_gravacao, ate_a_gravacao].
     """
-    Lê os dados do banco SQLite e os exporta para um arquivo CSV.
+    condicoes, parametros = [], []
+    if depois_da_gravacao is not None:
+        condicoes.append("c.id_gravacao > ?")
+        parametros.append(depois_da_gravacao)
+    if ate_a_gravacao is not None:
+        condicoes.append("c.id_gravacao <= ?")
+        parametros.append(ate_a_gravacao)
+    if data_inicio is not None:
+        condicoes.append("c.data_consulta >= ?")
+        parametros.append(int(_para_datetime(data_inicio).timestamp()))
+    if data_fim is not None:
+        condicoes.append("c.data_consulta < ?")
+        parametros.append(int(_para_datetime(data_fim).timestamp()))
+    if jogo is not None:
+        condicoes.append("j.nome = ?")
+        parametros.append(jogo)
+    if loja is not None:
+        condicoes.append("l.nome = ?")
+        parametros.append(loja)
+    colunas_sql = _SQL_COLUNAS_TIPADAS if tipada else "SELECT " + ", ".join(_EXPRESSOES_CSV[c] for c in colunas)
+    sql = colunas_sql + (_SQL_DO_ULTIMO_PRECO if somente_ultimo_preco else _SQL_DE_TODAS) + _SQL_DIMENSOES
+    if condicoes:
+        sql += " WHERE " + " AND ".join(condicoes)
+    return sql, parametros
+
+
+def _para_datetime(data):
+    if isinstance(data, datetime):
+        return data
+    return datetime(data.year, data.month, data.day)
+
+
+def _abrir_saida(caminho, compressao):
+    """Abre o arquivo de saída em modo texto, com compressão gzip/zstd se pedida."""
+    if compressao == 'gzip':
+        return gzip.open(caminho, 'wt', newline='', encoding='utf-8')
+    if compressao == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Compressão zstd requer o pacote 'zstandard' (pip install zstandard).")
+        arquivo = open(caminho, 'wb')
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(arquivo), newline='', encoding='utf-8')
+    return open(caminho, 'w', newline='', encoding='utf-8')
+
+
+def _compressao_pela_extensao(caminho):
+    if caminho.endswith('.gz'):
+        return 'gzip'
+    if caminho.endswith('.zst'):
+        return 'zstd'
+    return None
+
+
+def iterar_lotes(conn, sql, parametros=(), tamanho_lote=TAMANHO_LOTE):
+    """Executa `sql` e devolve as linhas em lotes de `tamanho_lote` (fetchmany), sem carregar tudo."""
+    cursor = conn.execute(sql, parametros)
+    try:
+        while True:
+            lote = cursor.fetchmany(tamanho_lote)
+            if not lote:
+                break
+            yield lote
+    finally:
+        # A conexão é a da thread (banco.conectar) e continua aberta: a leitura não pode ficar pendurada nela
+        cursor.close()
+
+
+def exportar_para_csv(caminho=CSV_FILE, compressao=None, data_inicio=None, data_fim=None, jogo=None, loja=None,
+                      somente_ultimo_preco=False, tamanho_lote=TAMANHO_LOTE, progresso=None, colunas_estendidas=False):
     """
+    Lê os dados do banco SQLite e os exporta para um arquivo CSV, em lotes.
+
+    A memória usada não depende do tamanho do histórico: as linhas são lidas com fetchmany e
+    escritas no arquivo conforme chegam. `compressao` pode ser None, 'gzip' ou 'zstd' (se não
+    informada, vem da extensão: .gz/.zst). `progresso`, se informado, é chamado com o total de
+    linhas escritas após cada lote (útil para a GUI). As colunas são as do CSV original (COLUNAS);
+    `colunas_estendidas=True` acrescenta o jogo monitorado e o id da ITAD. Retorna o número de linhas exportadas.
+    """
+    colunas = COLUNAS_ESTENDIDAS if colunas_estendidas else COLUNAS
+    if compressao is None:
+        compressao = _compressao_pela_extensao(caminho)
+    total = 0
     try:
-        # 1. Conecta ao banco de dados
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        # 1. Usa a conexão desta thread com o banco (quem chamou continua usando depois)
+        conn = banco.conectar(DB_FILE)
+        migracoes.migrar(conn) # Bancos antigos são convertidos para o esquema atual antes de exportar
 
-        # 2. Executa a consulta para pegar todos os dados do histórico
+        # 2. Monta a consulta com os filtros pedidos
         print(f"Lendo dados do banco de dados '{DB_FILE}'...")
-        cursor.execute("SELECT * FROM historico_precos")
-        
-        # 3. Pega os nomes das colunas (cabeçalho)
-        headers = [description[0] for description in cursor.description]
-        
-        # 4. Pega todas as linhas de dados
-        rows = cursor.fetchall()
-
-        if not rows:
-            print("O banco de dados de histórico está vazio. Nada para exportar.")
-            return
-
-        # 5. Escreve os dados no arquivo CSV
-        print(f"Escrevendo {len(rows)} registros no arquivo '{CSV_FILE}'...")
-        with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
+        sql, parametros = _montar_consulta(data_inicio, data_fim, jogo, loja, somente_ultimo_preco, colunas=colunas)
+
+        # 3. Escreve os dados no arquivo conforme são lidos
+        with _abrir_saida(caminho, compressao) as f:
             writer = csv.writer(f)
-            
-            # Escreve o cabeçalho
-            writer.writerow(headers)
-            
-            # Escreve todas as linhas de dados
-            writer.writerows(rows)
-        
-        print(f"\n✅ Exportação concluída com sucesso! O arquivo '{CSV_FILE}' foi criado.")
+            writer.writerow(colunas)
+            for lote in iterar_lotes(conn, sql, parametros, tamanho_lote):
+                writer.writerows(lote)
+                total += len(lote)
+                if progresso:
+                    progresso(total)
+
+        if not total:
+            print("Nenhum registro encontrado no histórico com esses filtros. O arquivo contém só o cabeçalho.")
+        else:
+            print(f"\n✅ Exportação concluída com sucesso! {total} registros escritos em '{caminho}'.")
+
+    except sqlite3.OperationalError as e:
+        print(f"ERRO: Ocorreu um erro ao acessar o banco de dados. Ele existe? Detalhes: {e}")
+    except Exception as e:
+        print(f"ERRO: Ocorreu um erro inesperado: {e}")
+    return total
+
+
+# --- FORMATOS PARA ANÁLISE (parquet / arrow / ndjson) ---
+
+FORMATOS = ('parquet', 'arrow', 'ndjson')
+_EXTENSOES = {'parquet': '.parquet', 'arrow': '.arrow', 'ndjson': '.ndjson'}
+ARQUIVO_MARCA = "_marca.json" # Guarda, dentro da pasta exportada, a última gravação (id_gravacao) já exportada
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Os formatos parquet/arrow requerem o pacote 'pyarrow' (pip install pyarrow).")
+    return pyarrow
+
+
+def _esquema_arrow(pa):
+    """Colunas tipadas: datas como timestamp, preço como decimal e loja codificada em dicionário."""
+    return pa.schema([
+        ('id', pa.int64()),
+        ('id_jogo_monitorado', pa.int64()),
+        ('jogo_monitorado', pa.string()),
+        ('id_itad', pa.string()),
+        ('nome_item', pa.string()),
+        ('preco', pa.decimal128(12, 2)),
+        ('loja', pa.dictionary(pa.int32(), pa.string())),
+        ('link', pa.string()),
+        ('validade_oferta', pa.timestamp('s', tz='UTC')),
+        ('data_consulta', pa.timestamp('s', tz='UTC')),
+    ])
+
+
+def _lote_arrow(pa, esquema, linhas):
+    colunas = list(zip(*linhas))
+    return pa.RecordBatch.from_arrays([
+        pa.array(colunas[0], pa.int64()),
+        pa.array(colunas[1], pa.int64()),
+        pa.array(colunas[2], pa.string()),
+        pa.array(colunas[3], pa.string()),
+        pa.array(colunas[4], pa.string()),
+        pa.array([Decimal(centavos).scaleb(-2) for centavos in colunas[5]], pa.decimal128(12, 2)),
+        pa.array(colunas[6], pa.string()).dictionary_encode(),
+        pa.array(colunas[7], pa.string()),
+        pa.array(colunas[8], pa.timestamp('s', tz='UTC')),
+        pa.array(colunas[9], pa.timestamp('s', tz='UTC')),
+    ], schema=esquema)
+
+
+def _linha_json(linha):
+    id_, id_jogo, jogo, id_itad, nome_item, centavos, loja, link, validade, data_consulta = linha
+    return json.dumps({
+        'id': id_, 'id_jogo_monitorado': id_jogo, 'jogo_monitorado': jogo, 'id_itad': id_itad,
+        'nome_item': nome_item, 'preco': f"{centavos / 100:.2f}", 'loja': loja, 'link': link,
+        'validade_oferta': datetime.fromtimestamp(validade, timezone.utc).isoformat() if validade is not None else None,
+        'data_consulta': datetime.fromtimestamp(data_consulta, timezone.utc).isoformat(),
+    }, ensure_ascii=False)
+
+
+def _chave_particao(linha, particionar_por):
+    if particionar_por == 'mes':
+        return 'mes=' + datetime.fromtimestamp(linha[9], timezone.utc).strftime('%Y-%m')
+    if particionar_por == 'jogo':
+        return f'id_jogo_monitorado={linha[1]}'
+    return ''
+
+
+class _Escritores:
+    """Um arquivo aberto por partição; cada exportação grava um arquivo novo (parte-<início>-<fim>)."""
+
+    def __init__(self, pasta, formato, nome_parte):
+        self.pasta, self.formato, self.nome_parte = pasta, formato, nome_parte
+        self._abertos = {}
+        if formato != 'ndjson':
+            self._pa = _pyarrow()
+            self._esquema = _esquema_arrow(self._pa)
+
+    def _abrir(self, particao):
+        pasta = os.path.join(self.pasta, particao) if particao else self.pasta
+        os.makedirs(pasta, exist_ok=True)
+        caminho = os.path.join(pasta, self.nome_parte + _EXTENSOES[self.formato])
+        if self.formato == 'ndjson':
+            return open(caminho, 'w', encoding='utf-8')
+        if self.formato == 'parquet':
+            return self._pa.parquet.ParquetWriter(caminho, self._esquema)
+        return self._pa.ipc.new_file(caminho, self._esquema)
+
+    def escrever(self, particao, linhas):
+        escritor = self._abertos.get(particao)
+        if escritor is None:
+            escritor = self._abertos[particao] = self._abrir(particao)
+        if self.formato == 'ndjson':
+            escritor.write("\n".join(_linha_json(linha) for linha in linhas) + "\n")
+        else:
+            escritor.write_batch(_lote_arrow(self._pa, self._esquema, linhas))
+
+    def fechar(self):
+        for escritor in self._abertos.values():
+            escritor.close()
+        self._abertos.clear()
+
+
+def _ler_marca(pasta):
+    try:
+        with open(os.path.join(pasta, ARQUIVO_MARCA), 'r', encoding='utf-8') as f:
+            marca = json.load(f)
+    except FileNotFoundError:
+        return None
+    return marca.get('id_gravacao')
+
+
+def _gravar_marca(pasta, id_gravacao):
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, ARQUIVO_MARCA)
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'id_gravacao': id_gravacao}, f)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def exportar_para_analise(pasta=PASTA_EXPORTACAO, formato='parquet', particionar_por=None, incremental=False,
+                          data_inicio=None, data_fim=None, jogo=None, loja=None, somente_ultimo_preco=False,
+                          tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Exporta o histórico para `pasta` em parquet, arrow (IPC) ou ndjson, em lotes (record batches).
+
+    `particionar_por` pode ser None, 'mes' ou 'jogo' (subpastas no estilo mes=2025-01/).
+    Com `incremental=True`, só as consultas gravadas no banco depois da última exportação para a
+    mesma pasta são escritas, em um arquivo de parte novo. A marca (em _marca.json) segue a ordem
+    dos commits, não a data da consulta: uma consulta que ainda estava no buffer de gravação durante
+    uma exportação entra na seguinte. Retorna o número de linhas exportadas.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}. Use um de {', '.join(FORMATOS)}.")
+    total = 0
+    escritores = None
+    try:
+        conn = banco.conectar(DB_FILE)
+        migracoes.migrar(conn)
+
+        # A marca nova é fixada antes da leitura: o que chegar durante a exportação fica para a próxima
+        marca_nova = conn.execute("SELECT MAX(id_gravacao) FROM consultas").fetchone()[0]
+        marca_anterior = _ler_marca(pasta) if incremental else None
+        if marca_nova is None or (marca_anterior is not None and marca_nova <= marca_anterior):
+            print("Nada novo para exportar.")
+            return 0
+
+        print(f"Lendo dados do banco de dados '{DB_FILE}'...")
+        sql, parametros = _montar_consulta(data_inicio, data_fim, jogo, loja, somente_ultimo_preco, tipada=True,
+                                           depois_da_gravacao=marca_anterior, ate_a_gravacao=marca_nova)
+        escritores = _Escritores(pasta, formato, f"parte-{marca_anterior or 0}-{marca_nova}")
+        for lote in iterar_lotes(conn, sql, parametros, tamanho_lote):
+            if particionar_por:
+                por_particao = {}
+                for linha in lote:
+                    por_particao.setdefault(_chave_particao(linha, particionar_por), []).append(linha)
+                for particao, linhas in por_particao.items():
+                    escritores.escrever(particao, linhas)
+            else:
+                escritores.escrever('', lote)
+            total += len(lote)
+            if progresso:
+                progresso(total)
+        escritores.fechar()
+
+        if incremental:
+            _gravar_marca(pasta, marca_nova)
+        print(f"\n✅ Exportação concluída com sucesso! {total} registros escritos em '{pasta}' ({formato}).")
 
     except sqlite3.OperationalError as e:
         print(f"ERRO: Ocorreu um erro ao acessar o banco de dados. Ele existe? Detalhes: {e}")
     except Exception as e:
         print(f"ERRO: Ocorreu um erro inesperado: {e}")
     finally:
-        # Garante que a conexão com o banco seja fechada
-        if 'conn' in locals() and conn:
-            conn.close()
+        if escritores is not None:
+            escritores.fechar()
+    return total
+
+
+def _data_argumento(valor):
+    return datetime.strptime(valor, '%Y-%m-%d')
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Exporta o histórico de preços para CSV, Parquet, Arrow ou NDJSON.",
+                                     epilog="Dependências opcionais (requirements-opcionais.txt): parquet e arrow "
+                                            "requerem pyarrow; zstd requer zstandard.")
+    parser.add_argument('-f', '--formato', choices=('csv',) + FORMATOS, default='csv',
+                        help="parquet e arrow requerem o pacote pyarrow")
+    parser.add_argument('-o', '--saida', help="arquivo CSV (.csv, .csv.gz ou .csv.zst) ou pasta (demais formatos)")
+    parser.add_argument('--compressao', choices=['gzip', 'zstd'],
+                        help="força a compressão (padrão: pela extensão); zstd requer o pacote zstandard")
+    parser.add_argument('--de', type=_data_argumento, help="só consultas a partir desta data (AAAA-MM-DD)")
+    parser.add_argument('--ate', type=_data_argumento, help="só consultas antes desta data (AAAA-MM-DD)")
+    parser.add_argument('--jogo', help="nome do jogo monitorado")
+    parser.add_argument('--loja', help="nome da loja")
+    parser.add_argument('--ultimo-preco', action='store_true', help="só o preço mais recente de cada item")
+    parser.add_argument('--colunas-estendidas', action='store_true',
+                        help="CSV com as colunas jogo_monitorado e id_itad além das do arquivo original")
+    parser.add_argument('--particionar-por', choices=['mes', 'jogo'], help="subpastas por mês ou por jogo (não CSV)")
+    parser.add_argument('--incremental', action='store_true', help="só o que chegou desde a última exportação (não CSV)")
+    return parser.parse_args()
 
 # --- BLOCO PRINCIPAL ---
 if __name__ == "__main__":
-    exportar_para_csv()
\ No newline at end of file
+    args = _argumentos()
+    mostrar_progresso = lambda total: print(f"  ... {total} registros escritos", end='\r')
+    if args.formato == 'csv':
+        exportar_para_csv(args.saida or CSV_FILE, args.compressao, args.de, args.ate, args.jogo, args.loja,
+                          args.ultimo_preco, progresso=mostrar_progresso, colunas_estendidas=args.colunas_estendidas)
+    else:
+        exportar_para_analise(args.saida or PASTA_EXPORTACAO, args.formato, args.particionar_por, args.incremental,
+                              args.de, args.ate, args.jogo, args.loja, args.ultimo_preco, progresso=mostrar_progresso)
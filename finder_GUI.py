@@ -2,12 +2,32 @@
 
 import PySimpleGUI as sg
 import backend # Importa nosso arquivo com toda a lógica
+import api_itad
+import banco
+import historico
+import alertas
+import metricas
 import json
+import threading
+
+# --- CONFIGURAÇÃO ---
+ESPERA_AO_FECHAR = 1.0 # Segundos que a janela espera a atualização em andamento terminar ao ser fechada
+# --- FIM DA CONFIGURAÇÃO ---
 
 # --- Inicialização ---
 sg.theme('DarkTeal9') 
 backend.setup_database() # Garante que o DB e as tabelas existam
 
+def aplicar_config_paises(config):
+    """Países consultados e cotações usadas na comparação entre regiões (chaves "PAISES" e "COTACOES")."""
+    backend.PAISES = list(config.get('PAISES') or backend.PAISES)
+    backend.COTACOES = dict(config.get('COTACOES') or {})
+
+try:
+    with open('config.json', 'r') as f: aplicar_config_paises(json.load(f))
+except (OSError, ValueError):
+    pass # Sem config.json ainda: a atualização avisa quando for usada
+
 # --- Funções de Apoio para a GUI ---
 def atualizar_lista_jogos(window):
     """Lê os jogos do DB e atualiza o dropdown na janela."""
@@ -17,16 +37,109 @@ def atualizar_lista_jogos(window):
     window['-LISTA_JOGOS-'].update(values=lista_formatada)
     return jogos_no_db
 
+def avisar_janela(window, evento, valor):
+    """write_event_value que tolera a janela já fechada (a atualização pode terminar depois do laço de eventos)."""
+    if window.was_closed():
+        return
+    try:
+        window.write_event_value(evento, valor)
+    except Exception:
+        pass # Fechada entre a verificação e o envio: não há mais quem receba o evento
+
+def executar_atualizacao(window, cancelar, API_KEY, max_simultaneos, modo_armazenamento, saidas_alerta, dias_catalogo,
+                         perfil=None, arquivo_metricas=None, paises=None):
+    """Roda a atualização em uma thread separada; o progresso chega ao laço de eventos via write_event_value.
+
+    Com `perfil`, a atualização roda sob o cProfile; com `arquivo_metricas`, as métricas do processo
+    são gravadas no formato do Prometheus ao final. `paises` (o primeiro é o principal) vem de backend.PAISES.
+    """
+    paises = paises or backend.PAISES
+    try:
+        with metricas.perfilar(perfil):
+            for status_update in backend.buscar_e_salvar_precos(
+                    API_KEY, paises[0], max_simultaneos, modo_armazenamento, saidas_alerta, cancelar=cancelar,
+                    dias_catalogo=dias_catalogo, outros_paises=paises[1:],
+                    progresso=lambda feitos, total: avisar_janela(window, '-PROGRESSO-', (feitos, total))):
+                avisar_janela(window, '-STATUS_ATUALIZACAO-', status_update)
+        if arquivo_metricas:
+            metricas.gravar_prometheus(arquivo_metricas)
+    except Exception as e:
+        avisar_janela(window, '-STATUS_ATUALIZACAO-', f"!!! ERRO ao atualizar preços: {e}")
+    finally:
+        banco.fechar_conexao(backend.DB_FILE) # A conexão é desta thread, que termina aqui
+        avisar_janela(window, '-ATUALIZACAO_FIM-', None)
+
+def carregar_pagina_historico(window, paginacao, values):
+    """Mostra a página `paginacao['pagina']` do jogo selecionado; cada página vem do banco só quando pedida.
+
+    Os cursores só valem para a ordem e os filtros com que foram obtidos: se eles mudaram desde a
+    última página mostrada, a paginação recomeça da primeira página.
+    """
+    filtros = (values['-ORDEM-'] != 'Mais antigos', values['-FILTRO_LOJA-'].strip() or None,
+               values['-FILTRO_ITEM-'].strip() or None)
+    if paginacao.get('filtros') != filtros:
+        paginacao.update(pagina=0, cursores=[None], filtros=filtros)
+    mais_recentes_primeiro, loja, texto_item = filtros
+    linhas, proximo = backend.consultar_historico_pagina(
+        paginacao['id_jogo'], depois_de=paginacao['cursores'][paginacao['pagina']],
+        mais_recentes_primeiro=mais_recentes_primeiro, loja=loja, texto_item=texto_item)
+    # cursores[n] é o cursor que abre a página n (None na primeira)
+    del paginacao['cursores'][paginacao['pagina'] + 1:]
+    if proximo is not None:
+        paginacao['cursores'].append(proximo)
+    window['-TABELA_HISTORICO-'].update(values=linhas)
+    window['-PAGINA-'].update(f"Página {paginacao['pagina'] + 1}")
+    window['◀ Anterior'].update(disabled=paginacao['pagina'] == 0)
+    window['Próxima ▶'].update(disabled=proximo is None)
+
+def formatar_regras(id_jogo):
+    regras = backend.obter_regras_alerta(id_jogo)
+    return 'Alertas: ' + ', '.join(f"{tipo} {valor}".strip() for _, tipo, valor in regras) if regras else ''
+
+def formatar_estatisticas(estatisticas):
+    """Resumo das estatísticas do jogo, mostrado acima da tabela de histórico."""
+    if not estatisticas:
+        return 'Sem ofertas registradas para este jogo ainda.'
+    jogo = estatisticas['jogo']
+    return (f"Menor preço histórico: {jogo['menor_preco']} ({jogo['item_menor_preco']}, {jogo['loja_menor_preco']}, "
+            f"{jogo['data_menor_preco']})   Atual: {jogo['preco_atual']} ({jogo['loja_atual']})\n"
+            f"Média 30 dias: {jogo['media_30_dias']}   Média 90 dias: {jogo['media_90_dias']}   "
+            f"Observações: {jogo['observacoes']}")
+
+def formatar_comparacao_paises(comparacao, limite=3):
+    """Os itens que mais compensam comprar em outro país (só aparece com mais de um país em "PAISES")."""
+    itens = [c for c in comparacao if c['pais'] != backend.PAISES[0] and c['economia_percentual']][:limite]
+    if not itens:
+        return ''
+    return 'Mais barato fora: ' + '   '.join(
+        f"{c['nome_item']} no {c['pais']} por {c['preco']} (~{c['preco_convertido']}, {c['economia_percentual']}% abaixo)"
+        for c in itens)
+
 # --- Layout da Janela ---
 layout_controle = [
     [sg.Text('Adicionar novo jogo para monitorar:')],
-    [sg.Input(key='-NOME_JOGO-', size=(40,1)), sg.Button('Adicionar')],
-    [sg.Button('ATUALIZAR PREÇOS DA INTERNET', size=(38, 2), button_color=('white', 'SeaGreen'))]
+    [sg.Input(key='-NOME_JOGO-', size=(40,1), enable_events=True), sg.Button('Adicionar')],
+    [sg.Listbox([], key='-SUGESTOES-', size=(48, 5), enable_events=True,
+                tooltip='Sugestões locais; ✓ = já monitorado')],
+    [sg.Button('ATUALIZAR PREÇOS DA INTERNET', size=(38, 2), button_color=('white', 'SeaGreen'))],
+    [sg.ProgressBar(100, orientation='h', size=(26, 15), key='-PROGRESSO-'), sg.Button('Cancelar', disabled=True)],
+    [sg.Button('Refazer buscas na ITAD', tooltip='Descarta o catálogo local: a próxima atualização busca todos os jogos de novo')]
 ]
 
 layout_consulta = [
     [sg.Text('Consultar histórico de um jogo:')],
     [sg.Combo([], key='-LISTA_JOGOS-', size=(38,1), enable_events=True, readonly=True)],
+    [sg.Text('', key='-ESTATISTICAS-', size=(100, 2))],
+    [sg.Text('', key='-PAISES-', size=(100, 1))],
+    [sg.Text('Alerta:'), sg.Combo(list(alertas.TIPOS), default_value=alertas.PRECO_ALVO, key='-TIPO_ALERTA-', readonly=True),
+     sg.Input(key='-VALOR_ALERTA-', size=(8,1), tooltip='Preço alvo em R$ ou % abaixo da média'),
+     sg.Button('Criar alerta'), sg.Text('', key='-REGRAS_ALERTA-', size=(60, 1))],
+    [sg.Text('Filtrar item:'), sg.Input(key='-FILTRO_ITEM-', size=(20,1)),
+     sg.Text('Loja:'), sg.Input(key='-FILTRO_LOJA-', size=(12,1)),
+     sg.Combo(['Mais recentes', 'Mais antigos'], default_value='Mais recentes', key='-ORDEM-', readonly=True,
+              enable_events=True),
+     sg.Button('Filtrar'), sg.Button('◀ Anterior', disabled=True), sg.Button('Próxima ▶', disabled=True),
+     sg.Text('', key='-PAGINA-', size=(12, 1))],
     [sg.Table(values=[], headings=['Data', 'Item', 'Preço', 'Loja', 'Validade', 'Link'],
               key='-TABELA_HISTORICO-',
               auto_size_columns=False,
@@ -52,12 +165,20 @@ layout = [
 # --- Criação da Janela ---
 window = sg.Window('Finder v2.0 - Monitor de Preços de Jogos', layout, finalize=True)
 jogos_mapeados = atualizar_lista_jogos(window) # Popula o dropdown e guarda o mapeamento nome -> id
+paginacao = None # Jogo selecionado, página atual e cursores das páginas já visitadas
+atualizacao = None # Thread da atualização em andamento (se houver)
+cancelar_atualizacao = threading.Event()
 
 # --- Loop de Eventos da Janela ---
 while True:
     event, values = window.read()
 
     if event == sg.WIN_CLOSED:
+        if atualizacao is not None and atualizacao.is_alive():
+            # Pede para parar e dá um instante para a thread gravar o que já tinha obtido; a janela não
+            # fica presa esperando uma requisição lenta (a thread é daemon e os avisos dela são ignorados)
+            cancelar_atualizacao.set()
+            atualizacao.join(timeout=ESPERA_AO_FECHAR)
         break
 
     if event == 'Adicionar':
@@ -65,31 +186,100 @@ while True:
         resultado = backend.adicionar_novo_jogo(nome_jogo)
         print(f'-> {resultado}')
         window['-NOME_JOGO-'].update('') # Limpa o campo de texto
+        window['-SUGESTOES-'].update([])
         jogos_mapeados = atualizar_lista_jogos(window)
 
+    if event == '-NOME_JOGO-':
+        # Busca enquanto digita: só o índice local, sem rede
+        sugestoes = backend.sugerir_jogos(values['-NOME_JOGO-'])
+        window['-SUGESTOES-'].update([f"✓ {nome}" if monitorado else nome for nome, monitorado in sugestoes])
+
+    if event == '-SUGESTOES-' and values['-SUGESTOES-']:
+        window['-NOME_JOGO-'].update(values['-SUGESTOES-'][0].removeprefix('✓ '))
+
     if event == 'ATUALIZAR PREÇOS DA INTERNET':
         try:
             with open('config.json', 'r') as f: config = json.load(f)
             API_KEY = config.get('API_KEY')
             if not API_KEY or "sua_chave" in API_KEY:
                 print("!!! ERRO: Chave da API não configurada no 'config.json'.")
-            else:
+            elif atualizacao is None or not atualizacao.is_alive():
+                api_itad.configurar_limite(config.get('REQUISICOES_POR_SEGUNDO', api_itad.REQUISICOES_POR_SEGUNDO))
+                max_simultaneos = config.get('MAX_REQUISICOES_SIMULTANEAS', backend.MAX_REQUISICOES_SIMULTANEAS)
+                api_itad.configurar_sessao(tamanho_pool=max(max_simultaneos, api_itad.TAMANHO_POOL_CONEXOES),
+                                           timeout_conexao=config.get('TIMEOUT_CONEXAO', api_itad.TIMEOUT_CONEXAO),
+                                           timeout_leitura=config.get('TIMEOUT_LEITURA', api_itad.TIMEOUT_LEITURA))
+                modo_armazenamento = config.get('MODO_ARMAZENAMENTO', historico.MODO_ARMAZENAMENTO)
+                aplicar_config_paises(config)
+                saidas_alerta = alertas.criar_saidas(config.get('ALERTAS'))
+                # A janela continua respondendo (e consultando o histórico) enquanto a thread trabalha
+                cancelar_atualizacao.clear()
+                atualizacao = threading.Thread(target=executar_atualizacao, daemon=True,
+                                               args=(window, cancelar_atualizacao, API_KEY, max_simultaneos,
+                                                     modo_armazenamento, saidas_alerta,
+                                                     config.get('DIAS_CATALOGO', backend.DIAS_CATALOGO),
+                                                     metricas.caminho_do_perfil(config), config.get('METRICAS_ARQUIVO')))
                 window['ATUALIZAR PREÇOS DA INTERNET'].update(disabled=True)
-                # O laço for vai imprimir o status em tempo real na janela
-                for status_update in backend.buscar_e_salvar_precos(API_KEY, "BR"):
-                    print(status_update)
-                    window.refresh()
-                window['ATUALIZAR PREÇOS DA INTERNET'].update(disabled=False)
+                window['Cancelar'].update(disabled=False)
+                window['-PROGRESSO-'].update(0, 100)
+                atualizacao.start()
         except Exception as e:
             print(f"!!! ERRO ao ler config.json ou ao atualizar preços: {e}")
-            window['ATUALIZAR PREÇOS DA INTERNET'].update(disabled=False)
+
+    if event == 'Refazer buscas na ITAD':
+        backend.invalidar_catalogo()
+        print('-> Catálogo local descartado. A próxima atualização vai buscar todos os jogos na ITAD.')
+
+    if event == 'Cancelar':
+        cancelar_atualizacao.set()
+        window['Cancelar'].update(disabled=True)
+        print('-> Cancelando a atualização...')
+
+    if event == '-STATUS_ATUALIZACAO-':
+        print(values[event])
+
+    if event == '-PROGRESSO-':
+        feitos, total = values[event]
+        window['-PROGRESSO-'].update(feitos, max(total, 1))
+
+    if event == '-ATUALIZACAO_FIM-':
+        atualizacao = None
+        window['ATUALIZAR PREÇOS DA INTERNET'].update(disabled=False)
+        window['Cancelar'].update(disabled=True)
 
 
     if event == '-LISTA_JOGOS-':
         nome_selecionado = values['-LISTA_JOGOS-']
         if nome_selecionado:
             id_jogo_selecionado = [id_jogo for id_jogo, nome in jogos_mapeados if nome == nome_selecionado][0]
-            historico = backend.consultar_historico(id_jogo_selecionado)
-            window['-TABELA_HISTORICO-'].update(values=historico)
+            paginacao = {'id_jogo': id_jogo_selecionado, 'pagina': 0, 'cursores': [None]}
+            carregar_pagina_historico(window, paginacao, values)
+            window['-ESTATISTICAS-'].update(formatar_estatisticas(backend.obter_estatisticas(id_jogo_selecionado)))
+            window['-PAISES-'].update(formatar_comparacao_paises(backend.obter_comparacao_paises(id_jogo_selecionado)))
+            window['-REGRAS_ALERTA-'].update(formatar_regras(id_jogo_selecionado))
+
+    if event in ('Filtrar', '-ORDEM-', '◀ Anterior', 'Próxima ▶') and paginacao is not None:
+        if event in ('Filtrar', '-ORDEM-'):
+            paginacao.update(pagina=0, cursores=[None])
+        elif event == '◀ Anterior':
+            paginacao['pagina'] = max(0, paginacao['pagina'] - 1)
+        elif paginacao['pagina'] + 1 < len(paginacao['cursores']):
+            paginacao['pagina'] += 1
+        carregar_pagina_historico(window, paginacao, values)
+
+    if event == 'Criar alerta':
+        nome_selecionado = values['-LISTA_JOGOS-']
+        if not nome_selecionado:
+            print('-> Selecione um jogo para criar o alerta.')
+        else:
+            id_jogo_selecionado = [id_jogo for id_jogo, nome in jogos_mapeados if nome == nome_selecionado][0]
+            valor = values['-VALOR_ALERTA-'].replace('R$', '').replace('%', '').replace(',', '.').strip() or None
+            try:
+                print(f"-> {backend.adicionar_regra_alerta(id_jogo_selecionado, values['-TIPO_ALERTA-'], valor)}")
+            except ValueError:
+                print(f"-> Valor inválido para o alerta: {values['-VALOR_ALERTA-']}")
+            window['-VALOR_ALERTA-'].update('')
+            window['-REGRAS_ALERTA-'].update(formatar_regras(id_jogo_selecionado))
 
-window.close()
\ No newline at end of file
+window.close()
+banco.fechar_todas()
\ No newline at end of file
@@ -1,13 +1,17 @@
 import requests
-import time
 import json # Importa a biblioteca para trabalhar com JSON
 from datetime import datetime
+import api_itad
+
+PAIS = "BR" # Padrão; com "PAISES" no config.json, vale o primeiro da lista (o país principal)
 
 # --- NOVO: CARREGANDO CONFIGURAÇÃO DO ARQUIVO JSON ---
 try:
     with open('config.json', 'r') as f:
         config = json.load(f)
         API_KEY = config.get('API_KEY')
+        PAIS = (config.get('PAISES') or [PAIS])[0]
+        api_itad.configurar_limite(config.get('REQUISICOES_POR_SEGUNDO', api_itad.REQUISICOES_POR_SEGUNDO))
 except FileNotFoundError:
     print("ERRO: O arquivo 'config.json' não foi encontrado. Crie o arquivo com sua API Key.")
     API_KEY = None
@@ -17,16 +21,10 @@ except json.JSONDecodeError:
 # --- FIM DA NOVA SEÇÃO DE CONFIGURAÇÃO ---
 
 
-PAIS = "BR"
-
-
 def buscar_jogos_e_dlcs(nome_base_do_jogo: str) -> list:
     print(f"\nBuscando por '{nome_base_do_jogo}' e seus conteúdos...")
     try:
-        url_busca = f"https://api.isthereanydeal.com/games/search/v1?key={API_KEY}&title={nome_base_do_jogo}&results=50"
-        resposta_busca = requests.get(url_busca)
-        resposta_busca.raise_for_status()
-        dados_busca = resposta_busca.json()
+        dados_busca = api_itad.buscar_jogos(API_KEY, nome_base_do_jogo)
         
         if not dados_busca:
             print(f"-> Nenhum item encontrado para '{nome_base_do_jogo}'.")
@@ -45,10 +43,7 @@ def obter_precos_para_lista_de_ids(lista_de_ids: list) -> list:
         
     print(f"-> Obtendo preços para {len(lista_de_ids)} itens...")
     try:
-        url_precos = f"https://api.isthereanydeal.com/games/prices/v3?key={API_KEY}&country={PAIS}"
-        resposta_precos = requests.post(url_precos, json=lista_de_ids)
-        resposta_precos.raise_for_status()
-        return resposta_precos.json()
+        return api_itad.obter_precos(API_KEY, PAIS, lista_de_ids)
         
     except requests.exceptions.RequestException as e:
         print(f"-> ERRO DE REDE ao obter preços: {e}")
@@ -95,8 +90,6 @@ if __name__ == "__main__":
                             "validade_oferta": validade_str,
                             "link_da_oferta": oferta_mais_barata['url']
                         })
-            
-            time.sleep(1)
         
         resultados_ordenados = sorted(resultados_finais, key=lambda x: x['preco'])
         
@@ -1,106 +1,82 @@
 import requests
-import time
 import json
-from datetime import datetime, timedelta
-import sqlite3
+import time
+from datetime import datetime
+import api_itad
+import banco
+import cache_resultados
+import migracoes
+import historico
+import normalizacao
 
 # --- CONFIGURAÇÃO ---
 DB_FILE = "historico_de_precos.db"
 HORAS_CACHE = 24 # Define que um resultado é considerado "recente" por até 24 horas
+PAIS = "BR" # Padrão; com "PAISES" no config.json, vale o primeiro da lista (o país principal)
 # --- FIM DA CONFIGURAÇÃO ---
 
-def normalizar_nome_jogo(nome: str) -> str:
-    """Limpa e padroniza o nome de um jogo para busca e cache."""
-    nome_normalizado = nome.lower()
-    # Substitui numerais romanos comuns
-    substituicoes = {
-        'iv': '4', 'iii': '3', 'ii': '2', 'v': '5', 'vi': '6', 
-        'vii': '7', 'viii': '8', 'ix': '9', 'x': '10'
-    }
-    # Divide em palavras para substituir apenas o numeral isolado (ex: "iv" e não o "iv" em "drive")
-    palavras = nome_normalizado.split()
-    palavras_substituidas = []
-    for p in palavras:
-        palavras_substituidas.append(substituicoes.get(p, p))
-    nome_normalizado = " ".join(palavras_substituidas)
-
-    # Remove caracteres especiais
-    caracteres_para_remover = "®™:-"
-    for char in caracteres_para_remover:
-        nome_normalizado = nome_normalizado.replace(char, "")
-    
-    # Remove espaços duplos que possam ter sido criados
-    return " ".join(nome_normalizado.split())
+# A normalização é a mesma do backend (acentos, pontuação e numerais romanos de sequência). Ela só
+# serve de chave do cache e para juntar termos repetidos: a busca na ITAD recebe o texto digitado.
+normalizar_nome_jogo = normalizacao.normalizar_nome_jogo
+
+# Resultados recentes por (termo normalizado, país): LRU em memória na frente da tabela cache_resultados
+cache = cache_resultados.CacheDeResultados(DB_FILE, horas_validade=HORAS_CACHE)
 
 def setup_database():
-    """Cria o banco de dados e a tabela de histórico se não existirem."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS historico_precos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            termo_busca TEXT NOT NULL,
-            nome TEXT NOT NULL,
-            preco REAL NOT NULL,
-            loja TEXT NOT NULL,
-            link TEXT,
-            validade_oferta TEXT,
-            data_consulta TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def consultar_historico_recente(termo_busca_normalizado: str):
-    """Verifica se existe um resultado recente para o termo de busca no banco de dados.
-       Se sim, retorna TODOS os resultados daquela busca."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT MAX(data_consulta) FROM historico_precos WHERE termo_busca = ?", (termo_busca_normalizado,))
-    resultado = cursor.fetchone()
-    
-    if resultado and resultado[0]:
-        data_mais_recente_str = resultado[0]
-        data_mais_recente = datetime.strptime(data_mais_recente_str, '%Y-%m-%d %H:%M:%S')
-        
-        if datetime.now() - data_mais_recente < timedelta(hours=HORAS_CACHE):
-            print(f"\n-> Resultados para '{termo_busca_normalizado}' encontrados no histórico (de {data_mais_recente.strftime('%d/%m às %H:%M')}). Usando cache.")
-            
-            cursor.execute("SELECT nome, preco, loja, link, validade_oferta FROM historico_precos WHERE data_consulta = ?", (data_mais_recente_str,))
-            
-            resultados_do_cache = []
-            for row in cursor.fetchall():
-                nome, preco, loja, link, validade = row
-                resultados_do_cache.append({
-                    "nome": nome,
-                    "preco_mais_baixo": f"R${preco:.2f}",
-                    "loja": loja,
-                    "validade_oferta": validade,
-                    "link_da_oferta": link
-                })
-            conn.close()
-            return resultados_do_cache
-            
-    conn.close()
-    return None
-
-def salvar_no_banco(termo_busca_normalizado, info_jogo):
-    """Salva as informações de uma oferta, incluindo o termo que a originou."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO historico_precos (termo_busca, nome, preco, loja, link, validade_oferta, data_consulta) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                   (termo_busca_normalizado, info_jogo['nome'], info_jogo['preco'], info_jogo['loja'], info_jogo['link_da_oferta'], info_jogo['validade_oferta'], datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-    conn.commit()
-    conn.close()
+    """Cria o banco de dados (ou atualiza um banco antigo) para a versão atual do esquema."""
+    migracoes.migrar(banco.conectar(DB_FILE))
+
+def verificar_indices():
+    """Confere (via EXPLAIN QUERY PLAN) se a consulta do cache está usando a chave primária."""
+    conn = banco.conectar(DB_FILE)
+    return {
+        'cache_resultados': banco.consulta_usa_indice(conn, cache_resultados.SQL_OBTER, ('', '', 0), 'PRIMARY KEY'),
+    }
+
+def consultar_historico_recente(termo_busca_normalizado: str, pais=None):
+    """Retorna os resultados da última busca do termo, se ainda estiverem na validade; senão None.
+
+    Uma lista vazia também é um resultado válido (a busca foi feita e não achou ofertas).
+    """
+    encontrado = cache.obter(termo_busca_normalizado, pais or PAIS)
+    if encontrado is None:
+        return None
+    resultados, criado_em = encontrado
+    print(f"\n-> Resultados para '{termo_busca_normalizado}' encontrados no cache (de {datetime.fromtimestamp(criado_em).strftime('%d/%m às %H:%M')}).")
+    return resultados
+
+def guardar_no_cache(termo_busca_normalizado, ofertas, pais=None):
+    """Guarda as ofertas já formatadas para exibição, só com os campos que a listagem usa."""
+    campos = ("nome", "preco_mais_baixo", "loja", "validade_oferta", "link_da_oferta")
+    cache.guardar(termo_busca_normalizado, pais or PAIS, [{campo: oferta[campo] for campo in campos} for oferta in ofertas])
+
+def salvar_no_banco(termo_busca, ofertas, buffer=None):
+    """Salva as ofertas encontradas para um termo de busca, como uma única consulta no histórico.
+
+    O termo não entra na lista de monitoramento (não é atualizado pelo backend nem pelo agendador).
+    Termos com o mesmo nome normalizado ficam no mesmo registro.
+    Com um `historico.BufferDeEscrita`, a gravação fica para quando o buffer for descarregado.
+    """
+    conn = banco.conectar(DB_FILE)
+    id_termo = banco.obter_id_jogo_monitorado(conn, termo_busca, monitorado=False)
+    ofertas_do_termo = [{
+        'id_itad': info_jogo.get('id_itad'),
+        'nome_item': info_jogo['nome'],
+        'id_loja_itad': info_jogo.get('id_loja_itad'),
+        'loja': info_jogo['loja'],
+        'link': info_jogo['link_da_oferta'],
+        'preco_centavos': round(info_jogo['preco'] * 100),
+        'validade_oferta': info_jogo.get('validade_timestamp'),
+    } for info_jogo in ofertas]
+    if buffer is not None:
+        buffer.adicionar(id_termo, int(time.time()), ofertas_do_termo)
+    else:
+        historico.salvar_observacoes(conn, id_termo, int(time.time()), ofertas_do_termo)
 
 def buscar_jogos_e_dlcs(API_KEY, nome_base_do_jogo: str) -> list:
     print(f"\nBuscando '{nome_base_do_jogo}' na internet...")
     try:
-        url_busca = f"https://api.isthereanydeal.com/games/search/v1?key={API_KEY}&title={nome_base_do_jogo}&results=50"
-        resposta_busca = requests.get(url_busca)
-        resposta_busca.raise_for_status()
-        dados_busca = resposta_busca.json()
+        dados_busca = api_itad.buscar_jogos(API_KEY, nome_base_do_jogo)
         if not dados_busca:
             print(f"-> Nenhum item encontrado para '{nome_base_do_jogo}'.")
             return []
@@ -111,13 +87,12 @@ def buscar_jogos_e_dlcs(API_KEY, nome_base_do_jogo: str) -> list:
         return []
 
 def obter_precos_para_lista_de_ids(API_KEY, PAIS, lista_de_ids: list) -> list:
+    """Obtém os preços sem ids repetidos, em lotes do tamanho máximo aceito pela API."""
     if not lista_de_ids: return []
-    print(f"-> Obtendo preços para {len(lista_de_ids)} itens...")
+    lotes = api_itad.dividir_em_lotes(lista_de_ids)
+    print(f"-> Obtendo preços para {sum(len(lote) for lote in lotes)} itens únicos em {len(lotes)} lote(s)...")
     try:
-        url_precos = f"https://api.isthereanydeal.com/games/prices/v3?key={API_KEY}&country={PAIS}"
-        resposta_precos = requests.post(url_precos, json=lista_de_ids)
-        resposta_precos.raise_for_status()
-        return resposta_precos.json()
+        return api_itad.obter_precos_em_lotes(API_KEY, PAIS, lista_de_ids)
     except requests.exceptions.RequestException as e:
         print(f"-> ERRO DE REDE ao obter preços: {e}")
         return []
@@ -129,6 +104,8 @@ if __name__ == "__main__":
     try:
         with open('config.json', 'r') as f: config = json.load(f)
         API_KEY = config.get('API_KEY')
+        PAIS = (config.get('PAISES') or [PAIS])[0]
+        api_itad.configurar_limite(config.get('REQUISICOES_POR_SEGUNDO', api_itad.REQUISICOES_POR_SEGUNDO))
     except Exception as e:
         print(f"ERRO ao carregar 'config.json': {e}")
         API_KEY = None
@@ -140,38 +117,54 @@ if __name__ == "__main__":
         lista_de_jogos_base = [jogo.strip() for jogo in entrada_usuario.split(',')]
         resultados_finais = []
 
+        buscas_sem_cache = []
+        termos_vistos = set()
         for nome_jogo_original in lista_de_jogos_base:
             if not nome_jogo_original: continue
             
             nome_normalizado = normalizar_nome_jogo(nome_jogo_original)
+            if nome_normalizado in termos_vistos: continue # "Diablo IV, diablo 4" é uma busca só
+            termos_vistos.add(nome_normalizado)
             
             resultados_recentes = consultar_historico_recente(nome_normalizado)
             
-            if resultados_recentes:
+            if resultados_recentes is not None:
                 resultados_finais.extend(resultados_recentes)
                 continue
             
-            jogos_encontrados = buscar_jogos_e_dlcs(API_KEY, nome_normalizado)
+            jogos_encontrados = buscar_jogos_e_dlcs(API_KEY, nome_jogo_original)
             if jogos_encontrados:
-                ids_para_consultar = [jogo['id'] for jogo in jogos_encontrados]
-                lista_de_precos = obter_precos_para_lista_de_ids(API_KEY, "BR", ids_para_consultar)
-                precos_por_id = {item['id']: item for item in lista_de_precos}
-                
-                print(f" -> {len(jogos_encontrados)} itens processados. Salvando ofertas encontradas no histórico...")
-                for jogo in jogos_encontrados:
-                    id_jogo = jogo['id']
-                    if id_jogo in precos_por_id and precos_por_id[id_jogo]['deals']:
-                        oferta_mais_barata = min(precos_por_id[id_jogo]['deals'], key=lambda x: x['price']['amount'])
-                        validade_str = "Sem data definida"
-                        if oferta_mais_barata['expiry']:
-                            data_obj = datetime.fromisoformat(oferta_mais_barata['expiry'])
-                            validade_str = data_obj.strftime('%d/%m/%Y')
-                        
-                        info_oferta = { "nome": jogo['title'], "preco": oferta_mais_barata['price']['amount'], "preco_mais_baixo": f"R${oferta_mais_barata['price']['amount']:.2f}", "loja": oferta_mais_barata['shop']['name'], "validade_oferta": validade_str, "link_da_oferta": oferta_mais_barata['url'] }
-                        resultados_finais.append(info_oferta)
-                        salvar_no_banco(nome_normalizado, info_oferta)
-            
-            time.sleep(1.5)
+                buscas_sem_cache.append((nome_jogo_original, nome_normalizado, jogos_encontrados))
+
+        # Uma única rodada de preços para todos os termos buscados (ids repetidos são consultados uma vez só)
+        ids_para_consultar = [jogo['id'] for _, _, jogos_encontrados in buscas_sem_cache for jogo in jogos_encontrados]
+        lista_de_precos = obter_precos_para_lista_de_ids(API_KEY, PAIS, ids_para_consultar)
+        # Sem nenhum preço de volta para ids que existem é erro de rede: nada vai para o cache
+        precos_obtidos = bool(lista_de_precos) or not ids_para_consultar
+        precos_por_id = {item['id']: item for item in lista_de_precos}
+
+        buffer = historico.BufferDeEscrita(banco.conectar(DB_FILE))
+        for nome_jogo_original, nome_normalizado, jogos_encontrados in buscas_sem_cache:
+            ofertas_do_termo = []
+            print(f" -> '{nome_jogo_original}': {len(jogos_encontrados)} itens processados. Salvando ofertas encontradas no histórico...")
+            for jogo in jogos_encontrados:
+                id_jogo = jogo['id']
+                if id_jogo in precos_por_id and precos_por_id[id_jogo]['deals']:
+                    oferta_mais_barata = min(precos_por_id[id_jogo]['deals'], key=lambda x: x['price']['amount'])
+                    validade_str = "Sem data definida"
+                    validade_timestamp = None
+                    if oferta_mais_barata['expiry']:
+                        data_obj = datetime.fromisoformat(oferta_mais_barata['expiry'])
+                        validade_str = data_obj.strftime('%d/%m/%Y')
+                        validade_timestamp = int(data_obj.timestamp())
+                    
+                    info_oferta = { "nome": jogo['title'], "preco": oferta_mais_barata['price']['amount'], "preco_mais_baixo": f"R${oferta_mais_barata['price']['amount']:.2f}", "loja": oferta_mais_barata['shop']['name'], "validade_oferta": validade_str, "validade_timestamp": validade_timestamp, "link_da_oferta": oferta_mais_barata['url'], "id_itad": id_jogo, "id_loja_itad": oferta_mais_barata['shop'].get('id') }
+                    resultados_finais.append(info_oferta)
+                    ofertas_do_termo.append(info_oferta)
+            salvar_no_banco(nome_jogo_original, ofertas_do_termo, buffer)
+            if precos_obtidos:
+                guardar_no_cache(nome_normalizado, ofertas_do_termo)
+        buffer.descarregar() # Todas as ofertas de todos os termos em uma única transação
         
         def obter_preco_para_ordenar(item):
             preco_str = item.get('preco_mais_baixo', 'R$0').replace('R$', '').replace(',', '.')
@@ -0,0 +1,319 @@
+# historico.py
+# Gravação das ofertas encontradas no histórico de preços (usado pelo backend e pelo finder_V01).
+
+import time
+
+import banco
+import metricas
+
+# 'completo': toda consulta grava uma linha por item com oferta (comportamento original).
+# 'mudancas': só grava uma linha nova quando preço, loja ou validade mudam; caso contrário apenas
+#             estende o visto_ate da linha anterior. A linha do tempo lógica é a mesma nos dois modos.
+MODO_COMPLETO = 'completo'
+MODO_MUDANCAS = 'mudancas'
+MODO_ARMAZENAMENTO = MODO_COMPLETO
+
+# O buffer é gravado quando juntar este número de ofertas ou quando a mais antiga passar deste tempo
+MAX_OFERTAS_NO_BUFFER = 5000
+MAX_SEGUNDOS_NO_BUFFER = 10.0
+
+_TAMANHO_LOTE_IN = 500  # Quantos ids vão em cada "IN (...)" ao carregar estados
+SEGUNDOS_POR_DIA = 86400
+
+# Atualização incremental das estatísticas (migracoes v4): cada observação nova só mexe na linha
+# do item/jogo e no balde do dia, nunca relê o histórico. No UPDATE, as colunas à direita do "="
+# ainda têm os valores antigos, por isso a ordem das atribuições não importa.
+_SQL_ESTATISTICAS_ITEM = '''
+    INSERT INTO estatisticas_itens
+        (id_jogo_monitorado, id_item, menor_preco_centavos, data_menor_preco, id_loja_menor_preco,
+         preco_atual_centavos, id_loja_atual, data_atual, observacoes)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?3, ?5, ?4, 1)
+    ON CONFLICT (id_jogo_monitorado, id_item) DO UPDATE SET
+        menor_preco_centavos = MIN(menor_preco_centavos, excluded.menor_preco_centavos),
+        data_menor_preco = CASE WHEN excluded.menor_preco_centavos < menor_preco_centavos
+                                THEN excluded.data_menor_preco ELSE data_menor_preco END,
+        id_loja_menor_preco = CASE WHEN excluded.menor_preco_centavos < menor_preco_centavos
+                                   THEN excluded.id_loja_menor_preco ELSE id_loja_menor_preco END,
+        preco_atual_centavos = excluded.preco_atual_centavos,
+        id_loja_atual = excluded.id_loja_atual,
+        data_atual = excluded.data_atual,
+        observacoes = observacoes + 1
+'''
+_SQL_ESTATISTICAS_JOGO = '''
+    INSERT INTO estatisticas_jogos
+        (id_jogo_monitorado, menor_preco_centavos, data_menor_preco, id_item_menor_preco, id_loja_menor_preco,
+         preco_atual_centavos, id_item_atual, id_loja_atual, data_atual, observacoes)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?2, ?4, ?5, ?3, 1)
+    ON CONFLICT (id_jogo_monitorado) DO UPDATE SET
+        menor_preco_centavos = MIN(menor_preco_centavos, excluded.menor_preco_centavos),
+        data_menor_preco = CASE WHEN excluded.menor_preco_centavos < menor_preco_centavos
+                                THEN excluded.data_menor_preco ELSE data_menor_preco END,
+        id_item_menor_preco = CASE WHEN excluded.menor_preco_centavos < menor_preco_centavos
+                                   THEN excluded.id_item_menor_preco ELSE id_item_menor_preco END,
+        id_loja_menor_preco = CASE WHEN excluded.menor_preco_centavos < menor_preco_centavos
+                                   THEN excluded.id_loja_menor_preco ELSE id_loja_menor_preco END,
+        preco_atual_centavos = excluded.preco_atual_centavos,
+        id_item_atual = excluded.id_item_atual,
+        id_loja_atual = excluded.id_loja_atual,
+        data_atual = excluded.data_atual,
+        observacoes = observacoes + 1
+'''
+_SQL_DIARIO_ITEM = '''
+    INSERT INTO precos_diarios_itens (id_jogo_monitorado, id_item, dia, soma_centavos, observacoes)
+    VALUES (?, ?, ?, ?, 1)
+    ON CONFLICT (id_jogo_monitorado, id_item, dia) DO UPDATE SET
+        soma_centavos = soma_centavos + excluded.soma_centavos,
+        observacoes = observacoes + 1
+'''
+_SQL_DIARIO_JOGO = '''
+    INSERT INTO precos_diarios_jogos (id_jogo_monitorado, dia, soma_centavos, observacoes)
+    VALUES (?, ?, ?, 1)
+    ON CONFLICT (id_jogo_monitorado, dia) DO UPDATE SET
+        soma_centavos = soma_centavos + excluded.soma_centavos,
+        observacoes = observacoes + 1
+'''
+
+
+class Caches:
+    """Caches de ids das tabelas de dimensão, reaproveitados durante uma atualização inteira."""
+
+    def __init__(self):
+        self.itens, self.lojas, self.links = {}, {}, {}
+
+    def limpar(self):
+        # Depois de um rollback, ids recém-criados podem não existir mais no banco
+        self.itens.clear()
+        self.lojas.clear()
+        self.links.clear()
+
+
+class BufferDeEscrita:
+    """Acumula as consultas de uma atualização e grava tudo de uma vez, com executemany.
+
+    Cada `descarregar()` é uma única transação (um fsync), em vez de um commit por oferta ou por jogo.
+    Use como context manager para garantir a gravação do que sobrar no final:
+
+        with historico.BufferDeEscrita(conn) as buffer:
+            buffer.adicionar(id_jogo, data_consulta, ofertas)
+
+    Cada oferta é um dict com: id_itad, nome_item, id_loja_itad, loja, link, preco_centavos e
+    validade_oferta (epoch ou None).
+    """
+
+    def __init__(self, conn, modo=None, max_ofertas=MAX_OFERTAS_NO_BUFFER, max_segundos=MAX_SEGUNDOS_NO_BUFFER,
+                 caches=None):
+        self.conn = conn
+        self.modo = modo or MODO_ARMAZENAMENTO
+        self.max_ofertas = max_ofertas
+        self.max_segundos = max_segundos
+        self.caches = caches or Caches()
+        self.linhas_inseridas = 0
+        self.linhas_estendidas = 0
+        self._pendentes = []
+        self._ofertas_pendentes = 0
+        self._inicio_pendentes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, traceback):
+        if tipo_excecao is None:
+            self.descarregar()
+
+    def adicionar(self, id_jogo_monitorado, data_consulta, ofertas):
+        """Enfileira uma consulta de um jogo; grava o buffer se passou do tamanho ou do tempo máximo."""
+        self._pendentes.append((id_jogo_monitorado, data_consulta, list(ofertas)))
+        self._ofertas_pendentes += len(self._pendentes[-1][2])
+        if self._inicio_pendentes is None:
+            self._inicio_pendentes = time.monotonic()
+        if (self._ofertas_pendentes >= self.max_ofertas
+                or time.monotonic() - self._inicio_pendentes >= self.max_segundos):
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava tudo o que está pendente em uma única transação. Retorna (inseridas, estendidas)."""
+        if not self._pendentes:
+            return 0, 0
+        pendentes = self._pendentes
+        self._pendentes, self._ofertas_pendentes, self._inicio_pendentes = [], 0, None
+        inicio = time.perf_counter()
+        try:
+            with self.conn:
+                if not self.conn.in_transaction:
+                    # Já pega o lock de escrita: os ids atribuídos em _gravar não podem ser usados por outro processo
+                    self.conn.execute("BEGIN IMMEDIATE")
+                inseridas, estendidas = self._gravar(pendentes)
+        except Exception:
+            self.caches.limpar()
+            metricas.contar('historico_falhas_gravacao')
+            raise
+        metricas.observar('historico_gravacao_segundos', time.perf_counter() - inicio)
+        metricas.contar('historico_consultas_gravadas', len(pendentes))
+        metricas.contar('historico_linhas', inseridas, tipo='inseridas')
+        metricas.contar('historico_linhas', estendidas, tipo='estendidas')
+        self.linhas_inseridas += inseridas
+        self.linhas_estendidas += estendidas
+        return inseridas, estendidas
+
+    def _carregar_estado(self, ids_jogos):
+        """Última consulta e último estado de cada item, para os jogos do buffer (poucas consultas com IN)."""
+        ultima_consulta, estados = {}, {}
+        ids_jogos = list(ids_jogos)
+        for i in range(0, len(ids_jogos), _TAMANHO_LOTE_IN):
+            lote = ids_jogos[i:i + _TAMANHO_LOTE_IN]
+            marcadores = ", ".join("?" * len(lote))
+            ultima_consulta.update(self.conn.execute(
+                f"SELECT id_jogo_monitorado, MAX(data_consulta) FROM consultas "
+                f"WHERE id_jogo_monitorado IN ({marcadores}) GROUP BY id_jogo_monitorado", lote))
+            if self.modo == MODO_MUDANCAS:
+                for linha in self.conn.execute(
+                        f"SELECT id_jogo_monitorado, id_item, id_historico, id_loja, preco_centavos, validade_oferta, visto_ate "
+                        f"FROM estado_atual_precos WHERE id_jogo_monitorado IN ({marcadores})", lote):
+                    estados[linha[0], linha[1]] = linha[2:]
+        return ultima_consulta, estados
+
+    def _gravar(self, pendentes):
+        conn, caches = self.conn, self.caches
+        ultima_consulta, estados = self._carregar_estado({id_jogo for id_jogo, _, _ in pendentes})
+        # Ids atribuídos aqui mesmo (dentro da transação) para não depender de lastrowid linha a linha
+        proximo_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM historico_precos").fetchone()[0]
+        # Um número por gravação, crescente na ordem dos commits (marca da exportação incremental)
+        id_gravacao = conn.execute("SELECT COALESCE(MAX(id_gravacao), 0) + 1 FROM consultas").fetchone()[0]
+
+        consultas, novas_linhas, extensoes, novos_estados = [], [], [], {}
+        estatisticas_itens, estatisticas_jogos = [], []
+        for id_jogo, data_consulta, ofertas in pendentes:
+            consulta_anterior = ultima_consulta.get(id_jogo)
+            consultas.append((id_jogo, data_consulta, id_gravacao))
+            melhor_da_consulta = None
+            for oferta in ofertas:
+                id_item = banco.obter_id_item(conn, oferta['id_itad'], oferta['nome_item'], caches.itens)
+                id_loja = banco.obter_id_loja(conn, oferta['id_loja_itad'], oferta['loja'], caches.lojas)
+                id_link = banco.obter_id_link(conn, oferta['link'], caches.links)
+                preco_centavos, validade = oferta['preco_centavos'], oferta['validade_oferta']
+
+                estado = estados.get((id_jogo, id_item))
+                # Só estende se nada mudou E o item apareceu na consulta anterior (sem "buracos" na linha do tempo)
+                if (estado is not None and estado[1:4] == (id_loja, preco_centavos, validade)
+                        and estado[4] == consulta_anterior):
+                    id_historico = estado[0]
+                    extensoes.append((data_consulta, id_historico))
+                else:
+                    id_historico = proximo_id
+                    proximo_id += 1
+                    novas_linhas.append((id_historico, id_jogo, id_item, id_loja, id_link, preco_centavos,
+                                         validade, data_consulta, data_consulta))
+                novo_estado = (id_historico, id_loja, preco_centavos, validade, data_consulta)
+                if self.modo == MODO_MUDANCAS:
+                    estados[id_jogo, id_item] = novo_estado
+                novos_estados[id_jogo, id_item] = novo_estado
+                estatisticas_itens.append((id_jogo, id_item, preco_centavos, data_consulta, id_loja))
+                if melhor_da_consulta is None or preco_centavos < melhor_da_consulta[1]:
+                    melhor_da_consulta = (id_jogo, preco_centavos, data_consulta, id_item, id_loja)
+            if melhor_da_consulta is not None:
+                estatisticas_jogos.append(melhor_da_consulta)
+            # A próxima consulta do mesmo jogo dentro deste buffer compara com esta
+            ultima_consulta[id_jogo] = data_consulta
+
+        conn.executemany("INSERT OR IGNORE INTO consultas (id_jogo_monitorado, data_consulta, id_gravacao) VALUES (?, ?, ?)",
+                         consultas)
+        conn.executemany(
+            'INSERT INTO historico_precos (id, id_jogo_monitorado, id_item, id_loja, id_link, preco_centavos, validade_oferta, data_consulta, visto_ate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            novas_linhas)
+        conn.executemany("UPDATE historico_precos SET visto_ate = ? WHERE id = ?", extensoes)
+        conn.executemany('''
+            INSERT OR REPLACE INTO estado_atual_precos
+                (id_jogo_monitorado, id_item, id_historico, id_loja, preco_centavos, validade_oferta, visto_ate)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(id_jogo, id_item) + estado for (id_jogo, id_item), estado in novos_estados.items()])
+        self._atualizar_estatisticas(estatisticas_itens, estatisticas_jogos)
+        return len(novas_linhas), len(extensoes)
+
+    def _atualizar_estatisticas(self, observacoes_itens, melhores_dos_jogos):
+        """Aplica as observações do buffer às estatísticas por item e por jogo (ver migracoes v4)."""
+        conn = self.conn
+        conn.executemany(_SQL_ESTATISTICAS_ITEM, observacoes_itens)
+        conn.executemany(_SQL_DIARIO_ITEM, [
+            (id_jogo, id_item, data_consulta // SEGUNDOS_POR_DIA, preco_centavos)
+            for id_jogo, id_item, preco_centavos, data_consulta, _ in observacoes_itens])
+        conn.executemany(_SQL_ESTATISTICAS_JOGO, melhores_dos_jogos)
+        conn.executemany(_SQL_DIARIO_JOGO, [
+            (id_jogo, data_consulta // SEGUNDOS_POR_DIA, preco_centavos)
+            for id_jogo, preco_centavos, data_consulta, _, _ in melhores_dos_jogos])
+
+
+def salvar_observacoes(conn, id_jogo_monitorado, data_consulta, ofertas, modo=None, caches=None):
+    """Grava (e faz commit de) uma única consulta de um jogo. Retorna (linhas_inseridas, linhas_estendidas)."""
+    buffer = BufferDeEscrita(conn, modo, caches=caches)
+    buffer.adicionar(id_jogo_monitorado, data_consulta, ofertas)
+    return buffer.descarregar()
+
+
+def salvar_precos_por_pais(conn, consultas, paises_completos=(), caches=None):
+    """Grava o melhor preço de cada item em cada país: o atual em precos_por_pais (migracoes v9) e a
+    linha do tempo em historico_por_pais.
+
+    `consultas` é uma lista de (id_jogo_monitorado, país, data_consulta, ofertas), com as ofertas no
+    mesmo formato do BufferDeEscrita mais a 'moeda'. O histórico por país só guarda mudanças: se loja,
+    preço, moeda e validade não mudaram e o item apareceu na consulta anterior do país, só o visto_ate
+    da linha é estendido.
+    Para os países em `paises_completos` (todos os lotes de preços chegaram), itens que deixaram de
+    ter oferta saem de precos_por_pais (a linha do tempo deles fica onde parou). Retorna quantas
+    linhas de precos_por_pais foram gravadas.
+    """
+    caches = caches or Caches()
+    linhas, limpezas, novas_linhas, extensoes = [], [], [], []
+    paises_completos = set(paises_completos)
+    try:
+        with conn:
+            proximo_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM historico_por_pais").fetchone()[0]
+            for id_jogo, pais, data_consulta, ofertas in consultas:
+                consulta_anterior = conn.execute(
+                    "SELECT MAX(data_consulta) FROM consultas_por_pais WHERE id_jogo_monitorado = ? AND pais = ?",
+                    (id_jogo, pais)).fetchone()[0]
+                conn.execute("INSERT OR IGNORE INTO consultas_por_pais (id_jogo_monitorado, pais, data_consulta) "
+                             "VALUES (?, ?, ?)", (id_jogo, pais, data_consulta))
+                # Começo da chave primária: só os itens deste jogo neste país
+                atuais = {linha[0]: linha[1:] for linha in conn.execute(
+                    "SELECT id_item, id_loja, preco_centavos, moeda, validade_oferta, id_historico, data_consulta "
+                    "FROM precos_por_pais WHERE id_jogo_monitorado = ? AND pais = ?", (id_jogo, pais))}
+                for oferta in ofertas:
+                    id_item = banco.obter_id_item(conn, oferta['id_itad'], oferta['nome_item'], caches.itens)
+                    id_loja = banco.obter_id_loja(conn, oferta['id_loja_itad'], oferta['loja'], caches.lojas)
+                    id_link = banco.obter_id_link(conn, oferta['link'], caches.links)
+                    valores = (id_loja, oferta['preco_centavos'], oferta.get('moeda'), oferta['validade_oferta'])
+                    atual = atuais.get(id_item)
+                    # Sem "buracos": a linha de um país com lote perdido continua em precos_por_pais, mas parada
+                    if (atual is not None and atual[:4] == valores and atual[4] is not None
+                            and atual[5] == consulta_anterior):
+                        id_historico = atual[4]
+                        extensoes.append((data_consulta, id_historico))
+                    else:
+                        id_historico = proximo_id
+                        proximo_id += 1
+                        novas_linhas.append((id_historico, id_jogo, id_item, pais, id_loja, id_link, *valores[1:],
+                                             data_consulta, data_consulta))
+                    linhas.append((id_jogo, id_item, pais, id_loja, id_link, *valores[1:], data_consulta, id_historico))
+                if pais in paises_completos:
+                    limpezas.append((id_jogo, pais, data_consulta))
+            conn.executemany('''
+                INSERT INTO historico_por_pais (id, id_jogo_monitorado, id_item, pais, id_loja, id_link, preco_centavos,
+                                                moeda, validade_oferta, data_consulta, visto_ate)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', novas_linhas)
+            conn.executemany("UPDATE historico_por_pais SET visto_ate = ? WHERE id = ?", extensoes)
+            conn.executemany('''
+                INSERT OR REPLACE INTO precos_por_pais (id_jogo_monitorado, id_item, pais, id_loja, id_link,
+                                                        preco_centavos, moeda, validade_oferta, data_consulta,
+                                                        id_historico)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', linhas)
+            conn.executemany("DELETE FROM precos_por_pais WHERE id_jogo_monitorado = ? AND pais = ? AND data_consulta < ?",
+                             limpezas)
+    except Exception:
+        caches.limpar()
+        raise
+    metricas.contar('precos_por_pais_linhas', len(linhas))
+    metricas.contar('historico_por_pais_linhas', len(novas_linhas), tipo='inseridas')
+    metricas.contar('historico_por_pais_linhas', len(extensoes), tipo='estendidas')
+    return len(linhas)
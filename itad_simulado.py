@@ -0,0 +1,247 @@
+# itad_simulado.py
+# Servidor HTTP local que imita o IsThereAnyDeal (games/search/v1 e games/prices/v3), para medir e
+# testar a atualização sem chave de API e sem depender da rede (ver benchmark.py).
+#
+# As respostas são determinísticas (mesma semente, mesmos ids, títulos e preços). Dá para ajustar a
+# latência, o tamanho das respostas, a fração de preços que mudam a cada consulta e a fração de
+# respostas 429 (com Retry-After), para exercitar o limitador e as novas tentativas do api_itad. Os 429
+# não são sorteados: com fração 0.2, toda quinta requisição recebe um, mesmo em rodadas curtas.
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# --- CONFIGURAÇÃO ---
+LATENCIA = 0.05            # Segundos de espera antes de cada resposta
+ITENS_POR_BUSCA = 20       # Jogo base + DLCs devolvidos por busca (limitado pelo parâmetro results)
+OFERTAS_POR_ITEM = 3       # Lojas com oferta para cada item
+FRACAO_SEM_OFERTA = 0.1    # Itens que voltam sem nenhuma oferta
+FRACAO_MUDANCAS = 0.1      # Chance de o preço de um item mudar de uma consulta para a outra
+FRACAO_429 = 0.0           # Respostas 429 (Too Many Requests) injetadas
+RETRY_AFTER = 0.2          # Segundos informados no Retry-After dos 429
+SEMENTE = 0
+# --- FIM DA CONFIGURAÇÃO ---
+
+LOJAS = [(61, "Steam"), (35, "GOG"), (16, "Epic Game Store"), (49, "Nuuvem"), (37, "Humble Store"),
+         (62, "Fanatical"), (50, "GamersGate"), (24, "Green Man Gaming")]
+_NAMESPACE_IDS = uuid.UUID('6f1c8a52-3c1e-4a43-9d6b-8a1d3e0f5b21')
+
+
+def _numero(*partes):
+    """Inteiro pseudoaleatório estável a partir das partes (independe do PYTHONHASHSEED)."""
+    return int.from_bytes(hashlib.blake2b("|".join(map(str, partes)).encode(), digest_size=8).digest(), 'big')
+
+
+class ServidorITADSimulado:
+    """Servidor em uma thread própria. Uso:
+
+        with ServidorITADSimulado(latencia=0.02, fracao_429=0.05) as servidor:
+            api_itad.URL_BASE = servidor.url
+            ...
+        print(servidor.estatisticas())
+    """
+
+    def __init__(self, porta=0, latencia=LATENCIA, itens_por_busca=ITENS_POR_BUSCA, ofertas_por_item=OFERTAS_POR_ITEM,
+                 fracao_sem_oferta=FRACAO_SEM_OFERTA, fracao_mudancas=FRACAO_MUDANCAS, fracao_429=FRACAO_429,
+                 retry_after=RETRY_AFTER, semente=SEMENTE):
+        self.porta = porta
+        self.latencia = latencia
+        self.itens_por_busca = itens_por_busca
+        self.ofertas_por_item = min(ofertas_por_item, len(LOJAS))
+        self.fracao_sem_oferta = fracao_sem_oferta
+        self.fracao_mudancas = fracao_mudancas
+        self.fracao_429 = fracao_429
+        self.retry_after = retry_after
+        self.semente = semente
+        self._aleatorio = random.Random(semente)
+        self._versoes = {}  # id -> quantas vezes o preço do item já mudou
+        self._requisicoes = 0  # Requisições recebidas, para espaçar os 429
+        self._lock = threading.Lock()
+        self._contadores = {'buscas': 0, 'lotes_precos': 0, 'ids_precos': 0, 'respostas_429': 0}
+        self._servidor = None
+        self._thread = None
+
+    # --- respostas ---
+
+    def resultado_busca(self, titulo, resultados):
+        quantidade = min(self.itens_por_busca, resultados)
+        itens = []
+        for k in range(quantidade):
+            nome = titulo if k == 0 else f"{titulo} - DLC {k}"
+            itens.append({
+                'id': str(uuid.uuid5(_NAMESPACE_IDS, f"{self.semente}|{titulo.casefold()}|{k}")),
+                'slug': nome.casefold().replace(' ', '-'),
+                'title': nome,
+                'type': 'game' if k == 0 else 'dlc',
+                'mature': False,
+            })
+        return itens
+
+    def _sortear_mudancas(self, ids):
+        with self._lock:
+            versoes = []
+            for id_itad in ids:
+                versao = self._versoes.get(id_itad)
+                if versao is None:
+                    versao = 0
+                elif self._aleatorio.random() < self.fracao_mudancas:
+                    versao += 1
+                self._versoes[id_itad] = versao
+                versoes.append(versao)
+            return versoes
+
+    def resultado_precos(self, ids, pais):
+        resultado = []
+        for id_itad, versao in zip(ids, self._sortear_mudancas(ids)):
+            deals = []
+            if _numero(self.semente, id_itad, 'sem oferta') % 1000 >= self.fracao_sem_oferta * 1000:
+                base = 500 + _numero(self.semente, id_itad) % 25000
+                inicio = _numero(self.semente, id_itad, 'lojas') % len(LOJAS)
+                for n in range(self.ofertas_por_item):
+                    id_loja, loja = LOJAS[(inicio + n) % len(LOJAS)]
+                    corte = _numero(self.semente, id_itad, id_loja, versao) % 90
+                    centavos = max(99, base * (100 - corte) // 100)
+                    expiracao = None
+                    if corte >= 30:
+                        dias = 1 + _numero(self.semente, id_itad, id_loja, versao, 'dias') % 14
+                        expiracao = (datetime(2030, 1, 1, tzinfo=timezone.utc) + timedelta(days=dias)).isoformat()
+                    deals.append({
+                        'shop': {'id': id_loja, 'name': loja},
+                        'price': {'amount': centavos / 100, 'amountInt': centavos, 'currency': 'BRL' if pais == 'BR' else 'USD'},
+                        'regular': {'amount': base / 100, 'amountInt': base, 'currency': 'BRL' if pais == 'BR' else 'USD'},
+                        'cut': corte,
+                        'expiry': expiracao,
+                        'url': f"https://itad.example/{loja.replace(' ', '').lower()}/{id_itad}",
+                    })
+            resultado.append({'id': id_itad, 'historyLow': None, 'deals': deals})
+        return resultado
+
+    def _injetar_429(self):
+        """Devolve 429 em uma a cada 1/fracao_429 requisições, espaçadas por igual (sem sorteio)."""
+        with self._lock:
+            self._requisicoes += 1
+            if int(self._requisicoes * self.fracao_429) > int((self._requisicoes - 1) * self.fracao_429):
+                self._contadores['respostas_429'] += 1
+                return True
+            return False
+
+    def _contar(self, chave, quantidade=1):
+        with self._lock:
+            self._contadores[chave] += quantidade
+
+    def estatisticas(self):
+        with self._lock:
+            return dict(self._contadores)
+
+    # --- servidor ---
+
+    def _criar_manipulador(self):
+        simulado = self
+
+        class Manipulador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, como a API de verdade
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, dados=None, cabecalhos=None):
+                corpo = json.dumps(dados).encode() if dados is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                for nome, valor in (cabecalhos or {}).items():
+                    self.send_header(nome, valor)
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def _preparar(self):
+                if simulado.latencia:
+                    time.sleep(simulado.latencia)
+                if simulado._injetar_429():
+                    self._responder(429, {'status_code': 429, 'reason_phrase': 'Too Many Requests'},
+                                    {'Retry-After': str(simulado.retry_after)})
+                    return False
+                return True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != '/games/search/v1':
+                    self._responder(404, {'status_code': 404})
+                    return
+                if not self._preparar():
+                    return
+                parametros = parse_qs(url.query)
+                titulo = parametros.get('title', [''])[0]
+                resultados = int(parametros.get('results', [ITENS_POR_BUSCA])[0])
+                simulado._contar('buscas')
+                self._responder(200, simulado.resultado_busca(titulo, resultados))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                corpo = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if url.path != '/games/prices/v3':
+                    self._responder(404, {'status_code': 404})
+                    return
+                if not self._preparar():
+                    return
+                ids = json.loads(corpo or b'[]')
+                pais = parse_qs(url.query).get('country', ['US'])[0]
+                simulado._contar('lotes_precos')
+                simulado._contar('ids_precos', len(ids))
+                self._responder(200, simulado.resultado_precos(ids, pais))
+
+        return Manipulador
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._servidor.server_port}"
+
+    def iniciar(self):
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', self.porta), self._criar_manipulador())
+        self._servidor.daemon_threads = True
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, traceback):
+        self.parar()
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Servidor local que imita a API do IsThereAnyDeal.")
+    parser.add_argument('--porta', type=int, default=8000)
+    parser.add_argument('--latencia', type=float, default=LATENCIA, help="segundos por resposta")
+    parser.add_argument('--itens-por-busca', type=int, default=ITENS_POR_BUSCA)
+    parser.add_argument('--ofertas-por-item', type=int, default=OFERTAS_POR_ITEM)
+    parser.add_argument('--fracao-429', type=float, default=FRACAO_429, help="fração de respostas 429 (0 a 1)")
+    parser.add_argument('--semente', type=int, default=SEMENTE)
+    return parser.parse_args()
+
+# --- BLOCO PRINCIPAL ---
+if __name__ == "__main__":
+    args = _argumentos()
+    servidor = ServidorITADSimulado(args.porta, args.latencia, args.itens_por_busca, args.ofertas_por_item,
+                                    fracao_429=args.fracao_429, semente=args.semente)
+    print(f"ITAD simulado em {servidor.iniciar()} (Ctrl+C para sair). Use-o trocando api_itad.URL_BASE.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.parar()
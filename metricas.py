@@ -0,0 +1,216 @@
+# metricas.py
+# Contadores e histogramas de tempo do processo (chamadas à API, etapas da atualização, gravação e
+# consultas ao banco), com resumo estruturado por atualização, saída no formato texto do Prometheus
+# (arquivo ou endpoint HTTP) e um gancho opcional de cProfile.
+#
+# Tudo fica em memória no `registro` do módulo; registrar uma medida custa um lock e uma soma.
+
+import bisect
+import contextlib
+import cProfile
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- CONFIGURAÇÃO ---
+PREFIXO = "finder"   # Prefixo dos nomes na saída do Prometheus
+LIMITES_HISTOGRAMA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # segundos
+VARIAVEL_PERFIL = "FINDER_PERFIL"  # Variável de ambiente com o arquivo .prof (liga o cProfile)
+# --- FIM DA CONFIGURAÇÃO ---
+
+
+def _rotulos(rotulos):
+    return tuple(sorted((nome, str(valor)) for nome, valor in rotulos.items()))
+
+
+def _nome_legivel(nome, rotulos):
+    if not rotulos:
+        return nome
+    return nome + "{" + ",".join(f"{chave}={valor}" for chave, valor in rotulos) + "}"
+
+
+def _escapar(valor):
+    return valor.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _rotulos_prometheus(rotulos, extra=()):
+    todos = tuple(rotulos) + tuple(extra)
+    if not todos:
+        return ""
+    return "{" + ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in todos) + "}"
+
+
+class Metricas:
+    """Registro de contadores e histogramas, seguro para várias threads.
+
+    Cada medida tem um nome e rótulos opcionais (ex.: endpoint='/games/prices/v3'). Os histogramas
+    guardam a contagem por faixa de LIMITES_HISTOGRAMA e a soma, como no Prometheus.
+    """
+
+    def __init__(self, limites=LIMITES_HISTOGRAMA):
+        self.limites = tuple(limites)
+        self._lock = threading.Lock()
+        self._contadores = {}   # (nome, rótulos) -> valor
+        self._histogramas = {}  # (nome, rótulos) -> [contagens por faixa (+ a de +Inf), soma]
+
+    def contar(self, nome, quantidade=1, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + quantidade
+
+    def observar(self, nome, segundos, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        faixa = bisect.bisect_left(self.limites, segundos)
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = [[0] * (len(self.limites) + 1), 0.0]
+            histograma[0][faixa] += 1
+            histograma[1] += segundos
+
+    @contextlib.contextmanager
+    def cronometrar(self, nome, **rotulos):
+        """Mede o tempo do bloco `with` e o registra no histograma `nome`."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def instantaneo(self):
+        """Cópia dos valores atuais, para depois calcular o que mudou (ver resumo_desde)."""
+        with self._lock:
+            return (dict(self._contadores),
+                    {chave: (list(contagens), soma) for chave, (contagens, soma) in self._histogramas.items()})
+
+    def resumo_desde(self, instantaneo=None):
+        """O que foi medido desde `instantaneo` (ou desde o início), em dicts prontos para JSON.
+
+        Retorna {'contadores': {nome: valor}, 'tempos': {nome: {quantidade, total_s, media_ms, p95_ms}}},
+        com os rótulos no nome ("http_respostas{endpoint=...,status=200}"). O p95 é o limite superior da
+        faixa do histograma onde ele cai (None se passar da maior faixa).
+        """
+        contadores_antes, histogramas_antes = instantaneo or ({}, {})
+        contadores_agora, histogramas_agora = self.instantaneo()
+        resumo = {'contadores': {}, 'tempos': {}}
+        for (nome, rotulos), valor in sorted(contadores_agora.items()):
+            diferenca = valor - contadores_antes.get((nome, rotulos), 0)
+            if diferenca:
+                resumo['contadores'][_nome_legivel(nome, rotulos)] = diferenca
+        for (nome, rotulos), (contagens, soma) in sorted(histogramas_agora.items()):
+            contagens_antes, soma_antes = histogramas_antes.get((nome, rotulos), ([0] * len(contagens), 0.0))
+            contagens = [agora - antes for agora, antes in zip(contagens, contagens_antes)]
+            quantidade = sum(contagens)
+            if not quantidade:
+                continue
+            total = soma - soma_antes
+            resumo['tempos'][_nome_legivel(nome, rotulos)] = {
+                'quantidade': quantidade,
+                'total_s': round(total, 6),
+                'media_ms': round(total / quantidade * 1000, 3),
+                'p95_ms': self._percentil(contagens, 0.95),
+            }
+        return resumo
+
+    def _percentil(self, contagens, fracao):
+        alvo, acumulado = fracao * sum(contagens), 0
+        for limite, contagem in zip(self.limites, contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return limite * 1000
+        return None
+
+    def texto_prometheus(self):
+        """Todas as medidas no formato texto de exposição do Prometheus."""
+        contadores, histogramas = self.instantaneo()
+        linhas = []
+        for nome in sorted({nome for nome, _ in contadores}):
+            linhas.append(f"# TYPE {PREFIXO}_{nome}_total counter")
+            for (nome_, rotulos), valor in sorted(contadores.items()):
+                if nome_ == nome:
+                    linhas.append(f"{PREFIXO}_{nome}_total{_rotulos_prometheus(rotulos)} {valor}")
+        for nome in sorted({nome for nome, _ in histogramas}):
+            linhas.append(f"# TYPE {PREFIXO}_{nome} histogram")
+            for (nome_, rotulos), (contagens, soma) in sorted(histogramas.items()):
+                if nome_ != nome:
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(self.limites + ('+Inf',), contagens):
+                    acumulado += contagem
+                    linhas.append(f"{PREFIXO}_{nome}_bucket{_rotulos_prometheus(rotulos, [('le', str(limite))])} {acumulado}")
+                linhas.append(f"{PREFIXO}_{nome}_sum{_rotulos_prometheus(rotulos)} {soma}")
+                linhas.append(f"{PREFIXO}_{nome}_count{_rotulos_prometheus(rotulos)} {acumulado}")
+        return "\n".join(linhas) + "\n"
+
+    def zerar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._histogramas.clear()
+
+
+registro = Metricas()
+contar = registro.contar
+observar = registro.observar
+cronometrar = registro.cronometrar
+
+
+# --- SAÍDAS ---
+
+def gravar_prometheus(caminho, metricas=registro):
+    """Grava o texto do Prometheus em `caminho` de uma vez (ex.: para o textfile collector do node_exporter)."""
+    temporario = caminho + ".tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write(metricas.texto_prometheus())
+    os.replace(temporario, caminho)
+
+
+def servir_prometheus(porta, endereco='127.0.0.1', metricas=registro):
+    """Serve o texto do Prometheus em http://endereco:porta/metrics, em uma thread. Retorna o servidor."""
+
+    class Manipulador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            corpo = metricas.texto_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+    servidor = ThreadingHTTPServer((endereco, porta), Manipulador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# --- PERFIL ---
+
+def caminho_do_perfil(config=None):
+    """Arquivo do cProfile pedido pela variável FINDER_PERFIL ou pela chave "PERFIL" do config.json."""
+    return os.environ.get(VARIAVEL_PERFIL) or (config or {}).get('PERFIL')
+
+
+@contextlib.contextmanager
+def perfilar(caminho):
+    """Roda o bloco com o cProfile ligado e grava o resultado em `caminho` (abrir com python -m pstats).
+
+    Sem `caminho` não faz nada. O cProfile só enxerga a thread que entrou no bloco: o tempo das
+    chamadas à API feitas pelas threads de trabalho aparece como espera, e o detalhe delas fica nos
+    histogramas http_*.
+    """
+    if not caminho:
+        yield
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        perfil.dump_stats(caminho)
@@ -0,0 +1,578 @@
+# migracoes.py
+# Versionamento do esquema do banco (PRAGMA user_version) e migrações entre versões.
+#
+# Um banco novo passa por todas as versões; os dois esquemas antigos (o do backend/GUI, com
+# jogos_monitorados, e o do finder_V01, com termo_busca) entram pela v1. A docstring de cada
+# migração diz o que ela cria.
+
+import banco
+import normalizacao
+
+
+def _criar_esquema_v1(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jogos_monitorados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL UNIQUE,
+            monitorado INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    # A tabela do backend antigo já existe, sem a coluna
+    if 'monitorado' not in banco.colunas_da_tabela(conn, 'jogos_monitorados'):
+        conn.execute("ALTER TABLE jogos_monitorados ADD COLUMN monitorado INTEGER NOT NULL DEFAULT 1")
+    conn.execute('''
+        CREATE TABLE lojas (
+            id INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE itens (
+            id INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE historico_precos (
+            id INTEGER PRIMARY KEY,
+            id_jogo_monitorado INTEGER REFERENCES jogos_monitorados (id),
+            id_item INTEGER NOT NULL REFERENCES itens (id),
+            id_loja INTEGER NOT NULL REFERENCES lojas (id),
+            preco_centavos INTEGER NOT NULL,
+            link TEXT,
+            validade_oferta INTEGER,
+            data_consulta INTEGER NOT NULL
+        )
+    ''')
+    # Casado com consultar_historico e com o cache do finder_V01 (filtro + ordenação sem TEMP B-TREE)
+    conn.execute('''
+        CREATE INDEX idx_historico_jogo_data ON historico_precos
+            (id_jogo_monitorado, data_consulta DESC, preco_centavos ASC, id_item, id_loja)
+    ''')
+    conn.execute('''
+        CREATE VIEW vw_historico_precos AS
+        SELECT h.id,
+               h.id_jogo_monitorado,
+               j.nome AS jogo_monitorado,
+               i.nome AS nome_item,
+               h.preco_centavos / 100.0 AS preco,
+               l.nome AS loja,
+               h.link,
+               COALESCE(strftime('%d/%m/%Y', h.validade_oferta, 'unixepoch', 'localtime'), 'N/A') AS validade_oferta,
+               datetime(h.data_consulta, 'unixepoch', 'localtime') AS data_consulta
+        FROM historico_precos h
+        JOIN itens i ON i.id = h.id_item
+        JOIN lojas l ON l.id = h.id_loja
+        LEFT JOIN jogos_monitorados j ON j.id = h.id_jogo_monitorado
+    ''')
+
+
+# Expressões SQL que convertem as colunas do esquema antigo (texto/REAL) para o novo
+_CENTAVOS = "CAST(ROUND(legado.preco * 100) AS INTEGER)"
+_EPOCH_CONSULTA = "CAST(strftime('%s', legado.data_consulta, 'utc') AS INTEGER)"
+_EPOCH_VALIDADE = """CASE WHEN legado.validade_oferta GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+    THEN CAST(strftime('%s', substr(legado.validade_oferta, 7, 4) || '-' || substr(legado.validade_oferta, 4, 2)
+                       || '-' || substr(legado.validade_oferta, 1, 2), 'utc') AS INTEGER)
+    END"""
+
+
+def _migrar_para_v1(conn):
+    """Cria o esquema normalizado, trazendo o histórico do backend antigo ou do finder_V01, se houver.
+
+    jogos_monitorados.monitorado separa os jogos da lista de monitoramento (1) dos termos que só
+    foram buscados no finder_V01 (0): estes têm histórico, mas ficam fora da GUI e das atualizações.
+    """
+    colunas = banco.colunas_da_tabela(conn, 'historico_precos')
+    if colunas:
+        conn.execute("ALTER TABLE historico_precos RENAME TO historico_precos_legado")
+        # Os índices antigos acompanham a tabela renomeada; descarta para liberar os nomes
+        for (nome_indice,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'historico_precos_legado' "
+                "AND sql IS NOT NULL").fetchall():
+            conn.execute(f"DROP INDEX {nome_indice}")
+
+    _criar_esquema_v1(conn)
+
+    if not colunas:
+        return False
+
+    if 'termo_busca' in colunas:
+        # Esquema do finder_V01: cada termo de busca ganha uma linha em jogos_monitorados, não monitorada
+        coluna_item = 'nome'
+        conn.execute("INSERT OR IGNORE INTO jogos_monitorados (nome, monitorado) "
+                     "SELECT DISTINCT termo_busca, 0 FROM historico_precos_legado")
+        join_jogo = "JOIN jogos_monitorados j ON j.nome = legado.termo_busca"
+        id_jogo = "j.id"
+    else:
+        coluna_item = 'nome_item'
+        join_jogo = ""
+        id_jogo = "legado.id_jogo_monitorado"
+
+    conn.execute("INSERT OR IGNORE INTO lojas (nome) SELECT DISTINCT loja FROM historico_precos_legado")
+    conn.execute(f"INSERT OR IGNORE INTO itens (nome) SELECT DISTINCT {coluna_item} FROM historico_precos_legado")
+    conn.execute(f'''
+        INSERT INTO historico_precos
+            (id, id_jogo_monitorado, id_item, id_loja, preco_centavos, link, validade_oferta, data_consulta)
+        SELECT legado.id, {id_jogo}, i.id, l.id, {_CENTAVOS}, legado.link, {_EPOCH_VALIDADE}, {_EPOCH_CONSULTA}
+        FROM historico_precos_legado legado
+        JOIN itens i ON i.nome = legado.{coluna_item}
+        JOIN lojas l ON l.nome = legado.loja
+        {join_jogo}
+        ORDER BY legado.id
+    ''')
+    conn.execute("DROP TABLE historico_precos_legado")
+    return True
+
+
+_VISAO_HISTORICO_V2 = '''
+    CREATE VIEW vw_historico_precos AS
+    SELECT h.id,
+           h.id_jogo_monitorado,
+           j.nome AS jogo_monitorado,
+           i.itad_id AS id_itad,
+           i.nome AS nome_item,
+           h.preco_centavos / 100.0 AS preco,
+           l.nome AS loja,
+           k.url AS link,
+           COALESCE(strftime('%d/%m/%Y', h.validade_oferta, 'unixepoch', 'localtime'), 'N/A') AS validade_oferta,
+           datetime(h.data_consulta, 'unixepoch', 'localtime') AS data_consulta
+    FROM historico_precos h
+    JOIN itens i ON i.id = h.id_item
+    JOIN lojas l ON l.id = h.id_loja
+    LEFT JOIN links k ON k.id = h.id_link
+    LEFT JOIN jogos_monitorados j ON j.id = h.id_jogo_monitorado
+'''
+
+
+def _migrar_para_v2(conn):
+    """Dimensões com chave da ITAD (itens/lojas) e links normalizados; reescreve o histórico em bloco."""
+    conn.execute("DROP VIEW vw_historico_precos")
+    conn.execute("DROP INDEX idx_historico_jogo_data")
+
+    # Itens: o nome deixa de ser único (a chave estável é o id da ITAD, preenchido nas próximas consultas)
+    conn.execute("ALTER TABLE itens RENAME TO itens_v1")
+    conn.execute('''
+        CREATE TABLE itens (
+            id INTEGER PRIMARY KEY,
+            itad_id TEXT UNIQUE,
+            nome TEXT NOT NULL
+        )
+    ''')
+    conn.execute("INSERT INTO itens (id, nome) SELECT id, nome FROM itens_v1")
+    conn.execute("CREATE INDEX idx_itens_nome ON itens (nome)")
+
+    conn.execute("ALTER TABLE lojas ADD COLUMN itad_id INTEGER")
+    conn.execute("CREATE UNIQUE INDEX idx_lojas_itad_id ON lojas (itad_id)")
+
+    conn.execute('''
+        CREATE TABLE links (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute("INSERT INTO links (url) SELECT DISTINCT link FROM historico_precos WHERE link IS NOT NULL")
+    tinha_historico = conn.execute("SELECT EXISTS (SELECT 1 FROM historico_precos)").fetchone()[0]
+
+    conn.execute("ALTER TABLE historico_precos RENAME TO historico_precos_v1")
+    conn.execute('''
+        CREATE TABLE historico_precos (
+            id INTEGER PRIMARY KEY,
+            id_jogo_monitorado INTEGER REFERENCES jogos_monitorados (id),
+            id_item INTEGER NOT NULL REFERENCES itens (id),
+            id_loja INTEGER NOT NULL REFERENCES lojas (id),
+            id_link INTEGER REFERENCES links (id),
+            preco_centavos INTEGER NOT NULL,
+            validade_oferta INTEGER,
+            data_consulta INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO historico_precos
+            (id, id_jogo_monitorado, id_item, id_loja, id_link, preco_centavos, validade_oferta, data_consulta)
+        SELECT h.id, h.id_jogo_monitorado, h.id_item, h.id_loja, k.id, h.preco_centavos, h.validade_oferta, h.data_consulta
+        FROM historico_precos_v1 h
+        LEFT JOIN links k ON k.url = h.link
+        ORDER BY h.id
+    ''')
+    conn.execute("DROP TABLE historico_precos_v1")
+    conn.execute("DROP TABLE itens_v1")
+    # Agora só com inteiros, o índice cobre todas as colunas lidas por consultar_historico
+    conn.execute('''
+        CREATE INDEX idx_historico_jogo_data ON historico_precos
+            (id_jogo_monitorado, data_consulta DESC, preco_centavos ASC, id_item, id_loja, validade_oferta, id_link)
+    ''')
+    conn.execute(_VISAO_HISTORICO_V2)
+    return bool(tinha_historico)
+
+
+_VISAO_HISTORICO_V3 = '''
+    CREATE VIEW vw_historico_precos AS
+    SELECT h.id,
+           h.id_jogo_monitorado,
+           j.nome AS jogo_monitorado,
+           i.itad_id AS id_itad,
+           i.nome AS nome_item,
+           h.preco_centavos / 100.0 AS preco,
+           l.nome AS loja,
+           k.url AS link,
+           COALESCE(strftime('%d/%m/%Y', h.validade_oferta, 'unixepoch', 'localtime'), 'N/A') AS validade_oferta,
+           datetime(c.data_consulta, 'unixepoch', 'localtime') AS data_consulta
+    FROM historico_precos h
+    CROSS JOIN consultas c
+        ON c.id_jogo_monitorado = h.id_jogo_monitorado
+       AND c.data_consulta BETWEEN h.data_consulta AND h.visto_ate
+    JOIN itens i ON i.id = h.id_item
+    JOIN lojas l ON l.id = h.id_loja
+    LEFT JOIN links k ON k.id = h.id_link
+    LEFT JOIN jogos_monitorados j ON j.id = h.id_jogo_monitorado
+'''
+
+
+def _migrar_para_v3(conn):
+    """Intervalos de validade (visto_ate) no histórico, registro de consultas e último estado por item.
+
+    consultas.id_gravacao numera as gravações na ordem em que são confirmadas (todas as consultas de
+    um mesmo commit têm o mesmo número); é a marca da exportação incremental.
+    """
+    conn.execute("DROP VIEW vw_historico_precos")
+    conn.execute("ALTER TABLE historico_precos ADD COLUMN visto_ate INTEGER")
+    conn.execute("UPDATE historico_precos SET visto_ate = data_consulta")
+    # Só linhas que cobrem mais de uma consulta entram aqui (vazio no modo completo)
+    conn.execute('''
+        CREATE INDEX idx_historico_estendido ON historico_precos (id_jogo_monitorado)
+        WHERE visto_ate > data_consulta
+    ''')
+
+    conn.execute('''
+        CREATE TABLE consultas (
+            id_jogo_monitorado INTEGER NOT NULL REFERENCES jogos_monitorados (id),
+            data_consulta INTEGER NOT NULL,
+            id_gravacao INTEGER,
+            PRIMARY KEY (id_jogo_monitorado, data_consulta)
+        ) WITHOUT ROWID
+    ''')
+    # As consultas antigas já estão todas gravadas: a própria data serve de número (as novas seguem de MAX + 1)
+    conn.execute('''
+        INSERT OR IGNORE INTO consultas (id_jogo_monitorado, data_consulta, id_gravacao)
+        SELECT DISTINCT id_jogo_monitorado, data_consulta, data_consulta FROM historico_precos
+        WHERE id_jogo_monitorado IS NOT NULL
+    ''')
+    conn.execute("CREATE INDEX idx_consultas_gravacao ON consultas (id_gravacao)")
+
+    conn.execute('''
+        CREATE TABLE estado_atual_precos (
+            id_jogo_monitorado INTEGER NOT NULL,
+            id_item INTEGER NOT NULL,
+            id_historico INTEGER NOT NULL REFERENCES historico_precos (id),
+            id_loja INTEGER NOT NULL,
+            preco_centavos INTEGER NOT NULL,
+            validade_oferta INTEGER,
+            visto_ate INTEGER NOT NULL,
+            PRIMARY KEY (id_jogo_monitorado, id_item)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT INTO estado_atual_precos
+            (id_jogo_monitorado, id_item, id_historico, id_loja, preco_centavos, validade_oferta, visto_ate)
+        SELECT h.id_jogo_monitorado, h.id_item, MAX(h.id), h.id_loja, h.preco_centavos, h.validade_oferta, h.visto_ate
+        FROM historico_precos h
+        WHERE h.id_jogo_monitorado IS NOT NULL
+        GROUP BY h.id_jogo_monitorado, h.id_item
+    ''')
+    conn.execute(_VISAO_HISTORICO_V3)
+    return False
+
+
+def _migrar_para_v4(conn):
+    """Tabelas de estatísticas (por item e por jogo) e somas diárias, preenchidas a partir do histórico."""
+    conn.execute('''
+        CREATE TABLE estatisticas_itens (
+            id_jogo_monitorado INTEGER NOT NULL,
+            id_item INTEGER NOT NULL,
+            menor_preco_centavos INTEGER NOT NULL,
+            data_menor_preco INTEGER NOT NULL,
+            id_loja_menor_preco INTEGER NOT NULL,
+            preco_atual_centavos INTEGER NOT NULL,
+            id_loja_atual INTEGER NOT NULL,
+            data_atual INTEGER NOT NULL,
+            observacoes INTEGER NOT NULL,
+            PRIMARY KEY (id_jogo_monitorado, id_item)
+        ) WITHOUT ROWID
+    ''')
+    # No jogo, o "preço" de cada consulta é o da oferta mais barata entre todos os itens encontrados
+    conn.execute('''
+        CREATE TABLE estatisticas_jogos (
+            id_jogo_monitorado INTEGER PRIMARY KEY,
+            menor_preco_centavos INTEGER NOT NULL,
+            data_menor_preco INTEGER NOT NULL,
+            id_item_menor_preco INTEGER NOT NULL,
+            id_loja_menor_preco INTEGER NOT NULL,
+            preco_atual_centavos INTEGER NOT NULL,
+            id_item_atual INTEGER NOT NULL,
+            id_loja_atual INTEGER NOT NULL,
+            data_atual INTEGER NOT NULL,
+            observacoes INTEGER NOT NULL
+        )
+    ''')
+    # dia = data_consulta / 86400 (dias UTC desde 1970); médias móveis = SUM(soma) / SUM(observacoes)
+    conn.execute('''
+        CREATE TABLE precos_diarios_itens (
+            id_jogo_monitorado INTEGER NOT NULL,
+            id_item INTEGER NOT NULL,
+            dia INTEGER NOT NULL,
+            soma_centavos INTEGER NOT NULL,
+            observacoes INTEGER NOT NULL,
+            PRIMARY KEY (id_jogo_monitorado, id_item, dia)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE precos_diarios_jogos (
+            id_jogo_monitorado INTEGER NOT NULL,
+            dia INTEGER NOT NULL,
+            soma_centavos INTEGER NOT NULL,
+            observacoes INTEGER NOT NULL,
+            PRIMARY KEY (id_jogo_monitorado, dia)
+        ) WITHOUT ROWID
+    ''')
+
+    # Linha do tempo lógica (uma linha por item em cada consulta), igual à de vw_historico_precos
+    conn.execute('''
+        CREATE TEMP TABLE observacoes_antigas AS
+        SELECT h.id_jogo_monitorado, h.id_item, h.id_loja, h.preco_centavos, c.data_consulta
+        FROM historico_precos h
+        CROSS JOIN consultas c
+            ON c.id_jogo_monitorado = h.id_jogo_monitorado
+           AND c.data_consulta BETWEEN h.data_consulta AND h.visto_ate
+    ''')
+    conn.execute('''
+        INSERT INTO precos_diarios_itens (id_jogo_monitorado, id_item, dia, soma_centavos, observacoes)
+        SELECT id_jogo_monitorado, id_item, data_consulta / 86400, SUM(preco_centavos), COUNT(*)
+        FROM observacoes_antigas
+        GROUP BY id_jogo_monitorado, id_item, data_consulta / 86400
+    ''')
+    conn.execute('''
+        INSERT INTO estatisticas_itens
+            (id_jogo_monitorado, id_item, menor_preco_centavos, data_menor_preco, id_loja_menor_preco,
+             preco_atual_centavos, id_loja_atual, data_atual, observacoes)
+        SELECT m.id_jogo_monitorado, m.id_item, m.preco_centavos, m.data_consulta, m.id_loja,
+               e.preco_centavos, e.id_loja, e.visto_ate, m.observacoes
+        FROM (
+            SELECT *, COUNT(*) OVER janela AS observacoes,
+                   ROW_NUMBER() OVER (janela ORDER BY preco_centavos, data_consulta) AS posicao
+            FROM observacoes_antigas
+            WINDOW janela AS (PARTITION BY id_jogo_monitorado, id_item)
+        ) m
+        JOIN estado_atual_precos e ON e.id_jogo_monitorado = m.id_jogo_monitorado AND e.id_item = m.id_item
+        WHERE m.posicao = 1
+    ''')
+
+    conn.execute('''
+        CREATE TEMP TABLE melhores_por_consulta AS
+        SELECT id_jogo_monitorado, data_consulta, id_item, id_loja, preco_centavos
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY id_jogo_monitorado, data_consulta ORDER BY preco_centavos) AS posicao
+            FROM observacoes_antigas
+        )
+        WHERE posicao = 1
+    ''')
+    conn.execute('''
+        INSERT INTO precos_diarios_jogos (id_jogo_monitorado, dia, soma_centavos, observacoes)
+        SELECT id_jogo_monitorado, data_consulta / 86400, SUM(preco_centavos), COUNT(*)
+        FROM melhores_por_consulta
+        GROUP BY id_jogo_monitorado, data_consulta / 86400
+    ''')
+    conn.execute('''
+        INSERT INTO estatisticas_jogos
+            (id_jogo_monitorado, menor_preco_centavos, data_menor_preco, id_item_menor_preco, id_loja_menor_preco,
+             preco_atual_centavos, id_item_atual, id_loja_atual, data_atual, observacoes)
+        SELECT menor.id_jogo_monitorado, menor.preco_centavos, menor.data_consulta, menor.id_item, menor.id_loja,
+               atual.preco_centavos, atual.id_item, atual.id_loja, atual.data_consulta, menor.observacoes
+        FROM (
+            SELECT *, COUNT(*) OVER janela AS observacoes,
+                   ROW_NUMBER() OVER (janela ORDER BY preco_centavos, data_consulta) AS posicao
+            FROM melhores_por_consulta
+            WINDOW janela AS (PARTITION BY id_jogo_monitorado)
+        ) menor
+        JOIN (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY id_jogo_monitorado ORDER BY data_consulta DESC) AS recencia
+            FROM melhores_por_consulta
+        ) atual ON atual.id_jogo_monitorado = menor.id_jogo_monitorado AND atual.recencia = 1
+        WHERE menor.posicao = 1
+    ''')
+    conn.execute("DROP TABLE temp.observacoes_antigas")
+    conn.execute("DROP TABLE temp.melhores_por_consulta")
+    return False
+
+
+def _migrar_para_v5(conn):
+    """Regras de alerta por jogo monitorado e registro dos alertas já disparados."""
+    conn.execute('''
+        CREATE TABLE regras_alerta (
+            id INTEGER PRIMARY KEY,
+            id_jogo_monitorado INTEGER NOT NULL REFERENCES jogos_monitorados (id),
+            tipo TEXT NOT NULL CHECK (tipo IN ('preco_alvo', 'abaixo_da_media', 'menor_historico')),
+            valor INTEGER,
+            ativa INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_regras_alerta_jogo ON regras_alerta (id_jogo_monitorado)")
+    # valor: centavos em 'preco_alvo', porcentagem em 'abaixo_da_media', vazio em 'menor_historico'
+    conn.execute('''
+        CREATE TABLE alertas_disparados (
+            id_regra INTEGER NOT NULL REFERENCES regras_alerta (id),
+            id_itad TEXT NOT NULL,
+            preco_centavos INTEGER NOT NULL,
+            data_alerta INTEGER NOT NULL,
+            PRIMARY KEY (id_regra, id_itad)
+        ) WITHOUT ROWID
+    ''')
+    return False
+
+
+def _migrar_para_v6(conn):
+    """Nome normalizado dos jogos monitorados (não é UNIQUE: bancos antigos podem já ter duplicados)."""
+    conn.execute("ALTER TABLE jogos_monitorados ADD COLUMN nome_normalizado TEXT")
+    conn.executemany("UPDATE jogos_monitorados SET nome_normalizado = ? WHERE id = ?", [
+        (normalizacao.normalizar_nome_jogo(nome), id_jogo)
+        for id_jogo, nome in conn.execute("SELECT id, nome FROM jogos_monitorados").fetchall()])
+    conn.execute("CREATE INDEX idx_jogos_nome_normalizado ON jogos_monitorados (nome_normalizado)")
+    return False
+
+
+def _migrar_para_v7(conn):
+    """Catálogo com o resultado da última busca (games/search/v1) de cada jogo monitorado."""
+    # resultado: JSON com a lista [{"id": ..., "title": ...}] na ordem devolvida pela API
+    conn.execute('''
+        CREATE TABLE catalogo_busca (
+            id_jogo_monitorado INTEGER PRIMARY KEY REFERENCES jogos_monitorados (id),
+            resultado TEXT NOT NULL,
+            buscado_em INTEGER NOT NULL,
+            expira_em INTEGER NOT NULL
+        )
+    ''')
+    return False
+
+
+def _migrar_para_v8(conn):
+    """Cache de resultados do finder_V01, independente do histórico."""
+    # resultado: JSON com as ofertas já prontas para exibir
+    conn.execute('''
+        CREATE TABLE cache_resultados (
+            termo TEXT NOT NULL,
+            pais TEXT NOT NULL,
+            resultado TEXT NOT NULL,
+            criado_em INTEGER NOT NULL,
+            expira_em INTEGER NOT NULL,
+            PRIMARY KEY (termo, pais)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX idx_cache_resultados_expira ON cache_resultados (expira_em)")
+    return False
+
+
+def _migrar_para_v9(conn):
+    """Preços por país: o melhor preço atual de cada item em cada país consultado e a linha do tempo dele.
+
+    historico_por_pais só guarda mudanças (visto_ate, como o historico_precos) e tem a região na
+    chave; precos_por_pais aponta para a linha atual e consultas_por_pais registra quando cada país
+    foi consultado para cada jogo (uma linha só é estendida se estava na consulta anterior). As estatísticas e os alertas continuam sendo
+    os do país principal, na moeda dele.
+    """
+    conn.execute('''
+        CREATE TABLE historico_por_pais (
+            id INTEGER PRIMARY KEY,
+            id_jogo_monitorado INTEGER NOT NULL REFERENCES jogos_monitorados (id),
+            id_item INTEGER NOT NULL REFERENCES itens (id),
+            pais TEXT NOT NULL,
+            id_loja INTEGER NOT NULL REFERENCES lojas (id),
+            id_link INTEGER REFERENCES links (id),
+            preco_centavos INTEGER NOT NULL,
+            moeda TEXT,
+            validade_oferta INTEGER,
+            data_consulta INTEGER NOT NULL,
+            visto_ate INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE consultas_por_pais (
+            id_jogo_monitorado INTEGER NOT NULL REFERENCES jogos_monitorados (id),
+            pais TEXT NOT NULL,
+            data_consulta INTEGER NOT NULL,
+            PRIMARY KEY (id_jogo_monitorado, pais, data_consulta)
+        ) WITHOUT ROWID
+    ''')
+    # Linha do tempo de um jogo em um país (e a de um item, pelo começo do índice)
+    conn.execute("CREATE INDEX idx_historico_por_pais ON historico_por_pais (id_jogo_monitorado, pais, id_item, data_consulta)")
+    conn.execute('''
+        CREATE TABLE precos_por_pais (
+            id_jogo_monitorado INTEGER NOT NULL REFERENCES jogos_monitorados (id),
+            id_item INTEGER NOT NULL REFERENCES itens (id),
+            pais TEXT NOT NULL,
+            id_loja INTEGER NOT NULL REFERENCES lojas (id),
+            id_link INTEGER REFERENCES links (id),
+            preco_centavos INTEGER NOT NULL,
+            moeda TEXT,
+            validade_oferta INTEGER,
+            data_consulta INTEGER NOT NULL,
+            id_historico INTEGER REFERENCES historico_por_pais (id),
+            PRIMARY KEY (id_jogo_monitorado, id_item, pais)
+        ) WITHOUT ROWID
+    ''')
+    return False
+
+
+# Lista ordenada de (versão, função). Cada função recebe a conexão já dentro de uma transação
+# e retorna True se reescreveu dados (nesse caso o arquivo é compactado com VACUUM no final).
+MIGRACOES = [
+    (1, _migrar_para_v1),
+    (2, _migrar_para_v2),
+    (3, _migrar_para_v3),
+    (4, _migrar_para_v4),
+    (5, _migrar_para_v5),
+    (6, _migrar_para_v6),
+    (7, _migrar_para_v7),
+    (8, _migrar_para_v8),
+    (9, _migrar_para_v9),
+]
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+
+def versao_do_banco(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrar(conn):
+    """Aplica, em ordem, as migrações ainda não aplicadas e carimba a versão no PRAGMA user_version.
+
+    Cada migração roda em uma única transação (tudo ou nada). Retorna a lista de versões aplicadas.
+    """
+    versao = versao_do_banco(conn)
+    pendentes = [(v, migracao) for v, migracao in MIGRACOES if v > versao]
+    if not pendentes:
+        return []
+
+    aplicadas = []
+    reescreveu_dados = False
+    nivel_isolamento = conn.isolation_level
+    conn.isolation_level = None  # Controle manual das transações (DDL + DML juntos)
+    try:
+        for v, migracao in pendentes:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Outra conexão pode ter migrado enquanto esperávamos o lock
+                if versao_do_banco(conn) >= v:
+                    conn.execute("COMMIT")
+                    continue
+                reescreveu_dados = bool(migracao(conn)) or reescreveu_dados
+                conn.execute(f"PRAGMA user_version = {v}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            aplicadas.append(v)
+        conn.execute("ANALYZE")
+        if reescreveu_dados:
+            conn.execute("VACUUM")
+    finally:
+        conn.isolation_level = nivel_isolamento
+    return aplicadas
@@ -0,0 +1,112 @@
+# normalizacao.py
+# Normalização de nomes de jogos e índice de trigramas para busca aproximada local (sem rede).
+
+import re
+import unicodedata
+from collections import Counter
+
+# Caracteres que somem (juntam as partes: "Half-Life" -> "halflife", "S.T.A.L.K.E.R." -> "stalker")
+_REMOVER = ".®™©:-–—'’`´"
+# Pontuação que vira espaço ("Batman: Arkham/Knight" -> "batman arkham knight")
+_ESPACO = ",;!?&/\\|()[]{}<>\"+*#@$%^=~_"
+_TABELA = str.maketrans(_ESPACO, " " * len(_ESPACO), _REMOVER)
+# Tirados antes da NFKD, que transformaria "™" em "TM"
+_SIMBOLOS = str.maketrans("", "", "®™©")
+
+# Algarismos romanos de 1 a 39 ("iv" -> "4"). Parar em 39 evita palavras comuns que também são
+# numerais válidos ("mix", "liv").
+_ROMANO = re.compile(r"(x{0,3})(ix|iv|v?i{0,3})")
+_VALORES = {'i': 1, 'v': 5, 'x': 10}
+# "i" e "x" sozinhos quase nunca são número de sequência ("I Am Bread", "Mega Man X")
+_ROMANOS_AMBIGUOS = {'i', 'x'}
+# Onde termina o título e começa um subtítulo: "Civilization VI: Gathering Storm", "Diablo IV - Expansão"
+_SEPARADOR_SUBTITULO = re.compile(r":|\s-\s|[–—(\[]")
+
+
+def _numero_de_sequencia(palavra):
+    """Converte `palavra` de numeral romano (II a XXXIX) para arábico; qualquer outra palavra volta igual."""
+    if palavra in _ROMANOS_AMBIGUOS or not palavra or not _ROMANO.fullmatch(palavra):
+        return palavra
+    total = 0
+    for atual, seguinte in zip(palavra, palavra[1:] + ' '):
+        valor = _VALORES[atual]
+        total += -valor if seguinte != ' ' and _VALORES[seguinte] > valor else valor
+    return str(total)
+
+
+def normalizar_nome_jogo(nome: str) -> str:
+    """Limpa e padroniza o nome de um jogo para busca, cache e detecção de duplicados.
+
+    Remove acentos (NFKD), ignora maiúsculas/minúsculas (casefold), tira ou troca a pontuação por
+    espaço em uma única passada (str.translate) e junta os espaços repetidos. Numerais romanos só
+    são convertidos na posição de número de sequência: a última palavra do título ou a que vem logo
+    antes de um subtítulo ("Diablo IV", "Civilization VI: Gathering Storm"), de II em diante.
+
+    O resultado é uma chave para comparar nomes (cache, duplicados, sugestões), não um texto para
+    mandar à busca da ITAD.
+    """
+    nome = unicodedata.normalize('NFKD', nome.translate(_SIMBOLOS))
+    nome = "".join(c for c in nome if not unicodedata.combining(c)).casefold()
+    palavras = []
+    for trecho in _SEPARADOR_SUBTITULO.split(nome):
+        palavras_trecho = trecho.translate(_TABELA).split()
+        if palavras_trecho:
+            palavras_trecho[-1] = _numero_de_sequencia(palavras_trecho[-1])
+        palavras.extend(palavras_trecho)
+    return " ".join(palavras)
+
+
+def trigramas(texto_normalizado):
+    """Trigramas do texto com bordas ("  d", " di", "dia", ...), para favorecer o começo das palavras."""
+    texto = f"  {texto_normalizado} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceTrigramas:
+    """Índice invertido trigrama -> ids, em memória.
+
+    `exato()` acha um nome com a mesma forma normalizada (um acesso a dict); `buscar()` ordena os
+    candidatos que compartilham trigramas pela semelhança (coeficiente de Dice).
+    """
+
+    def __init__(self):
+        self._nomes = {}       # id -> (nome original, nome normalizado, quantidade de trigramas)
+        self._por_chave = {}   # nome normalizado -> id
+        self._postagens = {}   # trigrama -> set de ids
+
+    def __len__(self):
+        return len(self._nomes)
+
+    def adicionar(self, id_, nome):
+        chave = normalizar_nome_jogo(nome)
+        if not chave or id_ in self._nomes:
+            return
+        tris = trigramas(chave)
+        self._nomes[id_] = (nome, chave, len(tris))
+        self._por_chave.setdefault(chave, id_)
+        for tri in tris:
+            self._postagens.setdefault(tri, set()).add(id_)
+
+    def exato(self, nome):
+        """Id do nome já indexado com a mesma forma normalizada, ou None."""
+        return self._por_chave.get(normalizar_nome_jogo(nome))
+
+    def buscar(self, consulta, limite=10, semelhanca_minima=0.3):
+        """Retorna até `limite` tuplas (id, nome original, semelhança), das mais parecidas para as menos."""
+        chave = normalizar_nome_jogo(consulta)
+        if not chave:
+            return []
+        tris = trigramas(chave)
+        em_comum = Counter()
+        for tri in tris:
+            em_comum.update(self._postagens.get(tri, ()))
+        resultados = []
+        for id_, comum in em_comum.items():
+            nome, chave_indexada, total = self._nomes[id_]
+            semelhanca = 2 * comum / (len(tris) + total)
+            if chave_indexada.startswith(chave):
+                semelhanca = max(semelhanca, 0.99)  # Digitando o começo do nome: sugere logo
+            if semelhanca >= semelhanca_minima:
+                resultados.append((id_, nome, semelhanca))
+        resultados.sort(key=lambda r: (-r[2], len(r[1])))
+        return resultados[:limite]
@@ -0,0 +1,226 @@
+# test_historico.py
+# Migrações a partir dos dois esquemas antigos e armazenamento do histórico nos dois modos:
+# consultar_historico, a paginação por chave e as estatísticas têm de dar o mesmo resultado
+# gravando todas as consultas (completo) ou só as mudanças (mudancas).
+#
+# Rodar com: python -m pytest -q
+
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import backend
+import banco
+import historico
+import migracoes
+
+JOGO = "Jogo Antigo"
+# Histórico antigo: (item, preço, loja, link, validade, data da consulta)
+LINHAS_ANTIGAS = [
+    ("Jogo Antigo", 49.90, "Steam", "https://loja/a", "N/A", "2024-03-01 10:00:00"),
+    ("Jogo Antigo - DLC", 20.00, "GOG", "https://loja/b", "15/03/2024", "2024-03-01 10:00:00"),
+    ("Jogo Antigo", 49.90, "Steam", "https://loja/a", "N/A", "2024-03-02 10:00:00"),
+    ("Jogo Antigo - DLC", 15.00, "GOG", "https://loja/b", "15/03/2024", "2024-03-02 10:00:00"),
+    ("Jogo Antigo", 39.90, "Steam", "https://loja/a", "N/A", "2024-03-03 10:00:00"),
+]
+
+
+def _epoch(texto):
+    return int(datetime.strptime(texto, backend.FORMATO_DATA_CONSULTA).timestamp())
+
+
+IDS_ITAD = {"Jogo Antigo": "id-jogo", "Jogo Antigo - DLC": "id-dlc"}
+IDS_LOJAS = {"Steam": 61, "GOG": 35}
+
+
+def _oferta(nome_item, preco_centavos, loja, link, validade=None):
+    return {'id_itad': IDS_ITAD[nome_item], 'nome_item': nome_item, 'id_loja_itad': IDS_LOJAS[loja], 'loja': loja,
+            'link': link, 'preco_centavos': preco_centavos, 'validade_oferta': validade}
+
+
+# Consultas depois da migração: preço parado (estende a linha), item que some e volta com o mesmo
+# preço (não pode estender por cima do buraco) e preço que muda
+CONSULTAS_NOVAS = [
+    ("2024-03-04 10:00:00", [_oferta("Jogo Antigo", 3990, "Steam", "https://loja/a"),
+                             _oferta("Jogo Antigo - DLC", 1500, "GOG", "https://loja/b")]),
+    ("2024-03-05 10:00:00", [_oferta("Jogo Antigo", 3990, "Steam", "https://loja/a"),
+                             _oferta("Jogo Antigo - DLC", 1500, "GOG", "https://loja/b")]),
+    ("2024-03-06 10:00:00", [_oferta("Jogo Antigo", 3990, "Steam", "https://loja/a")]),
+    ("2024-03-07 10:00:00", [_oferta("Jogo Antigo", 3990, "Steam", "https://loja/a"),
+                             _oferta("Jogo Antigo - DLC", 1500, "GOG", "https://loja/b")]),
+    ("2024-03-08 10:00:00", [_oferta("Jogo Antigo", 2990, "Steam", "https://loja/a"),
+                             _oferta("Jogo Antigo - DLC", 1500, "GOG", "https://loja/b")]),
+    ("2024-03-09 10:00:00", [_oferta("Jogo Antigo", 2990, "Steam", "https://loja/a")]),
+]
+
+
+def _criar_banco_backend(caminho):
+    """Banco do backend/GUI antes das migrações (jogos_monitorados + historico_precos com texto)."""
+    conn = sqlite3.connect(caminho)
+    conn.execute("CREATE TABLE jogos_monitorados (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT NOT NULL UNIQUE)")
+    conn.execute('''
+        CREATE TABLE historico_precos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_jogo_monitorado INTEGER,
+            nome_item TEXT NOT NULL,
+            preco REAL NOT NULL,
+            loja TEXT NOT NULL,
+            link TEXT,
+            validade_oferta TEXT,
+            data_consulta TEXT NOT NULL,
+            FOREIGN KEY (id_jogo_monitorado) REFERENCES jogos_monitorados (id)
+        )
+    ''')
+    conn.execute("INSERT INTO jogos_monitorados (nome) VALUES (?)", (JOGO,))
+    conn.executemany("INSERT INTO historico_precos (id_jogo_monitorado, nome_item, preco, loja, link, validade_oferta, "
+                     "data_consulta) VALUES (1, ?, ?, ?, ?, ?, ?)", LINHAS_ANTIGAS)
+    conn.commit()
+    conn.close()
+
+
+def _criar_banco_finder_v01(caminho):
+    """Banco do finder_V01 (uma tabela só, com o termo buscado em cada linha)."""
+    conn = sqlite3.connect(caminho)
+    conn.execute('''
+        CREATE TABLE historico_precos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            termo_busca TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            preco REAL NOT NULL,
+            loja TEXT NOT NULL,
+            link TEXT,
+            validade_oferta TEXT,
+            data_consulta TEXT NOT NULL
+        )
+    ''')
+    conn.executemany("INSERT INTO historico_precos (termo_busca, nome, preco, loja, link, validade_oferta, data_consulta) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", [(JOGO,) + linha for linha in LINHAS_ANTIGAS])
+    conn.commit()
+    conn.close()
+
+
+ESQUEMAS_ANTIGOS = {'backend': _criar_banco_backend, 'finder_V01': _criar_banco_finder_v01}
+
+
+@pytest.fixture(autouse=True)
+def _fechar_conexoes():
+    yield
+    banco.fechar_todas()
+
+
+def _migrar_e_gravar(monkeypatch, caminho, esquema, modo):
+    """Cria o banco antigo, migra, grava CONSULTAS_NOVAS no `modo` e deixa backend.DB_FILE apontando para ele."""
+    ESQUEMAS_ANTIGOS[esquema](str(caminho))
+    monkeypatch.setattr(backend, 'DB_FILE', str(caminho))
+    conn = banco.conectar(backend.DB_FILE)
+    assert migracoes.migrar(conn) == [v for v, _ in migracoes.MIGRACOES]
+    id_jogo = conn.execute("SELECT id FROM jogos_monitorados WHERE nome = ?", (JOGO,)).fetchone()[0]
+    migrado = backend.consultar_historico(id_jogo)
+    for data_consulta, ofertas in CONSULTAS_NOVAS:
+        historico.salvar_observacoes(conn, id_jogo, _epoch(data_consulta), ofertas, modo)
+    return conn, id_jogo, migrado
+
+
+def _esperado_antigo():
+    return sorted([data, item, f"R${preco:.2f}", loja, validade, link]
+                  for item, preco, loja, link, validade, data in LINHAS_ANTIGAS)
+
+
+def _esperado_completo():
+    novas = [[data, o['nome_item'], f"R${o['preco_centavos'] / 100:.2f}", o['loja'], "N/A", o['link']]
+             for data, ofertas in CONSULTAS_NOVAS for o in ofertas]
+    return sorted(_esperado_antigo() + novas)
+
+
+@pytest.mark.parametrize('esquema', sorted(ESQUEMAS_ANTIGOS))
+def test_migracao_preserva_historico_antigo(tmp_path, monkeypatch, esquema):
+    ESQUEMAS_ANTIGOS[esquema](str(tmp_path / "antigo.db"))
+    monkeypatch.setattr(backend, 'DB_FILE', str(tmp_path / "antigo.db"))
+    conn = banco.conectar(backend.DB_FILE)
+    migracoes.migrar(conn)
+    assert migracoes.versao_do_banco(conn) == migracoes.VERSAO_ATUAL
+    assert migracoes.migrar(conn) == []
+    id_jogo, monitorado = conn.execute("SELECT id, monitorado FROM jogos_monitorados WHERE nome = ?", (JOGO,)).fetchone()
+    # Termos do finder_V01 ficam fora da lista de monitoramento; jogos do backend continuam nela
+    assert monitorado == (esquema == 'backend')
+    assert sorted(backend.consultar_historico(id_jogo)) == _esperado_antigo()
+    assert conn.execute("SELECT COUNT(*) FROM consultas WHERE id_jogo_monitorado = ?", (id_jogo,)).fetchone()[0] == 3
+
+
+@pytest.mark.parametrize('esquema', sorted(ESQUEMAS_ANTIGOS))
+def test_mesmo_historico_nos_dois_modos(tmp_path, monkeypatch, esquema):
+    resultados = {}
+    for modo in (historico.MODO_COMPLETO, historico.MODO_MUDANCAS):
+        conn, id_jogo, migrado = _migrar_e_gravar(monkeypatch, tmp_path / f"{modo}.db", esquema, modo)
+        assert sorted(migrado) == _esperado_antigo()
+        linhas = conn.execute("SELECT COUNT(*) FROM historico_precos WHERE id_jogo_monitorado = ?", (id_jogo,)).fetchone()[0]
+        resultados[modo] = (backend.consultar_historico(id_jogo), linhas)
+
+    completo, linhas_completo = resultados[historico.MODO_COMPLETO]
+    mudancas, linhas_mudancas = resultados[historico.MODO_MUDANCAS]
+    assert sorted(completo) == sorted(mudancas) == _esperado_completo()
+    # Mais recentes primeiro nos dois modos
+    assert [linha[0] for linha in completo] == [linha[0] for linha in mudancas]
+    # Só mudanças: 39,90 de 03/03 a 07/03 e o DLC de 02/03 a 05/03 em uma linha cada; o DLC volta
+    # em 07/03 (depois do buraco de 06/03) em uma linha nova, estendida até 08/03
+    assert linhas_completo == len(LINHAS_ANTIGAS) + sum(len(ofertas) for _, ofertas in CONSULTAS_NOVAS)
+    assert linhas_mudancas == len(LINHAS_ANTIGAS) + 3
+
+
+def test_item_que_some_nao_estende_por_cima_do_buraco(tmp_path, monkeypatch):
+    conn, id_jogo, _ = _migrar_e_gravar(monkeypatch, tmp_path / "mudancas.db", 'backend', historico.MODO_MUDANCAS)
+    datas_dlc = [linha[0] for linha in backend.consultar_historico(id_jogo) if linha[1] == "Jogo Antigo - DLC"]
+    assert "2024-03-06 10:00:00" not in datas_dlc
+    assert "2024-03-07 10:00:00" in datas_dlc
+
+
+@pytest.mark.parametrize('esquema', sorted(ESQUEMAS_ANTIGOS))
+def test_estatisticas_incrementais_iguais_nos_dois_modos(tmp_path, monkeypatch, esquema):
+    agora = _epoch(CONSULTAS_NOVAS[-1][0])
+    estatisticas = {}
+    for modo in (historico.MODO_COMPLETO, historico.MODO_MUDANCAS):
+        _, id_jogo, _ = _migrar_e_gravar(monkeypatch, tmp_path / f"{modo}.db", esquema, modo)
+        estatisticas[modo] = backend.obter_estatisticas(id_jogo, agora=agora)
+
+    assert estatisticas[historico.MODO_COMPLETO] == estatisticas[historico.MODO_MUDANCAS]
+    jogo = estatisticas[historico.MODO_COMPLETO]['jogo']
+    assert jogo['menor_preco'] == "R$15.00"
+    assert jogo['preco_atual'] == "R$29.90"
+    assert jogo['data_preco_atual'] == CONSULTAS_NOVAS[-1][0]
+    # Uma observação por consulta do jogo (o melhor preço de cada uma)
+    assert jogo['observacoes'] == 3 + len(CONSULTAS_NOVAS)
+    itens = {item['nome_item']: item for item in estatisticas[historico.MODO_COMPLETO]['itens']}
+    assert itens["Jogo Antigo"]['menor_preco'] == "R$29.90"
+    assert itens["Jogo Antigo"]['observacoes'] == 3 + len(CONSULTAS_NOVAS)
+    assert itens["Jogo Antigo - DLC"]['observacoes'] == 2 + 4
+
+
+@pytest.mark.parametrize('modo', [historico.MODO_COMPLETO, historico.MODO_MUDANCAS])
+@pytest.mark.parametrize('mais_recentes_primeiro', [True, False])
+def test_paginacao_percorre_o_historico_inteiro(tmp_path, monkeypatch, modo, mais_recentes_primeiro):
+    _, id_jogo, _ = _migrar_e_gravar(monkeypatch, tmp_path / f"{modo}.db", 'backend', modo)
+    paginas, cursor = [], None
+    while True:
+        linhas, cursor = backend.consultar_historico_pagina(id_jogo, tamanho=3, depois_de=cursor,
+                                                            mais_recentes_primeiro=mais_recentes_primeiro)
+        paginas.append(linhas)
+        if cursor is None:
+            break
+
+    todas = [linha for pagina in paginas for linha in pagina]
+    assert all(len(pagina) == 3 for pagina in paginas[:-1])
+    assert sorted(todas) == _esperado_completo()
+    # Ordem por data (no sentido pedido) e, dentro da mesma consulta, do menor preço para o maior
+    chaves = [(linha[0], float(linha[2][2:])) for linha in todas]
+    if mais_recentes_primeiro:
+        assert chaves == sorted(chaves, key=lambda chave: (-_epoch(chave[0]), chave[1]))
+    else:
+        assert chaves == sorted(chaves)
+
+
+def test_paginacao_com_filtros(tmp_path, monkeypatch):
+    _, id_jogo, _ = _migrar_e_gravar(monkeypatch, tmp_path / "mudancas.db", 'finder_V01', historico.MODO_MUDANCAS)
+    linhas, cursor = backend.consultar_historico_pagina(id_jogo, tamanho=100, loja="GOG", texto_item="dlc")
+    assert cursor is None
+    assert sorted(linhas) == [linha for linha in _esperado_completo() if linha[3] == "GOG"]